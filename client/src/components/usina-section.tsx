@@ -1,6 +1,6 @@
 import { useState } from "react";
 import { useMutation } from "@tanstack/react-query";
-import { ChevronDown, ChevronUp, Zap, CheckCircle, Clock, XCircle, Download, Loader2 } from "lucide-react";
+import { ChevronDown, ChevronUp, Zap, CheckCircle, Clock, XCircle, Download, Loader2, Printer } from "lucide-react";
 import { Button } from "@/components/ui/button";
 import { Card } from "@/components/ui/card";
 import { Badge } from "@/components/ui/badge";
@@ -8,7 +8,7 @@ import { FaturaStatusCard } from "./fatura-status-card";
 import { cn } from "@/lib/utils";
 import { formatUCNova } from "@shared/uc-utils";
 import { useToast } from "@/hooks/use-toast";
-import { apiRequest, authenticatedFetch } from "@/lib/queryClient";
+import { apiRequest, authenticatedFetch, addTokenToUrl } from "@/lib/queryClient";
 import type { Usina, Cliente, Fatura } from "@shared/schema";
 
 interface UsinaSectionProps {
@@ -91,6 +91,52 @@ export function UsinaSection({ usina, faturas, clientes, onRefresh, onEditFatura
     },
   });
 
+  // Mutation to generate one PDF with all faturas (for printing)
+  const downloadPdfMutation = useMutation({
+    mutationFn: async () => {
+      if (!mesReferencia) {
+        throw new Error("Nenhuma fatura encontrada para imprimir");
+      }
+
+      const response = await authenticatedFetch('/api/faturas/download-usina-pdf', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+          usinaId: usina.id,
+          mesReferencia: mesReferencia,
+        }),
+      });
+
+      if (!response.ok) {
+        const error = await response.json();
+        throw new Error(error.message || 'Erro ao gerar PDF');
+      }
+      return response.json();
+    },
+    onSuccess: (data) => {
+      // Download via rota autenticada — window.location.href funciona no iOS Safari
+      if (data.pdfUrl) {
+        const filename = data.pdfUrl.split("/").pop();
+        window.location.href = addTokenToUrl(`/api/faturas/generated/${filename}`);
+      }
+      toast({
+        title: "PDF gerado com sucesso!",
+        description: data.erros
+          ? `${data.faturas} faturas em um único PDF (${data.erros} com erro).`
+          : `${data.faturas} faturas em um único PDF.`,
+      });
+    },
+    onError: (error: Error) => {
+      toast({
+        title: "Erro ao gerar PDF",
+        description: error.message,
+        variant: "destructive",
+      });
+    },
+  });
+
   // Get unique clients for this usina with their faturas
   const clientesData = clientes
     .filter(c => c.usinaId === usina.id)
@@ -203,6 +249,31 @@ export function UsinaSection({ usina, faturas, clientes, onRefresh, onEditFatura
               </Button>
             )}
 
+            {/* Single PDF with all faturas, for printing */}
+            {faturasComDesconto > 0 && (
+              <Button
+                variant="outline"
+                size="sm"
+                onClick={(e) => {
+                  e.stopPropagation();
+                  downloadPdfMutation.mutate();
+                }}
+                disabled={downloadPdfMutation.isPending}
+              >
+                {downloadPdfMutation.isPending ? (
+                  <>
+                    <Loader2 className="h-4 w-4 mr-2 animate-spin" />
+                    Gerando PDF...
+                  </>
+                ) : (
+                  <>
+                    <Printer className="h-4 w-4 mr-2" />
+                    PDF Único
+                  </>
+                )}
+              </Button>
+            )}
+
             <Button variant="ghost" size="icon">
               {isExpanded ? (
                 <ChevronUp className="h-5 w-5" />
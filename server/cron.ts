@@ -12,6 +12,10 @@ export function setupCronJobs() {
     console.log("[Cron] Starting cleanup of old generated invoices...");
     
     try {
+      const now = Date.now();
+      const thirtyDaysInMs = 30 * 24 * 60 * 60 * 1000;
+      let deletedCount = 0;
+
       // Deletes files in uploads/faturas (nested) older than 30 days
       // This is for utility bills uploaded by users
       const uploadsDir = path.join(process.cwd(), "uploads", "faturas");
@@ -84,6 +88,42 @@ export function setupCronJobs() {
         // Ignore if directory missing
       }
 
+      // Índice do cache de PDFs gerados (render_resources.py): cada reuso renova
+      // o mtime da entrada, então só saem as sem uso há mais de 30 dias. Entradas
+      // de PDFs já apagados acima são inofensivas (o PDF é gerado de novo).
+      const renderIndexDir = path.join(process.cwd(), "uploads", ".cache", "render");
+      let renderIndexDeleted = 0;
+
+      async function deleteOldIndexEntries(dirPath: string) {
+        let entries;
+        try {
+          entries = await fs.readdir(dirPath, { withFileTypes: true });
+        } catch {
+          return; // Skip if directory doesn't exist
+        }
+        for (const entry of entries) {
+          const fullPath = path.join(dirPath, entry.name);
+          try {
+            if (entry.isDirectory()) {
+              await deleteOldIndexEntries(fullPath);
+            } else if (entry.isFile()) {
+              const stats = await fs.stat(fullPath);
+              if (now - stats.mtimeMs > thirtyDaysInMs) {
+                await fs.unlink(fullPath);
+                renderIndexDeleted++;
+              }
+            }
+          } catch (err) {
+            console.error(`[Cron] Error checking render index entry ${fullPath}:`, err);
+          }
+        }
+      }
+
+      await deleteOldIndexEntries(renderIndexDir);
+      if (renderIndexDeleted > 0) {
+        console.log(`[Cron] Removed ${renderIndexDeleted} unused render cache index entries.`);
+      }
+
       if (deletedCount > 0) {
         console.log(`[Cron] Cleanup finished. Deleted ${deletedCount} old utility bills.`);
       } else {
@@ -15,6 +15,11 @@ import fsPromises from "fs/promises";
 import * as AuthService from "./services/auth-service";
 import { requireAuth, requireRole, requireAdmin, requireAuthOrQuery } from "./middleware/auth";
 import { normalizeUC, ucMatches } from "@shared/uc-utils";
+import {
+  EXTRACT_TIMINGS,
+  EXTRACT_WORKER_ENABLED,
+  extractWithWorker,
+} from "./services/extraction-worker";
 
 // Configure multer for PDF uploads
 const uploadDir = path.join(process.cwd(), "uploads");
@@ -50,16 +55,32 @@ async function extractPdfData(
   priceKwh: number,
   discount: number
 ): Promise<any> {
+  // Worker residente: evita subir um python3 novo a cada upload
+  const result = EXTRACT_WORKER_ENABLED
+    ? await extractWithWorker(pdfPath, priceKwh, discount)
+    : await spawnExtraction(pdfPath, priceKwh, discount);
+
+  // EXTRACT_TIMINGS=1: registra o tempo por etapa junto da requisição
+  if (result && result.timings) {
+    console.log(`[Extração] ${path.basename(pdfPath)} timings=${JSON.stringify(result.timings)}`);
+    delete result.timings;
+  }
+  return result;
+}
+
+function spawnExtraction(pdfPath: string, priceKwh: number, discount: number): Promise<any> {
   return new Promise((resolve, reject) => {
     const scriptPath = path.join(process.cwd(), "server/scripts/extract_fatura.py");
-    const pythonProcess = spawn("python3", [
+    const args = [
       scriptPath,
       pdfPath,
       "--price-kwh",
       priceKwh.toString(),
       "--discount",
       discount.toString(),
-    ]);
+    ];
+    if (EXTRACT_TIMINGS) args.push("--timings");
+    const pythonProcess = spawn("python3", args);
 
     let stdout = "";
     let stderr = "";
@@ -91,6 +112,185 @@ async function extractPdfData(
   });
 }
 
+// Varredura preço × desconto da Simulação: lê o PDF uma vez e devolve a grade inteira
+function spawnPricingSweep(pdfPath: string, precos: string, descontos: string): Promise<any> {
+  return new Promise((resolve, reject) => {
+    const scriptPath = path.join(process.cwd(), "server/scripts/pricing.py");
+    // Upload do multer vem sem extensão: --pdf diz ao script que é PDF
+    const args = [scriptPath, "--sweep", "--pdf", pdfPath, "--prices", precos, "--discounts", descontos];
+    const pythonProcess = spawn("python3", args);
+
+    let stdout = "";
+    let stderr = "";
+
+    pythonProcess.stdout.on("data", (data) => {
+      stdout += data.toString();
+    });
+
+    pythonProcess.stderr.on("data", (data) => {
+      stderr += data.toString();
+    });
+
+    pythonProcess.on("close", () => {
+      // O script responde JSON também nos erros ({success: false, error})
+      try {
+        resolve(JSON.parse(stdout));
+      } catch (e) {
+        reject(new Error(`Python script error: ${stderr || stdout}`));
+      }
+    });
+
+    pythonProcess.on("error", (err) => {
+      reject(err);
+    });
+  });
+}
+
+interface InvoiceZipProgress {
+  id?: any;
+  success: boolean;
+  filename?: string;
+  cache?: boolean;
+  error?: string;
+  concluidos: number;
+  total: number;
+}
+
+// Gera o ZIP das faturas num único processo (generate_pdf.py --zip): cada PDF é
+// renderizado em memória e entra no ZIP sem recompressão (PDF já é comprimido).
+// O ZIP sai pelo stdout direto para a resposta; o progresso, um JSON por item,
+// vem pelo stderr. Se nenhuma fatura for gerada o Python sai com erro sem
+// escrever nada, e a resposta ainda pode ser um 500 em JSON.
+function streamInvoiceZip(
+  items: Array<Record<string, any>>,
+  res: Response,
+  zipFilename: string,
+  onProgress?: (progress: InvoiceZipProgress) => void
+): Promise<void> {
+  return new Promise((resolve, reject) => {
+    const scriptPath = path.join(process.cwd(), "server/scripts/generate_pdf.py");
+    const pythonProcess = spawn("python3", [scriptPath, "--zip", "-", "-"]);
+
+    let partial = "";
+    let stderr = "";
+
+    pythonProcess.stdout.once("data", () => {
+      res.attachment(zipFilename);
+    });
+    pythonProcess.stdout.pipe(res, { end: false });
+
+    pythonProcess.stderr.on("data", (data) => {
+      const lines = (partial + data.toString()).split("\n");
+      partial = lines.pop() || "";
+      for (const line of lines) {
+        if (line.startsWith("{")) {
+          try {
+            onProgress?.(JSON.parse(line));
+            continue;
+          } catch {
+            // não era progresso: cai no stderr
+          }
+        }
+        // Guarda só o final do stderr para a mensagem de erro
+        stderr = (stderr + line + "\n").slice(-4000);
+      }
+    });
+
+    // Download cancelado: não adianta continuar renderizando
+    res.on("close", () => {
+      if (pythonProcess.exitCode === null) pythonProcess.kill();
+    });
+
+    pythonProcess.on("close", (code) => {
+      if (code === 0) {
+        res.end();
+        resolve();
+      } else if (!res.headersSent) {
+        res.status(500).json({ message: "Nenhum PDF foi gerado com sucesso", error: stderr });
+        resolve();
+      } else {
+        // ZIP já começou a sair: corta a conexão para o download não parecer completo
+        res.destroy();
+        reject(new Error(`Python script error (código ${code}): ${stderr}`));
+      }
+    });
+
+    pythonProcess.on("error", (err) => {
+      reject(err);
+    });
+
+    pythonProcess.stdin.end(JSON.stringify(items));
+  });
+}
+
+// Faturas com desconto (apenas clientes pagantes) de uma usina no mês, com o cliente
+async function getFaturasPagantesUsina(usinaId: string, mesReferencia: string) {
+  const allFaturas = await storage.getFaturas();
+  const allClientes = await storage.getClientes();
+  const result: Array<{ fatura: any; cliente: any }> = [];
+  for (const fatura of allFaturas as any[]) {
+    const cliente = (allClientes as any[]).find((c: any) => c.id === fatura.clienteId);
+    if (cliente?.usinaId === usinaId && fatura.mesReferencia === mesReferencia && cliente?.isPagante === true) {
+      result.push({ fatura, cliente });
+    }
+  }
+  return result;
+}
+
+// Item do generate_pdf.py (--batch, --zip, --combined): mesmos campos do modo simples
+function invoicePdfItem(fatura: any, cliente: any): Record<string, any> {
+  return {
+    nomeCliente: cliente.nome,
+    enderecoCliente: cliente.enderecoCompleto || cliente.endereco || "",
+    unidadeConsumidora: cliente.unidadeConsumidora,
+    mesReferencia: fatura.mesReferencia,
+    dataVencimento: fatura.dataVencimento || "",
+    consumoScee: fatura.consumoScee,
+    consumoNaoCompensado: fatura.consumoNaoCompensado,
+    valorTotal: fatura.valorTotal,
+    valorSemDesconto: fatura.valorSemDesconto,
+    valorComDesconto: fatura.valorComDesconto,
+    economia: fatura.economia,
+    contribuicaoIluminacao: fatura.contribuicaoIluminacao,
+    precoKwh: fatura.precoKwh,
+    precoFioB: fatura.precoFioB,
+  };
+}
+
+// Todas as faturas do lote num único PDF (generate_pdf.py --combined)
+function spawnCombinedInvoices(items: Array<Record<string, any>>, outputPath: string): Promise<any> {
+  return new Promise((resolve, reject) => {
+    const scriptPath = path.join(process.cwd(), "server/scripts/generate_pdf.py");
+    const pythonProcess = spawn("python3", [scriptPath, "--combined", "-", outputPath]);
+
+    let stdout = "";
+    let stderr = "";
+
+    pythonProcess.stdout.on("data", (data) => {
+      stdout += data.toString();
+    });
+
+    pythonProcess.stderr.on("data", (data) => {
+      stderr = (stderr + data.toString()).slice(-4000);
+    });
+
+    pythonProcess.on("close", () => {
+      // O script responde JSON também nos erros ({error})
+      try {
+        resolve(JSON.parse(stdout));
+      } catch (e) {
+        reject(new Error(`Python script error: ${stderr || stdout}`));
+      }
+    });
+
+    pythonProcess.on("error", (err) => {
+      reject(err);
+    });
+
+    pythonProcess.stdin.end(JSON.stringify(items));
+  });
+}
+
 // Helper to create audit log
 async function logAction(userId: string, acao: string, entidade: string, entidadeId?: string, detalhes?: any) {
   try {
@@ -1160,6 +1360,53 @@ export async function registerRoutes(httpServer: Server, app: Express): Promise<
     }
   });
 
+  // Simulação em grade: preços × descontos para a mesma fatura numa só chamada.
+  // precos/descontos: lista "0.75,0.80,0.85" ou faixa "inicio:fim:n"
+  app.post("/api/simulacao/sweep", requireAuth, upload.single("file"), async (req: any, res) => {
+    try {
+      if (!req.file) {
+        return res.status(400).json({ message: "PDF file is required" });
+      }
+
+      const axis = /^\s*(\d+(\.\d+)?\s*:\s*\d+(\.\d+)?\s*:\s*\d+|\d+(\.\d+)?(\s*,\s*\d+(\.\d+)?)*)\s*$/;
+      const precos = String(req.body.precos || "0.85");
+      const descontos = String(req.body.descontos || "25");
+      if (!axis.test(precos) || !axis.test(descontos)) {
+        try {
+          fs.unlinkSync(req.file.path);
+        } catch (e) {
+          // Ignore file deletion errors
+        }
+        return res.status(400).json({ message: "precos/descontos inválidos" });
+      }
+
+      let result: any;
+      try {
+        result = await spawnPricingSweep(req.file.path, precos, descontos);
+      } finally {
+        // A simulação não guarda o arquivo
+        try {
+          fs.unlinkSync(req.file.path);
+        } catch (e) {
+          // Ignore file deletion errors
+        }
+      }
+
+      if (!result.success) {
+        return res.status(400).json({
+          message: "Erro ao extrair dados do PDF",
+          error: result.error || result.erros
+        });
+      }
+
+      result.fileName = req.file.originalname;
+      res.json(result);
+    } catch (error: any) {
+      console.error("Error running price sweep for simulation:", error);
+      res.status(500).json({ message: "Erro ao processar PDF", error: error.message });
+    }
+  });
+
   // Serve PDF files for preview (supports nested paths)
   // Uses requireAuthOrQuery to allow token via query string for browser direct access
   app.get("/api/faturas/pdf/*", requireAuthOrQuery, (req, res) => {
@@ -1831,17 +2078,8 @@ export async function registerRoutes(httpServer: Server, app: Express): Promise<
 
       console.log(`[ZIP Download] Iniciando geração de ZIP para usina ${usinaId}, mês ${mesReferencia}`);
 
-      // Buscar todas as faturas da usina para o mês
-      const allFaturas = await storage.getFaturas();
-      const allClientes = await storage.getClientes();
-
-      // Filtrar faturas da usina e mês, apenas clientes pagantes
-      const faturas = allFaturas.filter((f: any) => {
-        const cliente = allClientes.find((c: any) => c.id === f.clienteId);
-        return cliente?.usinaId === usinaId &&
-               f.mesReferencia === mesReferencia &&
-               cliente?.isPagante === true;
-      });
+      // Faturas da usina no mês, apenas clientes pagantes
+      const faturas = await getFaturasPagantesUsina(usinaId, mesReferencia);
 
       if (faturas.length === 0) {
         return res.status(404).json({ message: "Nenhuma fatura com desconto encontrada para esta usina/mês" });
@@ -1849,113 +2087,87 @@ export async function registerRoutes(httpServer: Server, app: Express): Promise<
 
       console.log(`[ZIP Download] Encontradas ${faturas.length} faturas para gerar`);
 
-      const { spawn } = await import("child_process");
-      const archiver = (await import("archiver")).default;
-
       const outputDir = path.join(process.cwd(), "uploads", "faturas_geradas");
       await fsPromises.mkdir(outputDir, { recursive: true });
 
-      // Gerar todos os PDFs (sempre gera sob demanda, não salva no DB)
-      const pdfPromises = faturas.map(async (fatura: any) => {
-        const cliente = allClientes.find((c: any) => c.id === fatura.clienteId);
-        if (!cliente) return null;
-
+      // Monta o lote (sempre gera sob demanda, não salva no DB)
+      const items: Array<Record<string, any>> = [];
+      const filenames = new Map<number, string>();
+      for (const { fatura, cliente } of faturas) {
         const outputFilename = `fatura_${cliente.unidadeConsumidora}_${fatura.mesReferencia.replace("/", "_")}.pdf`;
-        const outputPath = path.join(outputDir, outputFilename);
-
-        console.log(`[ZIP Download] Gerando PDF: ${outputFilename}`);
-
-        const pdfData = {
-          nomeCliente: cliente.nome,
-          enderecoCliente: cliente.enderecoCompleto || cliente.endereco || "",
-          unidadeConsumidora: cliente.unidadeConsumidora,
-          mesReferencia: fatura.mesReferencia,
-          dataVencimento: fatura.dataVencimento || "",
-          consumoScee: fatura.consumoScee,
-          consumoNaoCompensado: fatura.consumoNaoCompensado,
-          valorTotal: fatura.valorTotal,
-          valorSemDesconto: fatura.valorSemDesconto,
-          valorComDesconto: fatura.valorComDesconto,
-          economia: fatura.economia,
-          contribuicaoIluminacao: fatura.contribuicaoIluminacao,
-          precoKwh: fatura.precoKwh,
-          precoFioB: fatura.precoFioB,
-        };
-
-        return new Promise<{ path: string; filename: string } | null>((resolve, reject) => {
-          const pythonProcess = spawn("python3", [
-            path.join(process.cwd(), "server", "scripts", "generate_pdf.py"),
-            JSON.stringify(pdfData),
-            outputPath,
-          ]);
-
-          let stdout = "";
-          let stderr = "";
-
-          pythonProcess.stdout.on("data", (data) => {
-            stdout += data.toString();
-          });
-
-          pythonProcess.stderr.on("data", (data) => {
-            stderr += data.toString();
-          });
-
-          pythonProcess.on("close", async (code) => {
-            if (code !== 0) {
-              console.error(`[ZIP Download] Erro ao gerar PDF para ${cliente.nome}:`, stderr);
-              resolve(null);
-              return;
-            }
-
-            try {
-              const result = JSON.parse(stdout);
-              if (result.success) {
-                // Retorna o path do PDF gerado (não salva no DB)
-                resolve({ path: outputPath, filename: outputFilename });
-              } else {
-                console.error(`[ZIP Download] Erro no resultado: ${result.error}`);
-                resolve(null);
-              }
-            } catch (e) {
-              console.error(`[ZIP Download] Erro ao parsear resultado:`, e);
-              resolve(null);
-            }
-          });
+        filenames.set(items.length, outputFilename);
+        items.push({
+          id: items.length,
+          outputPath: path.join(outputDir, outputFilename),
+          ...invoicePdfItem(fatura, cliente),
         });
+      }
+
+      // Um único processo Python renderiza o lote e escreve o ZIP direto na resposta.
+      // Com outputPath, PDFs que não mudaram vêm do cache de saída (render_resources)
+      const zipFilename = `faturas_${mesReferencia.replace("/", "_")}_${Date.now()}.zip`;
+      await streamInvoiceZip(items, res, zipFilename, (progress) => {
+        const filename = filenames.get(progress.id);
+        if (progress.success) {
+          const origem = progress.cache ? " (cache)" : "";
+          console.log(`[ZIP Download] [${progress.concluidos}/${progress.total}] ${filename}${origem}`);
+        } else {
+          console.error(`[ZIP Download] [${progress.concluidos}/${progress.total}] Erro ao gerar ${filename}: ${progress.error}`);
+        }
       });
+      console.log(`[ZIP Download] ZIP finalizado: ${zipFilename}`);
 
-      const results = await Promise.all(pdfPromises);
-      const validPdfs = results.filter((r): r is { path: string; filename: string } => r !== null);
+    } catch (error: any) {
+      console.error("[ZIP Download] Erro:", error);
+      if (!res.headersSent) {
+        res.status(500).json({ message: "Erro ao gerar ZIP", error: error.message });
+      }
+    }
+  });
 
-      if (validPdfs.length === 0) {
-        return res.status(500).json({ message: "Nenhum PDF foi gerado com sucesso" });
+  // Todas as faturas com desconto de uma usina/mês num único PDF, para impressão
+  app.post("/api/faturas/download-usina-pdf", requireAuth, async (req: any, res) => {
+    try {
+      const { usinaId, mesReferencia } = req.body;
+
+      if (!usinaId || !mesReferencia) {
+        return res.status(400).json({ message: "usinaId e mesReferencia são obrigatórios" });
       }
 
-      console.log(`[ZIP Download] ${validPdfs.length} PDFs prontos para ZIP`);
+      const faturas = await getFaturasPagantesUsina(usinaId, mesReferencia);
+      if (faturas.length === 0) {
+        return res.status(404).json({ message: "Nenhuma fatura com desconto encontrada para esta usina/mês" });
+      }
 
-      // Criar ZIP
-      const archive = archiver("zip", { zlib: { level: 9 } });
-      const zipFilename = `faturas_${mesReferencia.replace("/", "_")}_${Date.now()}.zip`;
+      // Ordem de impressão: a mesma da tela da usina (número do contrato)
+      faturas.sort((a, b) =>
+        (a.cliente.numeroContrato || "").localeCompare(b.cliente.numeroContrato || "", undefined, { numeric: true })
+      );
+      const items = faturas.map(({ fatura, cliente }, index) => ({ id: index, ...invoicePdfItem(fatura, cliente) }));
 
-      res.attachment(zipFilename);
-      archive.pipe(res);
+      const outputDir = path.join(process.cwd(), "uploads", "faturas_geradas");
+      await fsPromises.mkdir(outputDir, { recursive: true });
+      const outputFilename = `faturas_${usinaId}_${mesReferencia.replace("/", "_")}.pdf`;
 
-      // Adicionar todos os PDFs ao ZIP
-      for (const pdf of validPdfs) {
-        archive.file(pdf.path, { name: pdf.filename });
+      console.log(`[PDF Usina] Gerando ${items.length} faturas em ${outputFilename}`);
+      const result = await spawnCombinedInvoices(items, path.join(outputDir, outputFilename));
+      if (result.error) {
+        return res.status(500).json({ message: result.error });
+      }
+      for (const erro of result.erros || []) {
+        console.error(`[PDF Usina] Fatura pulada (${faturas[erro.id]?.cliente.nome}): ${erro.error}`);
       }
 
-      archive.on("error", (err) => {
-        console.error("[ZIP Download] Erro ao criar ZIP:", err);
-        res.status(500).json({ message: "Erro ao criar ZIP", error: err.message });
+      await logAction(req.userId, "gerar_pdf_usina", "usina", usinaId, { mesReferencia, faturas: result.faturas });
+      res.json({
+        success: true,
+        pdfUrl: `/uploads/faturas_geradas/${outputFilename}`,
+        faturas: result.faturas,
+        erros: (result.erros || []).length,
       });
-
-      await archive.finalize();
-      console.log(`[ZIP Download] ZIP finalizado: ${zipFilename}`);
-
     } catch (error: any) {
-      console.error("[ZIP Download] Erro:", error);
-      res.status(500).json({ message: "Erro ao gerar ZIP", error: error.message });
+      console.error("[PDF Usina] Erro:", error);
+      res.status(500).json({ message: "Erro ao gerar PDF da usina", error: error.message });
     }
   });
 
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Benchmark da extração e dos geradores de PDF sobre o corpus de faturas.
+
+Etapas (na ordem em que rodam; cada uma usa a saída da anterior):
+    texto      extract_text_from_pdf (por PDF)
+    regex      extract_data_from_text (por texto extraído)
+    calculo    calculate_values (por fatura extraída)
+    fatura     generate_pdf.generate_invoice_pdf (por fatura)
+    usina      generate_relatorio.generate_relatorio_pdf (um relatório com todas)
+    cliente    generate_cliente_relatorio.generate_cliente_relatorio (idem)
+
+Cada etapa roda --warmup passadas descartadas e --repeat passadas medidas;
+o relatório traz p50/p95/média por item, vazão e o pico de memória Python
+(tracemalloc, numa passada extra sem medir tempo — alocações em C, como as
+do Pango/WeasyPrint, não aparecem ali; o picoRssKb do processo sim).
+
+Uso:
+    python3 benchmark.py                                   # Faturas Exemplo + uploads
+    python3 benchmark.py --output atual.json
+    python3 benchmark.py --baseline base.json --threshold 0.15
+    python3 benchmark.py --stages texto,regex --repeat 10 corpus/
+
+Sai com código 1 se alguma etapa ficar mais lenta (p50) que a baseline
+além do limite. Uma etapa cujo gerador não importa (ex.: WeasyPrint sem
+Pango) aparece como "pulada", com o motivo.
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:
+    HAS_RESOURCE = False
+
+import extract_fatura
+from extract_fatura import (
+    calculate_values, expand_pdf_paths, extract_data_from_text, extract_text_from_pdf,
+    sanitize_to_float,
+)
+from render_resources import load_weasyprint
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+# Só os PDFs enviados, direto em uploads/: as subpastas são saída gerada
+# (faturas_geradas, relatorios) e cache (.cache), não faturas
+DEFAULT_CORPUS = [os.path.join(ROOT, 'Faturas Exemplo'), os.path.join(ROOT, 'uploads', '*.pdf')]
+
+STAGES = ('texto', 'regex', 'calculo', 'fatura', 'usina', 'cliente')
+
+PRICE_KWH = 0.85
+DISCOUNT = 25.0
+
+
+def percentile(values, p):
+    """Percentil p (0-100) com interpolação linear entre as amostras vizinhas."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    pos = (len(ordered) - 1) * p / 100
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def _peak_rss_kb():
+    if not HAS_RESOURCE:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+# ==================== ENTRADAS DOS GERADORES ====================
+
+def _num(data, key):
+    """Campo numérico da fatura extraída ("963,00" -> 963.0), como o banco entrega aos geradores."""
+    return sanitize_to_float(data.get(key))
+
+
+def _invoice_input(data):
+    """Fatura calculada -> JSON que o routes.ts manda para o generate_pdf.py."""
+    return {
+        'nomeCliente': data.get('nomeCliente') or '',
+        'enderecoCliente': data.get('endereco') or '',
+        'unidadeConsumidora': data.get('unidadeConsumidora') or '',
+        'mesReferencia': data.get('mesReferencia') or '',
+        'dataVencimento': data.get('dataVencimento') or '',
+        'consumoScee': _num(data, 'consumoScee'),
+        'consumoNaoCompensado': _num(data, 'consumoNaoCompensado'),
+        'valorTotal': _num(data, 'valorTotal'),
+        'valorComDesconto': _num(data, 'valorComDesconto'),
+        'valorSemDesconto': _num(data, 'valorSemDesconto'),
+        'economia': _num(data, 'economia'),
+        'contribuicaoIluminacao': _num(data, 'contribuicaoIluminacao'),
+        'precoKwh': PRICE_KWH,
+        'precoFioB': _num(data, 'precoFioB'),
+    }
+
+
+def _usina_input(invoices):
+    return {
+        'nomeUsina': 'Usina Benchmark',
+        'periodo': 'Benchmark',
+        'kwhGerado': 10000,
+        'kwhPrevisto': 12000,
+        'potenciaKwp': 75,
+        'kwhPrevistoMensal': 12000,
+        'clientes': [{
+            'numeroContrato': str(i + 1),
+            'nome': data.get('nomeCliente') or '',
+            'uc': data.get('unidadeConsumidora') or '',
+            'endereco': data.get('endereco') or '',
+            'porcentagemEnvioCredito': 5,
+            'consumo': _num(data, 'consumoScee'),
+            'valorComDesconto': _num(data, 'valorComDesconto'),
+            'valorTotal': _num(data, 'valorTotal'),
+            'lucro': _num(data, 'lucro'),
+            'saldoKwh': _num(data, 'saldoKwh'),
+        } for i, data in enumerate(invoices)],
+    }
+
+
+def _cliente_input(invoices):
+    first = invoices[0] if invoices else {}
+    return {
+        'nomeCliente': first.get('nomeCliente') or '',
+        'enderecoCompleto': first.get('endereco') or '',
+        'unidadeConsumidora': first.get('unidadeConsumidora') or '',
+        'periodo': 'Benchmark',
+        'descontoPercentual': DISCOUNT,
+        'economiaTotal': sum(_num(d, 'economia') for d in invoices),
+        'valorSemDescontoTotal': sum(_num(d, 'valorSemDesconto') for d in invoices),
+        'valorComDescontoTotal': sum(_num(d, 'valorComDesconto') for d in invoices),
+        'faturas': [{
+            'mes': data.get('mesReferencia') or '',
+            'consumoScee': _num(data, 'consumoScee'),
+            'valorSemDesconto': _num(data, 'valorSemDesconto'),
+            'valorComDesconto': _num(data, 'valorComDesconto'),
+            'economia': _num(data, 'economia'),
+        } for data in invoices],
+    }
+
+
+def _load_renderer(stage):
+    """Importa o gerador da etapa; devolve (função, motivo_se_indisponível)."""
+    # Mede a renderização de fato, não o cache de saída (mesmos dados a cada repetição)
+    os.environ['RENDER_CACHE'] = '0'
+    # O WeasyPrint escreve um aviso no stdout quando não carrega: manda para o stderr,
+    # que o JSON do resultado sai no stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        return _import_renderer(stage)
+
+
+def _import_renderer(stage):
+    try:
+        # Os geradores só importam o WeasyPrint no primeiro PDF (render_resources):
+        # carrega aqui, para a falta do Pango pular a etapa em vez de estourar na medição
+        load_weasyprint()
+        if stage == 'fatura':
+            from generate_pdf import generate_invoice_pdf
+            return generate_invoice_pdf, None
+        if stage == 'usina':
+            from generate_relatorio import generate_relatorio_pdf
+            return generate_relatorio_pdf, None
+        from generate_cliente_relatorio import generate_cliente_relatorio
+        return generate_cliente_relatorio, None
+    except (ImportError, OSError) as e:
+        # O WeasyPrint levanta OSError quando falta a biblioteca do Pango
+        return None, f'{type(e).__name__}: {e}'
+
+
+# ==================== EXECUÇÃO ====================
+
+def _measure(func, items, warmup, repeat):
+    """Roda func(item) sobre os itens: warmup passadas descartadas + repeat medidas."""
+    for _ in range(warmup):
+        for item in items:
+            func(item)
+    samples = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            start = time.perf_counter()
+            func(item)
+            samples.append(time.perf_counter() - start)
+    return samples, time.perf_counter() - started
+
+
+def _peak_memory_kb(func, items):
+    tracemalloc.start()
+    try:
+        for item in items:
+            func(item)
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+
+def _summary(samples, elapsed):
+    ms = [s * 1000 for s in samples]
+    return {
+        'amostras': len(ms),
+        'p50Ms': round(percentile(ms, 50), 3),
+        'p95Ms': round(percentile(ms, 95), 3),
+        'mediaMs': round(sum(ms) / len(ms), 3),
+        'maxMs': round(max(ms), 3),
+        'itensPorSegundo': round(len(ms) / elapsed, 2) if elapsed else None,
+    }
+
+
+def _run_stages(pdf_paths, stages, warmup, repeat, backend, memory, output_dir):
+    """Roda as etapas gravando os PDFs em output_dir; devolve (resultados, textos extraídos)."""
+    results = {}
+    # As etapas dependem umas das outras: texto -> regex -> cálculo -> geradores.
+    # Mesmo quando uma etapa não é medida, a saída dela é produzida uma vez.
+    texts = []
+    for path in pdf_paths:
+        text, error = extract_text_from_pdf(path, ocr_cache=False, backend=backend)
+        if not error and text:
+            texts.append((path, text))
+    parsed = [extract_data_from_text(text, path) for path, text in texts]
+    invoices = [calculate_values(copy.deepcopy(data), PRICE_KWH, DISCOUNT) for data in parsed]
+
+    def render_invoice(render):
+        def run(item):
+            index, data = item
+            render(_invoice_input(data), os.path.join(output_dir, f'fatura-{index}.pdf'))
+        return run
+
+    plans = {
+        'texto': (lambda path: extract_text_from_pdf(path, ocr_cache=False, backend=backend),
+                  pdf_paths),
+        'regex': (lambda item: extract_data_from_text(item[1], item[0]), texts),
+        'calculo': (lambda data: calculate_values(copy.deepcopy(data), PRICE_KWH, DISCOUNT),
+                    parsed),
+    }
+
+    for stage in stages:
+        if stage in plans:
+            func, items = plans[stage]
+        else:
+            render, reason = _load_renderer(stage)
+            if render is None:
+                results[stage] = {'pulada': reason}
+                continue
+            if stage == 'fatura':
+                func, items = render_invoice(render), list(enumerate(invoices))
+            elif stage == 'usina':
+                func = lambda data, render=render: render(data, os.path.join(output_dir, 'usina.pdf'))
+                items = [_usina_input(invoices)]
+            else:
+                func = lambda data, render=render: render(data, os.path.join(output_dir, 'cliente.pdf'))
+                items = [_cliente_input(invoices)]
+
+        if not items:
+            results[stage] = {'pulada': 'nenhum item de entrada'}
+            continue
+
+        # O generate_pdf imprime o cálculo da taxa mínima no stderr a cada fatura
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+            samples, elapsed = _measure(func, items, warmup, repeat)
+            summary = _summary(samples, elapsed)
+            summary['itens'] = len(items)
+            if memory:
+                summary['memoriaPicoKb'] = _peak_memory_kb(func, items)
+        results[stage] = summary
+
+    return results, texts
+
+
+def run_benchmark(pdf_paths, stages=STAGES, warmup=1, repeat=5, backend=None, memory=True):
+    """Executa as etapas pedidas e devolve o resultado completo (dict serializável)."""
+    pdf_paths = list(pdf_paths)
+    # Os PDFs renderizados são descartados no fim: só o tempo interessa
+    with tempfile.TemporaryDirectory(prefix='benchmark-') as output_dir:
+        results, texts = _run_stages(pdf_paths, stages, warmup, repeat, backend, memory,
+                                     output_dir)
+
+    return {
+        'meta': {
+            'data': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'cpus': os.cpu_count(),
+            'backend': backend or extract_fatura.DEFAULT_TEXT_BACKEND,
+            'pdfs': len(pdf_paths),
+            'faturasComTexto': len(texts),
+            'warmup': warmup,
+            'repeat': repeat,
+            'picoRssKb': _peak_rss_kb(),
+        },
+        'etapas': results,
+    }
+
+
+def compare_to_baseline(current, baseline, threshold):
+    """
+    Compara o p50 de cada etapa com a baseline. Devolve a lista de etapas
+    (com os dois p50 e a variação) e se houve regressão acima do limite.
+    """
+    rows = []
+    regression = False
+    for stage, result in current['etapas'].items():
+        base = baseline.get('etapas', {}).get(stage)
+        if not base or 'p50Ms' not in base or 'p50Ms' not in result:
+            continue
+        change = (result['p50Ms'] - base['p50Ms']) / base['p50Ms'] if base['p50Ms'] else 0.0
+        slower = change > threshold
+        regression = regression or slower
+        rows.append({
+            'etapa': stage,
+            'baseP50Ms': base['p50Ms'],
+            'atualP50Ms': result['p50Ms'],
+            'variacao': round(change, 4),
+            'regressao': slower,
+        })
+    return rows, regression
+
+
+def print_report(result, comparison=None, stream=sys.stderr):
+    meta = result['meta']
+    print(f"{meta['pdfs']} PDFs ({meta['faturasComTexto']} com texto), backend {meta['backend']}, "
+          f"warmup {meta['warmup']}, repeat {meta['repeat']}", file=stream)
+    for stage, data in result['etapas'].items():
+        if 'pulada' in data:
+            print(f'  {stage:<8} pulada: {data["pulada"]}', file=stream)
+            continue
+        memory = f', pico {data["memoriaPicoKb"]} KB' if 'memoriaPicoKb' in data else ''
+        print(f'  {stage:<8} p50 {data["p50Ms"]:.3f} ms, p95 {data["p95Ms"]:.3f} ms, '
+              f'{data["itensPorSegundo"]} itens/s{memory}', file=stream)
+    for row in comparison or []:
+        flag = '  REGRESSÃO' if row['regressao'] else ''
+        print(f'  {row["etapa"]:<8} {row["baseP50Ms"]:.3f} -> {row["atualP50Ms"]:.3f} ms '
+              f'({row["variacao"]:+.1%}){flag}', file=stream)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark da extração e dos geradores de PDF')
+    parser.add_argument('corpus', nargs='*',
+                        help='Arquivos, diretórios ou globs (padrão: Faturas Exemplo e uploads)')
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help=f'Etapas separadas por vírgula (padrão: {",".join(STAGES)})')
+    parser.add_argument('--warmup', type=int, default=1, help='Passadas descartadas por etapa')
+    parser.add_argument('--repeat', type=int, default=5, help='Passadas medidas por etapa')
+    parser.add_argument('--backend', choices=extract_fatura.TEXT_BACKENDS, default=None,
+                        help='Backend de texto da etapa "texto"')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='Não mede o pico de memória (dispensa a passada com tracemalloc)')
+    parser.add_argument('--output', help='Grava o resultado em JSON neste arquivo')
+    parser.add_argument('--baseline', help='JSON de uma execução anterior para comparar')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Aumento máximo tolerado do p50 em relação à baseline (0.10 = 10%%)')
+    args = parser.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f'etapas desconhecidas: {", ".join(unknown)}')
+    if args.repeat < 1:
+        parser.error('--repeat precisa ser >= 1')
+
+    pdf_paths = [p for p in expand_pdf_paths(args.corpus or DEFAULT_CORPUS) if os.path.isfile(p)]
+    if not pdf_paths:
+        parser.error('nenhum PDF encontrado no corpus')
+
+    result = run_benchmark(pdf_paths, stages, args.warmup, args.repeat, args.backend,
+                           memory=not args.no_memory)
+
+    comparison, regression = None, False
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        comparison, regression = compare_to_baseline(result, baseline, args.threshold)
+        result['comparacao'] = {'baseline': args.baseline, 'threshold': args.threshold,
+                                'etapas': comparison, 'regressao': regression}
+
+    print_report(result, comparison)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+
+    if regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Reextração em massa e retomável (backfill) das faturas enviadas.
+
+Varre a árvore (padrão: uploads/faturas), pula os PDFs cujo hash já foi
+processado, distribui o resto no pool de processos do extract_fatura e
+grava tudo num único arquivo de saída (NDJSON ou CSV). O progresso fica
+num manifesto local; se o job cair (ou for interrompido), rodar o mesmo
+comando de novo continua de onde parou.
+
+Manifesto (NDJSON, só acrescentado):
+    {"sha256": "...", "pdfPath": "...", "success": true}     um por PDF
+    {"checkpoint": 12, "outputBytes": 123456, "em": "..."}   a cada checkpoint
+
+No checkpoint a saída é gravada em disco (fsync) e só então os PDFs desde
+o checkpoint anterior entram no manifesto, seguidos da linha de checkpoint.
+Na retomada vale só o que veio antes do último checkpoint: a saída é
+truncada em outputBytes, então um registro nunca sai duplicado nem perdido.
+
+Uso da CPU: --jobs processos (padrão: metade das CPUs) rodando com
+prioridade reduzida (--nice 10), para não disputar com o servidor.
+
+Uso:
+    python3 bulk_extract.py --output /var/backfill/faturas.ndjson
+    python3 bulk_extract.py uploads/faturas/2025 --output faturas.csv --jobs 2
+    python3 bulk_extract.py --output faturas.ndjson --restart   # descarta o progresso
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import signal
+import argparse
+from datetime import datetime
+
+from extract_cache import sha256_file
+from serialization import dumps
+from extract_fatura import (
+    TEXT_BACKENDS, expand_pdf_paths, iter_batch, iter_parallel,
+)
+
+UPLOADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                           'uploads', 'faturas')
+
+CHECKPOINT_EVERY = 50
+CHECKPOINT_SECONDS = 30
+
+# Colunas da saída CSV (os demais campos só vão no NDJSON)
+CSV_FIELDS = [
+    'pdfPath', 'sha256', 'success', 'error', 'layout', 'unidadeConsumidora', 'nomeCliente',
+    'cpfCnpj', 'endereco', 'mesReferencia', 'dataVencimento', 'leituraAnterior', 'leituraAtual',
+    'quantidadeDias', 'valorTotal', 'consumoKwh', 'consumoScee', 'energiaInjetada',
+    'consumoNaoCompensado', 'saldoKwh', 'contribuicaoIluminacao', 'precoFioB',
+    'cicloGeracao', 'ucGeradora', 'geracaoUltimoCiclo', 'valorSemDesconto',
+    'valorComDesconto', 'economia', 'extractionErrors',
+]
+
+
+def load_manifest(path):
+    """
+    Lê o manifesto e devolve (hashes confirmados, checkpoints, outputBytes,
+    tamanho válido do manifesto). Entradas depois do último checkpoint e
+    linhas incompletas (queda no meio da gravação) são descartadas.
+    """
+    done = set()
+    pending = set()
+    checkpoints = 0
+    output_bytes = 0
+    valid = 0
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return done, checkpoints, output_bytes, valid
+    with f:
+        offset = 0
+        for raw in f:
+            offset += len(raw)
+            if not raw.endswith(b'\n'):
+                break
+            try:
+                entry = json.loads(raw)
+            except ValueError:
+                break
+            if 'checkpoint' in entry:
+                done |= pending
+                pending = set()
+                checkpoints = entry['checkpoint']
+                output_bytes = entry['outputBytes']
+                valid = offset
+            else:
+                pending.add(entry['sha256'])
+    return done, checkpoints, output_bytes, valid
+
+
+class Output:
+    """Saída consolidada (NDJSON ou CSV), aberta para acrescentar."""
+
+    def __init__(self, path, fmt, truncate_at):
+        self.fmt = fmt
+        mode = 'r+' if os.path.exists(path) else 'w'
+        self.writer = None
+        if fmt == 'csv':
+            self.file = open(path, mode, encoding='utf-8', newline='')
+        else:
+            # NDJSON sai em bytes direto do serializador (orjson, se houver)
+            self.file = open(path, mode + 'b')
+        self.file.truncate(truncate_at)
+        self.file.seek(truncate_at)
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(self.file, fieldnames=CSV_FIELDS, extrasaction='ignore')
+            if truncate_at == 0:
+                self.writer.writeheader()
+
+    def write(self, record):
+        if self.writer is None:
+            self.file.write(dumps(record) + b'\n')
+            return
+        row = dict(record)
+        row['extractionErrors'] = ';'.join(record.get('extractionErrors') or [])
+        self.writer.writerow(row)
+
+    def sync(self):
+        """Grava em disco e devolve o tamanho atual (o outputBytes do checkpoint)."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return os.fstat(self.file.fileno()).st_size
+
+    def close(self):
+        self.file.close()
+
+
+class Manifest:
+    """Manifesto do job: acumula os PDFs concluídos e confirma no checkpoint."""
+
+    def __init__(self, path, valid_bytes, checkpoints):
+        self.file = open(path, 'ab')
+        self.file.truncate(valid_bytes)
+        self.checkpoints = checkpoints
+        self.pending = []
+
+    def add(self, sha256, pdf_path, success):
+        self.pending.append({'sha256': sha256, 'pdfPath': pdf_path, 'success': success})
+
+    def checkpoint(self, output_bytes):
+        self.checkpoints += 1
+        lines = [json.dumps(entry, ensure_ascii=False) for entry in self.pending]
+        lines.append(json.dumps({'checkpoint': self.checkpoints, 'outputBytes': output_bytes,
+                                 'em': datetime.now().isoformat(timespec='seconds')}))
+        self.file.write(('\n'.join(lines) + '\n').encode('utf-8'))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = []
+
+    def close(self):
+        self.file.close()
+
+
+def iter_pending(inputs, done, stats):
+    """
+    PDFs ainda não processados, com o hash já calculado (path -> sha256 em
+    stats['hashes']). Pula os hashes do manifesto e os repetidos na árvore.
+    """
+    seen = set(done)
+    for pdf_path in expand_pdf_paths(inputs):
+        stats['encontrados'] += 1
+        try:
+            digest = sha256_file(pdf_path)
+        except OSError as e:
+            print(f'{pdf_path}: {e}', file=sys.stderr)
+            stats['ilegiveis'] += 1
+            continue
+        if digest in seen:
+            stats['pulados'] += 1
+            continue
+        seen.add(digest)
+        stats['hashes'][pdf_path] = digest
+        yield pdf_path
+
+
+def run_bulk(inputs, output_path, manifest_path=None, fmt=None, jobs=None, nice=10,
+             restart=False, checkpoint_every=CHECKPOINT_EVERY,
+             checkpoint_seconds=CHECKPOINT_SECONDS, price_kwh=0.85, discount=25.0,
+             max_tasks_per_child=200, **options):
+    """Roda (ou retoma) o job e devolve o resumo. options vão para process_pdf."""
+    manifest_path = manifest_path or output_path + '.manifest'
+    fmt = fmt or ('csv' if output_path.lower().endswith('.csv') else 'ndjson')
+    if restart:
+        for path in (output_path, manifest_path):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    done, checkpoints, output_bytes, valid = load_manifest(manifest_path)
+    if nice and hasattr(os, 'nice'):
+        os.nice(nice)  # herdado pelos processos do pool
+    if jobs is None:
+        jobs = max(1, (os.cpu_count() or 1) // 2)
+
+    stats = {'encontrados': 0, 'pulados': 0, 'ilegiveis': 0, 'processados': 0, 'erros': 0,
+             'hashes': {}}
+    paths = iter_pending(inputs, done, stats)
+    if jobs == 1:
+        results = iter_batch(paths, price_kwh, discount, **options)
+    else:
+        results = iter_parallel(paths, price_kwh, discount, jobs=jobs, ordered=False,
+                                max_tasks_per_child=max_tasks_per_child, **options)
+
+    output = Output(output_path, fmt, output_bytes)
+    manifest = Manifest(manifest_path, valid, checkpoints)
+    start = last_checkpoint = time.monotonic()
+    interrupted = False
+    try:
+        for result in results:
+            pdf_path = result.get('pdfPath')
+            digest = stats['hashes'].pop(pdf_path, None)
+            result['sha256'] = digest
+            output.write(result)
+            manifest.add(digest, pdf_path, result['success'])
+            stats['processados'] += 1
+            stats['erros'] += not result['success']
+
+            now = time.monotonic()
+            if len(manifest.pending) >= checkpoint_every or now - last_checkpoint >= checkpoint_seconds:
+                manifest.checkpoint(output.sync())
+                last_checkpoint = now
+                rate = stats['processados'] / (now - start)
+                print(f'{stats["processados"]} processados ({rate:.1f}/s), '
+                      f'{stats["pulados"]} pulados, {stats["erros"]} com erro', file=sys.stderr)
+    except KeyboardInterrupt:
+        interrupted = True
+    finally:
+        results.close()
+        # O que já saiu do pool fica confirmado; o resto volta na retomada
+        if manifest.pending:
+            manifest.checkpoint(output.sync())
+        output.close()
+        manifest.close()
+
+    return {
+        'success': not interrupted,
+        'interrompido': interrupted,
+        'encontrados': stats['encontrados'],
+        'pulados': stats['pulados'],
+        'ilegiveis': stats['ilegiveis'],
+        'processados': stats['processados'],
+        'erros': stats['erros'],
+        'segundos': round(time.monotonic() - start, 2),
+        'saida': output_path,
+        'manifesto': manifest_path,
+    }
+
+
+def _terminate(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reextração em massa, retomável, das faturas enviadas')
+    parser.add_argument('inputs', nargs='*', help=f'Arquivos, diretórios ou globs (padrão: {UPLOADS_DIR})')
+    parser.add_argument('--output', required=True, help='Arquivo de saída consolidado (.ndjson ou .csv)')
+    parser.add_argument('--format', choices=['ndjson', 'csv'], default=None,
+                        help='Formato da saída (padrão: pela extensão)')
+    parser.add_argument('--manifest', default=None, help='Manifesto de progresso (padrão: <output>.manifest)')
+    parser.add_argument('--restart', action='store_true', help='Descarta saída e manifesto e começa do zero')
+    parser.add_argument('--jobs', type=int, default=None, help='Processos em paralelo (padrão: metade das CPUs)')
+    parser.add_argument('--nice', type=int, default=10, help='Incremento de nice do job (0 = prioridade normal)')
+    parser.add_argument('--checkpoint-every', type=int, default=CHECKPOINT_EVERY,
+                        help='Grava o checkpoint a cada N PDFs')
+    parser.add_argument('--checkpoint-seconds', type=float, default=CHECKPOINT_SECONDS,
+                        help='... ou a cada N segundos')
+    parser.add_argument('--price-kwh', type=float, default=0.85, help='Preço do kWh')
+    parser.add_argument('--discount', type=float, default=25.0, help='Desconto percentual')
+    parser.add_argument('--no-cache', action='store_true', help='Ignora o cache de extração')
+    parser.add_argument('--regions', action='store_true', help='Lê só as regiões conhecidas da página 1')
+    parser.add_argument('--lazy-ocr', action='store_true', help='OCR só das regiões com campo faltando')
+    parser.add_argument('--backend', choices=TEXT_BACKENDS, default=None, help='Camada de texto')
+    args = parser.parse_args()
+
+    # SIGTERM (systemd, docker stop) interrompe como Ctrl+C: grava o checkpoint e sai
+    signal.signal(signal.SIGTERM, _terminate)
+    summary = run_bulk(args.inputs or [UPLOADS_DIR], args.output, args.manifest, args.format,
+                       jobs=args.jobs, nice=args.nice, restart=args.restart,
+                       checkpoint_every=args.checkpoint_every,
+                       checkpoint_seconds=args.checkpoint_seconds,
+                       price_kwh=args.price_kwh, discount=args.discount,
+                       use_cache=False if args.no_cache else None, regions=args.regions,
+                       lazy_ocr=args.lazy_ocr, backend=args.backend)
+    print(json.dumps(summary, ensure_ascii=False))
+    if not summary['success']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Cache persistente em disco para a extração de faturas.
+
+Cada entrada é um arquivo JSON endereçado pelo conteúdo ("<sha256>-v<versão>":
+hash do PDF + versão do extrator), então reenviar o mesmo PDF — mesmo com outro nome —
+não passa de novo pelo pdfminer/OCR. A recência é o mtime do arquivo: cada
+acerto faz "touch" e a remoção por tamanho apaga os menos usados (LRU).
+
+Uso da CLI:
+    python3 extract_cache.py stats
+    python3 extract_cache.py list [--namespace extracao]
+    python3 extract_cache.py purge [--older-than DIAS] [--stale] [--all]
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+
+CACHE_DIR = os.environ.get('EXTRACT_CACHE_DIR') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'uploads', '.cache')
+MAX_BYTES = int(float(os.environ.get('EXTRACT_CACHE_MAX_MB', '256')) * 1024 * 1024)
+
+# Remoção por tamanho a cada N gravações (varrer o diretório tem custo)
+EVICT_EVERY = 32
+
+
+def cache_enabled():
+    return os.environ.get('EXTRACT_CACHE', '1') != '0'
+
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """Armazena dicts JSON em <root>/<namespace>/<ab>/<chave>.json."""
+
+    def __init__(self, namespace, max_bytes=None, root=None):
+        self.namespace = namespace
+        self.max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+        self.dir = os.path.join(root or CACHE_DIR, namespace)
+        self._puts = 0
+
+    def _path(self, key):
+        return os.path.join(self.dir, key[:2], key + '.json')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)  # marca como usado recentemente
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            # os.replace é atômico: workers paralelos nunca leem JSON pela metade
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+
+        self._puts += 1
+        if self._puts % EVICT_EVERY == 1:
+            self.evict()
+
+    def entries(self):
+        """Lista (chave, tamanho, mtime) de todas as entradas."""
+        result = []
+        if not os.path.isdir(self.dir):
+            return result
+        for root, _dirs, files in os.walk(self.dir):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                result.append((name[:-5], st.st_size, st.st_mtime))
+        return result
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+            return True
+        except OSError:
+            return False
+
+    def evict(self, max_bytes=None):
+        """Remove as entradas usadas há mais tempo até caber em max_bytes."""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _key, size, _mtime in entries)
+        removed = 0
+        for key, size, _mtime in sorted(entries, key=lambda e: e[2]):
+            if total <= limit:
+                break
+            if self.delete(key):
+                total -= size
+                removed += 1
+        return removed
+
+    def purge(self, older_than=None, predicate=None):
+        """Remove tudo, ou só as entradas mais velhas que older_than segundos / que casam com predicate."""
+        now = time.time()
+        removed = 0
+        for key, _size, mtime in self.entries():
+            if older_than is not None and now - mtime < older_than:
+                continue
+            if predicate is not None and not predicate(key):
+                continue
+            if self.delete(key):
+                removed += 1
+        return removed
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            'namespace': self.namespace,
+            'dir': os.path.normpath(self.dir),
+            'entries': len(entries),
+            'bytes': sum(size for _key, size, _mtime in entries),
+            'maxBytes': self.max_bytes,
+        }
+
+
+def cache_key(digest, version):
+    return f'{digest}-v{version}'
+
+
+def current_versions():
+    """Versão atual de cada namespace, para o purge --stale."""
+    from extract_fatura import EXTRACTOR_VERSION
+    from ocr_engine import OCR_VERSION
+    return {'extracao': EXTRACTOR_VERSION, 'ocr': OCR_VERSION}
+
+
+def list_namespaces(root=None):
+    root = root or CACHE_DIR
+    if not os.path.isdir(root):
+        return []
+    return sorted(n for n in os.listdir(root) if os.path.isdir(os.path.join(root, n)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspeciona e limpa o cache de extração de faturas')
+    parser.add_argument('command', choices=['stats', 'list', 'purge'])
+    parser.add_argument('--namespace', help='Restringe a um namespace (ex.: extracao, ocr, render)')
+    parser.add_argument('--older-than', type=float, metavar='DIAS',
+                        help='purge: só entradas sem uso há mais de N dias')
+    parser.add_argument('--stale', action='store_true',
+                        help='purge: só entradas de versões antigas do extrator')
+    parser.add_argument('--all', action='store_true', help='purge: remove tudo')
+    args = parser.parse_args()
+
+    namespaces = [args.namespace] if args.namespace else list_namespaces()
+    caches = [DiskCache(ns) for ns in namespaces]
+
+    if args.command == 'stats':
+        print(json.dumps([c.stats() for c in caches], ensure_ascii=False, indent=2))
+        return
+
+    if args.command == 'list':
+        for cache in caches:
+            for key, size, mtime in sorted(cache.entries(), key=lambda e: -e[2]):
+                used = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime))
+                print(f'{cache.namespace}\t{key}\t{size}\t{used}')
+        return
+
+    if not (args.all or args.stale or args.older_than is not None):
+        parser.error('purge exige --all, --stale ou --older-than')
+
+    older_than = args.older_than * 86400 if args.older_than is not None else None
+    versions = current_versions() if args.stale else {}
+    removed = {}
+    for cache in caches:
+        predicate = None
+        if args.stale:
+            version = versions.get(cache.namespace)
+            if version is None:
+                continue  # namespace sem versão conhecida: não há como saber o que é velho
+            # As chaves terminam com a versão que as gerou ("<sha256>-v<versão>")
+            suffix = f'-v{version}'
+            predicate = lambda key, suffix=suffix: not key.endswith(suffix)
+        removed[cache.namespace] = cache.purge(older_than=older_than, predicate=predicate)
+    print(json.dumps({'removed': removed}, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,10 +4,18 @@ Script para extrair dados de faturas de energia em PDF.
 Suporta os dois layouts da Equatorial Goiás (variação de posição dos campos).
 """
 
+import os
 import sys
 import json
 import re
+import glob
+import time
+import ctypes
+import hashlib
 import argparse
+import threading
+import dataclasses
+from contextlib import contextmanager
 
 try:
     import pdfplumber
@@ -15,182 +23,791 @@ except ImportError:
     print(json.dumps({"error": "pdfplumber not installed"}))
     sys.exit(1)
 
+from pdfplumber.utils import extract_text as chars_to_text
+
 try:
-    import pytesseract
-    from PIL import Image
-    HAS_OCR = True
+    import pypdfium2 as pdfium
+    import pypdfium2.raw as pdfium_c
+    HAS_PDFIUM = True
 except ImportError:
-    HAS_OCR = False
+    HAS_PDFIUM = False
 
+from extract_cache import DiskCache, cache_enabled, cache_key, sha256_file
+from ocr_engine import HAS_OCR, get_engine, preprocess
+from serialization import (
+    OUTPUT_FORMATS, RecordWriter, binary_stream, dumps, loads, read_frame, require_format, unpack,
+)
+from stored_text import (
+    ArchiveWriter, diff_fields, iter_documents, make_document, page_record,
+)
+from timings import count, note, recording, stage, timed
+
+# Versão do extrator: entra na chave do cache, então qualquer mudança nas
+# regex ou no parsing que altere o resultado DEVE incrementar este valor.
+EXTRACTOR_VERSION = '3'
+
+_extraction_cache = None
+
+
+def get_extraction_cache():
+    global _extraction_cache
+    if _extraction_cache is None:
+        _extraction_cache = DiskCache('extracao')
+    return _extraction_cache
+
+
+# ==================== BACKENDS DE TEXTO ====================
+# A camada de texto (e a rasterização para OCR) pode vir do pdfminer, via
+# pdfplumber — o caminho original —, ou do pdfium (pypdfium2, que já vem com
+# o pdfplumber), bem mais rápido. Os caracteres do pdfium recebem caixas no
+# mesmo modelo do pdfminer (base + descendente da fonte, altura = corpo), então
+# o chars_to_text agrupa as linhas igual e o texto sai idêntico.
+# A equivalência é conferida com --compare-backends.
+
+TEXT_BACKENDS = ('pdfium', 'pdfminer')
+DEFAULT_TEXT_BACKEND = os.environ.get('EXTRACT_TEXT_BACKEND') or (
+    'pdfium' if HAS_PDFIUM else 'pdfminer')
+
+# O pdfium não é thread-safe e o modo --socket atende em threads
+_PDFIUM_LOCK = threading.RLock()
+
+
+class PdfminerPage:
+    def __init__(self, page):
+        self.page = page
+        self.width = page.width
+
+    def chars(self):
+        with stage('texto'):
+            return self.page.chars
+
+    def text(self):
+        with stage('texto'):
+            return self.page.extract_text()
+
+    def image(self, dpi):
+        count('paginasOcr')
+        with stage('rasterizacao'):
+            return self.page.to_image(resolution=dpi).original
+
+
+class PdfiumPage:
+    def __init__(self, page):
+        self.page = page
+        self.width = page.get_width()
+
+    def _chars(self):
+        with _PDFIUM_LOCK:
+            return _pdfium_chars(self.page)
+
+    def chars(self):
+        with stage('texto'):
+            return self._chars()
+
+    def text(self):
+        # A montagem das linhas (chars_to_text) também conta como "texto",
+        # como no extract_text do pdfminer
+        with stage('texto'):
+            chars = self._chars()
+            return chars_to_text(chars) if chars else ''
+
+    def image(self, dpi):
+        count('paginasOcr')
+        with stage('rasterizacao'), _PDFIUM_LOCK:
+            return self.page.render(scale=dpi / 72).to_pil()
+
+
+def _pdfium_chars(page):
+    """Caracteres da página no formato do pdfplumber (só o que o chars_to_text usa)."""
+    height = page.get_height()
+    textpage = page.get_textpage()
+    try:
+        rect = pdfium_c.FS_RECTF()
+        origin_x, origin_y = ctypes.c_double(), ctypes.c_double()
+        descent = ctypes.c_float()
+        chars = []
+        for i in range(pdfium_c.FPDFText_CountChars(textpage)):
+            # Quebras de linha e espaços sintetizados pelo pdfium não existem no pdfminer
+            if pdfium_c.FPDFText_IsGenerated(textpage, i) == 1:
+                continue
+            code = pdfium_c.FPDFText_GetUnicode(textpage, i)
+            if code in (0, 0x0A, 0x0D, 0xFFFE):
+                continue
+            size = pdfium_c.FPDFText_GetFontSize(textpage, i)
+            pdfium_c.FPDFText_GetLooseCharBox(textpage, i, rect)
+            pdfium_c.FPDFText_GetCharOrigin(textpage, i, origin_x, origin_y)
+            font = pdfium_c.FPDFTextObj_GetFont(pdfium_c.FPDFText_GetTextObject(textpage, i))
+            pdfium_c.FPDFFont_GetDescent(font, size, descent)
+            bottom = origin_y.value + descent.value
+            top = height - (bottom + size)
+            chars.append({
+                'text': chr(code),
+                'x0': rect.left,
+                'x1': rect.right,
+                'top': top,
+                'bottom': height - bottom,
+                'doctop': top,
+                'upright': True,
+            })
+        return chars
+    finally:
+        textpage.close()
+
+
+def _counted(pages):
+    for page in pages:
+        count('paginasAbertas')
+        yield page
+
+
+@contextmanager
+def open_pages(pdf_path, backend=None, first_only=False):
+    """
+    Abre o PDF no backend pedido e entrega um iterador de páginas (PdfiumPage
+    ou PdfminerPage: width, chars(), text(), image(dpi)). Se o pdfium não
+    abrir o arquivo, usa o pdfminer, que reporta o erro como antes.
+    """
+    backend = backend or DEFAULT_TEXT_BACKEND
+    if backend not in TEXT_BACKENDS:
+        raise ValueError(f'backend de texto desconhecido: {backend}')
+
+    doc = None
+    if backend == 'pdfium' and HAS_PDFIUM:
+        try:
+            with stage('abertura'), _PDFIUM_LOCK:
+                doc = pdfium.PdfDocument(pdf_path)
+        except Exception:
+            doc = None
+
+    if doc is None:
+        with stage('abertura'):
+            pdf = pdfplumber.open(pdf_path, pages=[1] if first_only else None)
+        with pdf:
+            yield _counted(PdfminerPage(page) for page in pdf.pages)
+        return
 
-def extract_text_from_pdf(pdf_path):
-    text = ''
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
+        total = min(len(doc), 1) if first_only else len(doc)
+        yield _counted(PdfiumPage(doc[i]) for i in range(total))
+    finally:
+        with _PDFIUM_LOCK:
+            doc.close()
+
+
+def _awaiting_ocr(page):
+    """Página rasterizada cujo registro ainda guarda a imagem no lugar do texto."""
+    return page['ocr'] and page['texto'] is not None and not isinstance(page['texto'], str)
+
+
+def _ocr_pending(pages, ocr_cache):
+    """OCR, em paralelo, das páginas que ainda aguardam (ver _awaiting_ocr)."""
+    pending = [p for p in pages if _awaiting_ocr(p)]
+    if pending:
+        # ocr_cache=None segue EXTRACT_CACHE (ver ocr_engine)
+        texts = get_engine().map([p['texto'] for p in pending], settings='dpi=200',
+                                 use_cache=ocr_cache)
+        for page, page_text in zip(pending, texts):
+            page['texto'] = page_text
+
+
+def extract_pages(pdf_path, ocr_cache=None, backend=None, all_pages=False):
+    """
+    Texto de cada página (ver stored_text.page_record): a camada de texto ou,
+    para página sem ela, o OCR. Por padrão para de ler quando as páginas já
+    lidas têm a seção CONSUMO: a primeira página sem texto é ocerizada
+    sozinha e as seguintes só entram (num lote, em paralelo) se a seção
+    ainda faltar. all_pages=True lê todas num lote só (é o que vai para o
+    texto armazenado).
+    Retorna (páginas, erro).
+    """
+    pages = []
+    ocr_first = not all_pages
+    try:
+        with open_pages(pdf_path, backend) as pdf_pages:
+            for number, page in enumerate(pdf_pages, 1):
+                page_text = page.text()
                 if page_text:
-                    text += page_text + "\n"
+                    pages.append(page_record(number, page_text, False))
                 elif HAS_OCR:
                     try:
                         # 200 DPI é suficiente para OCR e muito mais rápido que 300
-                        image = page.to_image(resolution=200).original
-                        ocr_text = pytesseract.image_to_string(image, lang='por')
-                        text += ocr_text + "\n"
+                        pages.append(page_record(number, page.image(200), True))
                     except Exception:
-                        pass  # página sem texto e sem OCR disponível — ignora
-                # Se já temos dados suficientes da primeira página, não precisa
-                # gastar tempo com OCR em páginas adicionais
-                if text and 'CONSUMO' in text.upper():
+                        pages.append(page_record(number, None, True))  # não rasteriza
+                    if ocr_first:
+                        # Numa digitalização a página 1 costuma bastar: não paga o
+                        # tesseract das outras antes de saber
+                        _ocr_pending(pages, ocr_cache)
+                        ocr_first = False
+                else:
+                    pages.append(page_record(number, None, False))
+                # Se já temos a seção CONSUMO, não precisa ler as páginas
+                # seguintes. Com OCR pendente não dá para saber ainda: as
+                # páginas seguintes entram no lote.
+                pending = any(_awaiting_ocr(p) for p in pages)
+                if not all_pages and not pending and 'CONSUMO' in join_pages(pages).upper():
+                    break
+    except Exception as e:
+        return None, str(e)
+
+    _ocr_pending(pages, ocr_cache)
+    return pages, None
+
+
+def join_pages(pages):
+    """Texto que vai para o parsing: as páginas em ordem, até a que tem a seção CONSUMO."""
+    text = ''
+    for page in pages:
+        if page['texto'] is not None:
+            text += page['texto'] + "\n"
+        if text and 'CONSUMO' in text.upper():
+            break
+    return text
+
+
+def extract_text_from_pdf(pdf_path, ocr_cache=None, backend=None):
+    pages, error = extract_pages(pdf_path, ocr_cache, backend)
+    if error:
+        return None, error
+    return join_pages(pages), None
+
+
+# ==================== PADRÕES ====================
+# Todas as regex são compiladas uma única vez, na importação do módulo.
+
+# A UC pode vir pontuada ("3.235.881.012-93"), só com o hífen ("3235881012-93")
+# ou totalmente crua ("323588101293" / "10023560892"). As alternativas são testadas
+# nessa ordem: a pontuada precisa vir antes, senão "\d{6,15}" casaria só o "3" inicial.
+UC_PATTERN = (
+    r'(\d\s*\.\s*\d{3}\s*\.\s*\d{3}\s*\.\s*\d{3}\s*-\s*\d{2}'  # 3.235.881.012-93
+    r'|\d{10}\s*-\s*\d{2}'                                      # 3235881012-93
+    r'|\d{6,15})'                                               # 323588101293 / 10023560892
+)
+
+# Formato pontuado completo (12 dígitos em 4 grupos). Não colide com CPF
+# ("123.456.789-01" tem só 3 grupos) nem com CNPJ (que tem "/").
+UC_PONTUADA = r'\d\s*\.\s*\d{3}\s*\.\s*\d{3}\s*\.\s*\d{3}\s*-\s*\d{2}'
+
+# Rótulos que antecedem a UC conforme o layout da fatura.
+_UC_ANCHORS = [
+    r'RAMAL:\s*\d+\s*%',                    # layout 2026+ e intermediário
+    r'Consulte pela Chave de Acesso em:',   # layout antigo
+    r'UNIDADE\s+CONSUMIDORA\s*:?',          # variações com rótulo explícito
+    r'\bUC\s*:',
+]
+
+_MESES = r'(?:JAN|FEV|MAR|ABR|MAI|JUN|JUL|AGO|SET|OUT|NOV|DEZ)'
+
+PATTERNS = {
+    'cpf_cnpj': re.compile(r'CNPJ/CPF:\s*(\d{3}\.\d{3}\.\d{3}-\d{2}|\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})'),
+    'valor_total': re.compile(r'R\$[*]+([\d.,]+)'),
+    'saldo_kwh': re.compile(r'SALDO KWH:\s*([\d\.,]+)'),
+    'contribuicao': re.compile(r'CONTRIB\.\s+ILUM\.\s+P.BLICA\s+-\s+MUNICIPAL\s+([\d\.,]+)'),
+    'consumo_scee': re.compile(r'CONSUMO SCEE\s+kWh\s+([\d\.,]+)\s+([\d\.]+)'),
+    'injecao_scee': re.compile(r'INJE..O SCEE.*?kWh\s+([\d\.,]+)\s+([\d\.]+)'),
+    'consumo_nc': re.compile(r'CONSUMO N.O COMPENSADO.*?kWh\s+([\d\.,]+)\s+([\d\.]+)'),
+    'consumo_nc_sem_kwh': re.compile(r'CONSUMO N.O COMPENSADO.*?([\d]+\,[\d]+)'),
+    # DOTALL no texto original equivale ao antigo re.sub('\n', ' ') + ".*?"
+    'fio_b': re.compile(
+        r'PARC INJET S/DESC.*?kWh\s+[\d\.,]+\s+([\d\.,]+)\s+[\d\.,]+\s+([\d\.,]+)', re.DOTALL),
+    'adc_bandeira': re.compile(r'ADC BANDEIRA.*?\s([\d\.]+)$', re.MULTILINE),
+    'ciclo_geracao': re.compile(
+        r'GERA..O CICLO \((\d{1,2}/\d{4})\) KWH: UC\s+' + UC_PATTERN + r'\s*:\s*([\d\.\,]+)'),
+    'consumo_kwh': re.compile(r'ENERGIA ATIVA - KWH.*?(\d+)\s+(\d+)\s+([\d\.,]+)\s+(\d+)'),
+    'nome_apos_tensao': re.compile(r'Tens.o Nominal Disp:.*?\n(.*?)\n'),
+    'nome_antes_cpf': re.compile(r'\n([\w\s]+)\nCNPJ/CPF:'),
+    'nome_invalido': re.compile(r'^(RUA|AV|R\$|CEP|\d|CNPJ)', re.IGNORECASE),
+    'endereco_inicio': re.compile(r'(?:RUA|AV|AVENIDA|SETOR|QD|Q\.)', re.IGNORECASE),
+    'endereco_fim': re.compile(r'CEP:\s*\d{5,8}\s+[\w\s,]+?BRASIL', re.IGNORECASE),
+    'uc_ancoras': [re.compile(a + r'\s*\n?\s*' + UC_PATTERN, re.IGNORECASE) for a in _UC_ANCHORS],
+    'uc_pontuada': re.compile(UC_PONTUADA),
+    'mes_data_valor': re.compile(r'\b(' + _MESES + r'/\d{4})\s+(\d{2}/\d{2}/\d{4})\s+R\$'),
+    'mes_valor_data': re.compile(r'\b(' + _MESES + r'/\d{4})\s+R\$.*?(\d{2}/\d{2}/\d{4})'),
+    'mes_apos_cfop': re.compile(r'CFOP \d{4}:.*?\n(\w{3}/\d{4})\s+(\d{2}/\d{2}/\d{4})'),
+    'leituras': re.compile(r'(\d{2}/\d{2}/\d{4})\s+(\d{2}/\d{2}/\d{4})\s+(\d{1,3})\b'),
+}
+
+_RE_SPACES = re.compile(r'\s+')
+_RE_AFTER_BRASIL = re.compile(r'(BRASIL).*')
+_RE_NON_DIGIT = re.compile(r'\D')
+_RE_NON_NUMERIC = re.compile(r'[^\d.,-]')
+
+
+# ==================== ÍNDICE DE SEÇÕES ====================
+
+# Âncoras das seções da fatura e quantas linhas, a partir da âncora, cada
+# campo pode ocupar. Os matchers só rodam dentro dessas janelas.
+SECTION_ANCHORS = {
+    'consumo_scee': (r'CONSUMO SCEE', 2),
+    'injecao_scee': (r'INJE..O SCEE', 2),
+    'consumo_nc': (r'CONSUMO N.O COMPENSADO', 2),
+    'parc_injet': (r'PARC INJET S/DESC', 3),
+    'adc_bandeira': (r'ADC BANDEIRA', 1),
+    'geracao_ciclo': (r'GERA..O CICLO \(', 2),
+    'energia_ativa': (r'ENERGIA ATIVA - KWH', 2),
+    'cpf_cnpj': (r'CNPJ/CPF:', 2),
+    'tensao_nominal': (r'Tens.o Nominal Disp:', 2),
+}
+
+def _literal_prefix(anchor):
+    """Trecho literal inicial da âncora ("INJE..O SCEE" -> "INJE")."""
+    for i, ch in enumerate(anchor):
+        if ch in '.\\([?*+{|^$':
+            return anchor[:i]
+    return anchor
+
+
+_SECTION_PATTERNS = {
+    name: (_literal_prefix(anchor), re.compile(anchor))
+    for name, (anchor, _lines) in SECTION_ANCHORS.items()
+}
+
+
+class SectionIndex:
+    """
+    Posições das âncoras de seção, calculadas uma vez por documento e só
+    para as seções consultadas. Evita que cada campo percorra o documento
+    inteiro com ".*?" (e o backtracking que isso causa em textos longos ou
+    vindos de OCR).
+
+    Cada âncora é localizada pelo seu prefixo literal com str.find e só
+    então confirmada pela regex, o que sai mais barato que deixar o re
+    testar a âncora (ou uma alternação de todas elas) posição a posição.
+    """
+
+    __slots__ = ('text', '_offsets')
+
+    def __init__(self, text):
+        self.text = text
+        self._offsets = {}
+
+    def offsets(self, name):
+        offsets = self._offsets.get(name)
+        if offsets is None:
+            prefix, pattern = _SECTION_PATTERNS[name]
+            text = self.text
+            offsets = []
+            pos = text.find(prefix)
+            while pos != -1:
+                if pattern.match(text, pos):
+                    offsets.append(pos)
+                pos = text.find(prefix, pos + 1)
+            self._offsets[name] = offsets
+        return offsets
+
+    def has(self, name):
+        return bool(self.offsets(name))
+
+    def first(self, name):
+        offsets = self.offsets(name)
+        return offsets[0] if offsets else None
+
+    def windows(self, name):
+        """(início, fim) de cada ocorrência da âncora, cobrindo as linhas da seção."""
+        lines = SECTION_ANCHORS[name][1]
+        text = self.text
+        for start in self.offsets(name):
+            end = start
+            for _ in range(lines):
+                end = text.find('\n', end)
+                if end == -1:
+                    end = len(text)
                     break
+                end += 1
+            yield start, end
+
+    def search(self, pattern, name):
+        """Primeiro match do padrão que começa numa ocorrência da âncora."""
+        text = self.text
+        for start, end in self.windows(name):
+            match = pattern.match(text, start, end)
+            if match:
+                return match
+        return None
+
+
+def _index(text, index):
+    return index if index is not None else SectionIndex(text)
+
+
+# ==================== LAYOUTS ====================
+# A Equatorial Goiás emite dois layouts. O classificador olha só o cabeçalho
+# e cada layout tem a sua regex de UC e de mês/vencimento; o encadeamento de
+# fallbacks (_UC_ANCHORS, formatos 1/2 e CFOP) fica para o layout desconhecido.
+
+LAYOUT_ANTIGO = 'Modelo-Antigo'
+LAYOUT_NOVO = 'Modelo-Novo'
+LAYOUT_DESCONHECIDO = 'desconhecido'
+
+# O bloco da UC/nota fiscal fica nas primeiras ~1000 letras nos dois layouts
+LAYOUT_HEAD_CHARS = 2000
+
+LAYOUT_PATTERNS = {
+    # "PERDAS DE TRANSFORMAÇÃO / RAMAL: 0% 500031319" / "MAR/2026 R$***42,56 16/04/2026"
+    LAYOUT_NOVO: {
+        'uc': re.compile(r'RAMAL:[ \t]*\d+[ \t]*%[ \t]*' + UC_PATTERN),
+        'mes': PATTERNS['mes_valor_data'],
+    },
+    # "Consulte pela Chave de Acesso em:\n10038900210" / "MAR/2026 15/04/2026 R$***816,68"
+    LAYOUT_ANTIGO: {
+        'uc': re.compile(r'Consulte pela Chave de Acesso em:[ \t]*\n[ \t]*' + UC_PATTERN),
+        'mes': PATTERNS['mes_data_valor'],
+    },
+}
+
+
+def detect_layout(text):
+    """Classifica a fatura pelo cabeçalho: Modelo-Novo, Modelo-Antigo ou desconhecido."""
+    for layout, patterns in LAYOUT_PATTERNS.items():
+        if patterns['uc'].search(text, 0, LAYOUT_HEAD_CHARS):
+            return layout
+    return LAYOUT_DESCONHECIDO
+
+
+# ==================== REGIÕES DA PÁGINA 1 ====================
+# Faixas verticais (em pontos PDF, a partir do topo) onde ficam os campos que
+# o parser usa. Tudo abaixo do medidor (canhoto, boleto, PIX) é descartado.
+# As posições não dependem da altura da página (1211 ou 1290 pt), só do layout.
+
+# Cabeçalho (endereço, cliente, CNPJ/CPF, UC, mês/vencimento/valor): é o
+# mesmo nos dois layouts e é com ele que o layout é classificado.
+REGION_CABECALHO = (0, 300)
+
+PAGE_REGIONS = {
+    LAYOUT_ANTIGO: [
+        ('geracao', 300, 410),   # INFORMAÇÕES DO SCEE: GERAÇÃO CICLO, SALDO KWH
+        ('itens', 410, 675),     # CONSUMO/INJEÇÃO SCEE, PARC INJET, CONTRIB., TOTAL
+        ('medidor', 675, 715),   # ENERGIA ATIVA - KWH
+    ],
+    LAYOUT_NOVO: [
+        ('geracao', 300, 440),
+        ('itens', 440, 720),
+        ('medidor', 720, 760),
+    ],
+    LAYOUT_DESCONHECIDO: [
+        ('corpo', 300, 800),
+    ],
+}
+
+# Se algum destes faltar no texto recortado, relê a página inteira. O
+# precoFioB entra no cálculo (sem ele o fioB vira 0 e os valores com/sem
+# desconto saem errados sem erro nenhum).
+REGION_REQUIRED_FIELDS = ['unidadeConsumidora', 'mesReferencia', 'nomeCliente', 'precoFioB']
+
+
+def _region_text(chars, top, bottom):
+    """Texto dos caracteres cujo centro vertical cai na faixa [top, bottom)."""
+    return chars_to_text([c for c in chars if top <= (c['top'] + c['bottom']) / 2 < bottom])
+
+
+def extract_text_regions(pdf_path, backend=None):
+    """
+    Lê só a página 1 e extrai o texto apenas das regiões do layout detectado.
+    Retorna (texto, erro), como extract_text_from_pdf; texto vazio quando a
+    página não tem camada de texto (o chamador cai no caminho completo/OCR).
+    """
+    try:
+        with open_pages(pdf_path, backend, first_only=True) as pdf_pages:
+            page = next(pdf_pages, None)
+            chars = page.chars() if page is not None else None
+            if not chars:
+                return '', None
+            with stage('texto'):
+                header = _region_text(chars, *REGION_CABECALHO)
+                parts = [header]
+                for _name, top, bottom in PAGE_REGIONS[detect_layout(header)]:
+                    parts.append(_region_text(chars, top, bottom))
     except Exception as e:
         return None, str(e)
-    return text, None
+    return '\n'.join(part for part in parts if part) + '\n', None
+
+
+def _missing_region_fields(data, text):
+    """
+    True se o texto recortado não bastou. O consumoKwh é conferido na linha
+    do medidor do próprio texto: o extract_data_from_text cai no consumoScee
+    quando ela falta, então o campo nunca chega vazio.
+    """
+    return (bool(data['extractionErrors'])
+            or any(data.get(field) is None for field in REGION_REQUIRED_FIELDS)
+            or extract_consumo_kwh(text) is None)
+
+
+# ==================== OCR SOB DEMANDA ====================
+# Para páginas sem camada de texto: em vez de rasterizar e passar a página
+# inteira no tesseract, faz OCR do cabeçalho (que define o layout) e depois
+# só das regiões dos campos que ainda faltam.
+
+OCR_DPI = 200
+# Limiar da binarização (0-255) aplicada depois do autocontraste
+OCR_THRESHOLD = 170
+# Parâmetros que geram as faixas: entram na chave do cache de OCR
+OCR_SETTINGS = f'dpi={OCR_DPI}|threshold={OCR_THRESHOLD}'
+# Largura (pt) das faturas em que as faixas de PAGE_REGIONS foram medidas;
+# digitalizações com outro tamanho de página têm as faixas reescaladas.
+REFERENCE_PAGE_WIDTH = 909
+
+# Modo de segmentação do tesseract por região: o cabeçalho tem duas colunas
+# (cliente / nota fiscal), o resto é um bloco de linhas de tabela.
+REGION_PSM = {
+    'cabecalho': 3,
+    'geracao': 6,
+    'itens': 6,
+    'medidor': 6,
+    'corpo': 3,
+}
+
+# Campo -> região da página onde ele é impresso
+FIELD_REGIONS = {
+    'cpfCnpj': 'cabecalho',
+    'valorTotal': 'cabecalho',
+    'nomeCliente': 'cabecalho',
+    'endereco': 'cabecalho',
+    'unidadeConsumidora': 'cabecalho',
+    'mesReferencia': 'cabecalho',
+    'leituraAtual': 'cabecalho',
+    'saldoKwh': 'geracao',
+    'cicloGeracao': 'geracao',
+    'consumoScee': 'itens',
+    'energiaInjetada': 'itens',
+    'precoFioB': 'itens',
+    'contribuicaoIluminacao': 'itens',
+    'consumoKwh': 'medidor',
+}
+
+
+def _crop_band(image, page_width, top, bottom):
+    """Recorta e pré-processa a faixa [top, bottom) (em pt de referência) da página rasterizada."""
+    px_per_pt = image.width / page_width
+    scale = page_width / REFERENCE_PAGE_WIDTH
+    box = (0, int(top * scale * px_per_pt), image.width,
+           min(image.height, int(bottom * scale * px_per_pt)))
+    if box[3] <= box[1]:
+        return None
+    return preprocess(image.crop(box), OCR_THRESHOLD)
+
+
+def _ocr_bands(image, page_width, bands, use_cache=None):
+    """OCR de várias faixas (nome, top, bottom) da página, em paralelo; devolve os textos na ordem."""
+    engine = get_engine()
+    crops = [(name, _crop_band(image, page_width, top, bottom)) for name, top, bottom in bands]
+    # O psm muda por região: agrupa as faixas por psm e dispara cada grupo no pool
+    texts = {}
+    for psm in sorted({REGION_PSM[name] for name, _crop in crops}):
+        group = [(name, crop) for name, crop in crops if REGION_PSM[name] == psm and crop is not None]
+        results = engine.map([crop for _name, crop in group], psm=psm,
+                             settings=OCR_SETTINGS, use_cache=use_cache)
+        for (name, _crop), result in zip(group, results):
+            texts[name] = result
+    return [texts.get(name) or '' for name, _crop in crops]
+
+
+def _missing_ocr_regions(data, layout):
+    """Regiões (do layout) que ainda têm campo faltando."""
+    available = {name for name, _top, _bottom in PAGE_REGIONS[layout]}
+    regions = set()
+    for field, region in FIELD_REGIONS.items():
+        if data.get(field) is not None:
+            continue
+        if region != 'cabecalho' and region not in available:
+            region = 'corpo'
+        regions.add(region)
+    return regions
+
+
+def extract_fields_lazy_ocr(pdf_path, ocr_cache=None, backend=None):
+    """
+    Extração com OCR só onde falta campo. Usa a camada de texto da página 1
+    quando há; se faltar algo, rasteriza a página uma vez e faz OCR apenas
+    do cabeçalho e das faixas dos campos ainda ausentes.
+
+    Retorna (data, text, error) como extract_fields, ou None quando não dá
+    para resolver assim (sem OCR instalado, ou ainda faltando campo, como no
+    _missing_region_fields) — nesse caso o chamador usa o caminho completo.
+    """
+    try:
+        with open_pages(pdf_path, backend, first_only=True) as pdf_pages:
+            page = next(pdf_pages, None)
+            if page is None:
+                return None
+            chars = page.chars()
+            with stage('texto'):
+                text = chars_to_text(chars) if chars else ''
+            data = extract_data_from_text(text, pdf_path) if text else None
+            if data is not None and not _missing_region_fields(data, text):
+                return data, text, None
+            if not HAS_OCR:
+                return None
+
+            image = page.image(OCR_DPI)
+            parts = [text] if text else []
+            done = set()
+
+            if data is None or 'cabecalho' in _missing_ocr_regions(data, data['layout']):
+                top, bottom = REGION_CABECALHO
+                parts.extend(_ocr_bands(image, page.width, [('cabecalho', top, bottom)], ocr_cache))
+                done.add('cabecalho')
+                data = extract_data_from_text('\n'.join(parts), pdf_path)
+
+            # O layout vem do cabeçalho; daqui em diante só as faixas necessárias
+            missing = _missing_ocr_regions(data, data['layout']) - done
+            bands = [band for band in PAGE_REGIONS[data['layout']] if band[0] in missing]
+            if bands:
+                parts.extend(_ocr_bands(image, page.width, bands, ocr_cache))
+                done.update(name for name, _top, _bottom in bands)
+            if len(parts) > (1 if text else 0):
+                text = '\n'.join(parts)
+                data = extract_data_from_text(text, pdf_path)
+    except Exception:
+        return None  # PDF ilegível ou tesseract indisponível: o caminho completo reporta
+
+    # Mesmo critério do --regions: campo obrigatório ou erro de extração (ex.:
+    # Consumo SCEE na página 2) manda para o caminho completo, que lê todas
+    if _missing_region_fields(data, text):
+        return None
+    return data, text, None
 
 
-def extract_cpf_cnpj(text):
-    match = re.search(r'CNPJ/CPF:\s*(\d{3}\.\d{3}\.\d{3}-\d{2}|\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})', text)
+# ==================== CAMPOS ====================
+
+def extract_cpf_cnpj(text, index=None):
+    match = _index(text, index).search(PATTERNS['cpf_cnpj'], 'cpf_cnpj')
     return match.group(1) if match else None
 
 
 def extract_valor_total(text):
-    match = re.search(r'R\$[*]+([\d.,]+)', text)
+    match = PATTERNS['valor_total'].search(text)
     return match.group(1) if match else None
 
 
 def extract_balance(text):
-    match = re.search(r'SALDO KWH:\s*([\d\.,]+)', text)
+    match = PATTERNS['saldo_kwh'].search(text)
     if match:
         return match.group(1).strip().rstrip(',')
     return None
 
 
 def extract_contribuicao(text):
-    match = re.search(r'CONTRIB\.\s+ILUM\.\s+P.BLICA\s+-\s+MUNICIPAL\s+([\d\.,]+)', text)
+    match = PATTERNS['contribuicao'].search(text)
     return match.group(1) if match else "0"
 
 
-def extract_consumo_scee(text):
+def extract_consumo_scee(text, index=None):
     # Linha: "CONSUMO SCEE kWh 168,00 0,780764 ..."
-    match = re.search(r'CONSUMO SCEE\s+kWh\s+([\d\.,]+)\s+([\d\.]+)', text)
+    match = _index(text, index).search(PATTERNS['consumo_scee'], 'consumo_scee')
     if match:
         return match.group(1), match.group(2)
     return None, None
 
 
-def extract_injecao_scee(text):
+def extract_injecao_scee(text, index=None):
     # Primeira linha de injeção: "INJEÇÃO SCEE - UC xxx kWh 168,00 0,780764 ..."
-    match = re.search(r'INJE..O SCEE.*?kWh\s+([\d\.,]+)\s+([\d\.]+)', text)
+    match = _index(text, index).search(PATTERNS['injecao_scee'], 'injecao_scee')
     if match:
         return match.group(1), match.group(2)
     return None, None
 
 
-def extract_consumo_nao_compensado(text):
-    match = re.search(r'CONSUMO N.O COMPENSADO.*?kWh\s+([\d\.,]+)\s+([\d\.]+)', text)
+def extract_consumo_nao_compensado(text, index=None):
+    index = _index(text, index)
+    match = index.search(PATTERNS['consumo_nc'], 'consumo_nc')
     if match:
         return match.group(1), match.group(2)
     # sem kWh explícito
-    match = re.search(r'CONSUMO N.O COMPENSADO.*?([\d]+\,[\d]+)', text)
+    match = index.search(PATTERNS['consumo_nc_sem_kwh'], 'consumo_nc')
     if match:
         return match.group(1), None
     return "0", "0"
 
 
-def extract_fio_b(text):
+def extract_fio_b(text, index=None):
     """
     Linha (pode estar quebrada em duas):
     "PARC INJET S/DESC - 28,57% - UC xxx - GD\nII 2 kWh 168,00 0,175126 29,42 0,175126"
     Formato: kWh <quantidade> <precoFioB> <valor> <precoFioB_repetido>
     O preço do Fio B é o ÚLTIMO número da sequência.
     """
-    # Junta a linha quebrada (PARC INJET pode ter \n antes de "kWh")
-    normalized = re.sub(r'\n', ' ', text)
-    match = re.search(
-        r'PARC INJET S/DESC.*?kWh\s+[\d\.,]+\s+([\d\.,]+)\s+[\d\.,]+\s+([\d\.,]+)',
-        normalized
-    )
+    # O padrão é DOTALL, então a quebra de linha antes de "kWh" é aceita sem
+    # precisar copiar o texto inteiro trocando "\n" por espaço.
+    match = _index(text, index).search(PATTERNS['fio_b'], 'parc_injet')
     if match:
         return match.group(2)  # último valor = preço Fio B repetido
     return None
 
 
-def extract_adc_bandeira(text):
-    match = re.search(r'ADC BANDEIRA.*?\s([\d\.]+)$', text, re.MULTILINE)
+def extract_adc_bandeira(text, index=None):
+    match = _index(text, index).search(PATTERNS['adc_bandeira'], 'adc_bandeira')
     return match.group(1) if match else "0"
 
 
-def extract_ciclo_geracao(text):
+def extract_ciclo_geracao(text, index=None):
     # "GERAÇÃO CICLO (3/2026) KWH: UC 10040141363 : 8.765,98, UC ..."
     # A UC geradora pode vir pontuada ("3.235.881.012-93") ou crua.
-    match = re.search(
-        r'GERA..O CICLO \((\d{1,2}/\d{4})\) KWH: UC\s+' + UC_PATTERN + r'\s*:\s*([\d\.\,]+)',
-        text
-    )
+    match = _index(text, index).search(PATTERNS['ciclo_geracao'], 'geracao_ciclo')
     if match:
         return match.group(1), _normalize_uc(match.group(2)), match.group(3).strip().rstrip(',')
     return None, None, None
 
 
-def extract_client_name(text):
+def extract_consumo_kwh(text, index=None):
+    # Linha do medidor: "ENERGIA ATIVA - KWH ÚNICO 10966 11134 1,000000 168"
+    match = _index(text, index).search(PATTERNS['consumo_kwh'], 'energia_ativa')
+    return match.group(4) if match else None
+
+
+def extract_client_name(text, index=None):
+    index = _index(text, index)
     # Nome aparece após "Tensão Nominal Disp: xxx V..." na linha seguinte
-    match = re.search(r'Tens.o Nominal Disp:.*?\n(.*?)\n', text)
+    match = index.search(PATTERNS['nome_apos_tensao'], 'tensao_nominal')
     if match:
         candidate = match.group(1).strip()
-        if candidate and not re.match(r'^(RUA|AV|R\$|CEP|\d|CNPJ)', candidate, re.IGNORECASE):
-            return candidate
-    # Fallback: nome logo antes do CNPJ/CPF
-    match = re.search(r'\n([\w\s]+)\nCNPJ/CPF:', text)
-    if match:
-        candidate = match.group(1).strip()
-        if len(candidate) > 3:
+        if candidate and not PATTERNS['nome_invalido'].match(candidate):
             return candidate
+    # Fallback: nome logo antes do CNPJ/CPF (até 3 linhas acima do rótulo)
+    for start, _end in index.windows('cpf_cnpj'):
+        window_start = start
+        for _ in range(4):
+            window_start = text.rfind('\n', 0, window_start)
+            if window_start <= 0:
+                window_start = 0
+                break
+        match = PATTERNS['nome_antes_cpf'].search(text, window_start, start + len('CNPJ/CPF:'))
+        if match:
+            candidate = match.group(1).strip()
+            if len(candidate) > 3:
+                return candidate
+            return None
     return None
 
 
 def extract_address(text):
-    # Captura do primeiro "RUA/AV/..." até "BRASIL" na mesma sequência
-    match = re.search(r'((?:RUA|AV|AVENIDA|SETOR|QD|Q\.)[\s\S]*?CEP:\s*\d{5,8}\s+[\w\s,]+?BRASIL)', text, re.IGNORECASE)
-    if match:
-        # Remove quebras de linha e espaços extras, para no primeiro "BRASIL"
-        addr = re.sub(r'\s+', ' ', match.group(1)).strip()
-        # Corta tudo após "BRASIL" caso haja lixo colado
-        addr = re.sub(r'(BRASIL).*', r'\1', addr)
-        return addr
-    return None
+    """
+    Captura do primeiro "RUA/AV/..." até o primeiro "CEP: xxx ... BRASIL" depois dele.
+    Equivale a "(RUA|AV|...)[\s\S]*?CEP:...BRASIL", mas em duas buscas lineares:
+    o span preguiçoso testava o resto do documento a partir de cada início possível.
+    """
+    start = PATTERNS['endereco_inicio'].search(text)
+    if not start:
+        return None
+    end = PATTERNS['endereco_fim'].search(text, start.end())
+    if not end:
+        return None
+    # Remove quebras de linha e espaços extras, para no primeiro "BRASIL"
+    addr = _RE_SPACES.sub(' ', text[start.start():end.end()]).strip()
+    # Corta tudo após "BRASIL" caso haja lixo colado
+    addr = _RE_AFTER_BRASIL.sub(r'\1', addr)
+    return addr
 
 
 def _normalize_uc(uc):
     """Remove pontos, traços, espaços e zeros à esquerda. Retorna None se vazio."""
     if not uc:
         return None
-    digits = re.sub(r'\D', '', uc).lstrip('0')
+    digits = _RE_NON_DIGIT.sub('', uc).lstrip('0')
     return digits or None
 
 
-# A UC pode vir pontuada ("3.235.881.012-93"), só com o hífen ("3235881012-93")
-# ou totalmente crua ("323588101293" / "10023560892"). As alternativas são testadas
-# nessa ordem: a pontuada precisa vir antes, senão "\d{6,15}" casaria só o "3" inicial.
-UC_PATTERN = (
-    r'(\d\s*\.\s*\d{3}\s*\.\s*\d{3}\s*\.\s*\d{3}\s*-\s*\d{2}'  # 3.235.881.012-93
-    r'|\d{10}\s*-\s*\d{2}'                                      # 3235881012-93
-    r'|\d{6,15})'                                               # 323588101293 / 10023560892
-)
-
-# Formato pontuado completo (12 dígitos em 4 grupos). Não colide com CPF
-# ("123.456.789-01" tem só 3 grupos) nem com CNPJ (que tem "/").
-UC_PONTUADA = r'\d\s*\.\s*\d{3}\s*\.\s*\d{3}\s*\.\s*\d{3}\s*-\s*\d{2}'
-
-# Rótulos que antecedem a UC conforme o layout da fatura.
-_UC_ANCHORS = [
-    r'RAMAL:\s*\d+\s*%',                    # layout 2026+ e intermediário
-    r'Consulte pela Chave de Acesso em:',   # layout antigo
-    r'UNIDADE\s+CONSUMIDORA\s*:?',          # variações com rótulo explícito
-    r'\bUC\s*:',
-]
-
-
-def extract_uc(text):
+def extract_uc(text, layout=None):
     """
     Extrai a UC independente do formato em que a distribuidora imprimiu.
 
@@ -201,16 +818,25 @@ def extract_uc(text):
 
     Retorna sempre a UC normalizada (apenas dígitos, sem zeros à esquerda),
     para que qualquer uma das grafias acima resulte no mesmo valor.
+
+    Com o layout conhecido, faz só a busca daquele layout; os rótulos
+    alternativos ficam como fallback.
     """
-    for anchor in _UC_ANCHORS:
-        match = re.search(anchor + r'\s*\n?\s*' + UC_PATTERN, text, re.IGNORECASE)
+    if layout in LAYOUT_PATTERNS:
+        match = LAYOUT_PATTERNS[layout]['uc'].search(text, 0, LAYOUT_HEAD_CHARS)
+        uc = _normalize_uc(match.group(1)) if match else None
+        if uc:
+            return uc
+
+    for pattern in PATTERNS['uc_ancoras']:
+        match = pattern.search(text)
         if match:
             uc = _normalize_uc(match.group(1))
             if uc:
                 return uc
 
     # Sem rótulo reconhecido: aceita uma UC pontuada solta no documento.
-    match = re.search(UC_PONTUADA, text)
+    match = PATTERNS['uc_pontuada'].search(text)
     if match:
         return _normalize_uc(match.group(0))
 
@@ -227,32 +853,32 @@ def _to_title_case_month(mes_ref):
     return f"{mes[0].upper()}{mes[1:].lower()}/{ano}"
 
 
-def extract_reference_month_and_due_date(text):
+def extract_reference_month_and_due_date(text, layout=None):
     """
     Dois formatos possíveis na mesma linha:
     - "MAR/2026 15/04/2026 R$***816,68"  (data antes do valor)
     - "MAR/2026 R$***42,56 16/04/2026"   (data depois do valor)
     Ambos têm mês no formato MMM/YYYY.
     Retorna o mês em Title Case ("Mar/2026") para manter consistência com dados legados.
+    Com o layout conhecido, testa direto o formato daquele layout.
     """
+    if layout in LAYOUT_PATTERNS:
+        match = LAYOUT_PATTERNS[layout]['mes'].search(text)
+        if match:
+            return _to_title_case_month(match.group(1)), match.group(2)
+
     # Formato 1: MÊS/ANO  DATA  R$...
-    match = re.search(
-        r'\b((?:JAN|FEV|MAR|ABR|MAI|JUN|JUL|AGO|SET|OUT|NOV|DEZ)/\d{4})\s+(\d{2}/\d{2}/\d{4})\s+R\$',
-        text
-    )
+    match = PATTERNS['mes_data_valor'].search(text)
     if match:
         return _to_title_case_month(match.group(1)), match.group(2)
 
     # Formato 2: MÊS/ANO  R$...  DATA
-    match = re.search(
-        r'\b((?:JAN|FEV|MAR|ABR|MAI|JUN|JUL|AGO|SET|OUT|NOV|DEZ)/\d{4})\s+R\$.*?(\d{2}/\d{2}/\d{4})',
-        text
-    )
+    match = PATTERNS['mes_valor_data'].search(text)
     if match:
         return _to_title_case_month(match.group(1)), match.group(2)
 
     # Fallback antigo: após CFOP
-    match = re.search(r'CFOP \d{4}:.*?\n(\w{3}/\d{4})\s+(\d{2}/\d{2}/\d{4})', text)
+    match = PATTERNS['mes_apos_cfop'].search(text)
     if match:
         return _to_title_case_month(match.group(1)), match.group(2)
 
@@ -265,7 +891,7 @@ def extract_reading_info(text):
     Três ou quatro datas/números na mesma linha após "Tensão Nominal Disp".
     """
     # Busca linha com padrão: data data número [data_opcional]
-    match = re.search(r'(\d{2}/\d{2}/\d{4})\s+(\d{2}/\d{2}/\d{4})\s+(\d{1,3})\b', text)
+    match = PATTERNS['leituras'].search(text)
     if match:
         return match.group(1), match.group(2), match.group(3)
     return None, None, None
@@ -278,7 +904,7 @@ def sanitize_to_float(value):
         return float(value)
     if isinstance(value, str):
         try:
-            clean_value = re.sub(r'[^\d.,-]', '', value)
+            clean_value = _RE_NON_NUMERIC.sub('', value)
             if not clean_value:
                 return 0.0
             if '.' in clean_value and ',' in clean_value:
@@ -312,14 +938,19 @@ def format_to_br(value, decimals=2):
         return "0," + "0" * decimals
 
 
+@timed('regex')
 def extract_data_from_text(text, pdf_path):
     data = {
         'pdfPath': pdf_path,
         'extractionErrors': []
     }
+    # Uma varredura localiza todas as seções; cada campo busca só na sua janela
+    index = SectionIndex(text)
+    layout = detect_layout(text)
+    data['layout'] = layout
 
     try:
-        data['cpfCnpj'] = extract_cpf_cnpj(text)
+        data['cpfCnpj'] = extract_cpf_cnpj(text, index)
         if not data['cpfCnpj']:
             data['extractionErrors'].append('CPF/CNPJ')
     except Exception:
@@ -335,11 +966,11 @@ def extract_data_from_text(text, pdf_path):
         data['extractionErrors'].append('Valor Total')
 
     data['saldoKwh'] = extract_balance(text)
-    data['nomeCliente'] = extract_client_name(text)
+    data['nomeCliente'] = extract_client_name(text, index)
     data['endereco'] = extract_address(text)
-    data['unidadeConsumidora'] = extract_uc(text)
+    data['unidadeConsumidora'] = extract_uc(text, layout)
 
-    mes, venc = extract_reference_month_and_due_date(text)
+    mes, venc = extract_reference_month_and_due_date(text, layout)
     data['mesReferencia'] = mes
     data['dataVencimento'] = venc
 
@@ -355,7 +986,7 @@ def extract_data_from_text(text, pdf_path):
         data['extractionErrors'].append('Contribuição Iluminação')
 
     try:
-        consumo_scee, preco_compensada = extract_consumo_scee(text)
+        consumo_scee, preco_compensada = extract_consumo_scee(text, index)
         data['consumoScee'] = consumo_scee
         data['precoEnergiaCompensada'] = preco_compensada
         if not consumo_scee:
@@ -366,14 +997,13 @@ def extract_data_from_text(text, pdf_path):
 
     # consumoKwh — linha do medidor
     try:
-        match = re.search(r'ENERGIA ATIVA - KWH.*?(\d+)\s+(\d+)\s+([\d\.,]+)\s+(\d+)', text)
-        data['consumoKwh'] = match.group(4) if match else data.get('consumoScee')
+        data['consumoKwh'] = extract_consumo_kwh(text, index) or data.get('consumoScee')
     except Exception:
         data['consumoKwh'] = None
         data['extractionErrors'].append('Consumo kWh')
 
     try:
-        energia_inj, preco_inj = extract_injecao_scee(text)
+        energia_inj, preco_inj = extract_injecao_scee(text, index)
         data['energiaInjetada'] = energia_inj
         data['precoEnergiaInjetada'] = preco_inj
     except Exception:
@@ -381,7 +1011,7 @@ def extract_data_from_text(text, pdf_path):
         data['precoEnergiaInjetada'] = None
 
     try:
-        consumo_nc, preco_nc = extract_consumo_nao_compensado(text)
+        consumo_nc, preco_nc = extract_consumo_nao_compensado(text, index)
         data['consumoNaoCompensado'] = consumo_nc
         data['precoKwhNaoCompensado'] = preco_nc
     except Exception:
@@ -389,17 +1019,17 @@ def extract_data_from_text(text, pdf_path):
         data['precoKwhNaoCompensado'] = "0"
 
     try:
-        data['precoFioB'] = extract_fio_b(text)
+        data['precoFioB'] = extract_fio_b(text, index)
     except Exception:
         data['precoFioB'] = None
 
     try:
-        data['precoAdcBandeira'] = extract_adc_bandeira(text)
+        data['precoAdcBandeira'] = extract_adc_bandeira(text, index)
     except Exception:
         data['precoAdcBandeira'] = "0"
 
     try:
-        ciclo, uc_geradora, geracao = extract_ciclo_geracao(text)
+        ciclo, uc_geradora, geracao = extract_ciclo_geracao(text, index)
         data['cicloGeracao'] = ciclo
         data['ucGeradora'] = uc_geradora
         data['geracaoUltimoCiclo'] = geracao
@@ -411,69 +1041,727 @@ def extract_data_from_text(text, pdf_path):
     return data
 
 
+def derived_values(consumo_scee, preco_fio_b, valor_total, price_kwh, discount_percent):
+    """Fórmulas da fatura com desconto: (fioB, valorSemDesconto, valorComDesconto, economia, lucro)."""
+    fio_b_valor = consumo_scee * preco_fio_b
+    valor_sem_desconto = (consumo_scee * price_kwh) + valor_total - fio_b_valor
+    discount_multiplier = 1 - (discount_percent / 100)
+    valor_com_desconto = ((consumo_scee * price_kwh) * discount_multiplier) + valor_total - fio_b_valor
+    return (round(fio_b_valor, 2), round(valor_sem_desconto, 2), round(valor_com_desconto, 2),
+            round(valor_sem_desconto - valor_com_desconto, 2),
+            round(valor_com_desconto - valor_total, 2))
+
+
+@timed('calculo')
 def calculate_values(data, price_kwh, discount_percent):
     try:
         consumo_scee = sanitize_to_float(data.get('consumoScee', '0'))
         preco_fio_b = sanitize_to_float(data.get('precoFioB', '0'))
         valor_total = sanitize_to_float(data.get('valorTotal', '0'))
+        (data['fioB'], data['valorSemDesconto'], data['valorComDesconto'], data['economia'],
+         data['lucro']) = derived_values(consumo_scee, preco_fio_b, valor_total, price_kwh,
+                                         discount_percent)
+    except Exception as e:
+        data['calculationError'] = str(e)
+
+    return data
 
-        fio_b_valor = consumo_scee * preco_fio_b
-        data['fioB'] = round(fio_b_valor, 2)
 
-        valor_sem_desconto = (consumo_scee * price_kwh) + valor_total - fio_b_valor
-        data['valorSemDesconto'] = round(valor_sem_desconto, 2)
+PRICE_FIELDS = ['precoFioB', 'precoAdcBandeira', 'precoKwhNaoCompensado',
+                'precoEnergiaInjetada', 'precoEnergiaCompensada']
+MONETARY_FIELDS = ['valorTotal', 'contribuicaoIluminacao', 'fioB',
+                   'valorSemDesconto', 'valorComDesconto', 'economia', 'lucro']
+QUANTITY_FIELDS = ['consumoKwh', 'saldoKwh', 'energiaInjetada', 'consumoScee',
+                   'consumoNaoCompensado', 'geracaoUltimoCiclo']
 
-        discount_multiplier = 1 - (discount_percent / 100)
-        valor_com_desconto = ((consumo_scee * price_kwh) * discount_multiplier) + valor_total - fio_b_valor
-        data['valorComDesconto'] = round(valor_com_desconto, 2)
 
-        data['economia'] = round(valor_sem_desconto - valor_com_desconto, 2)
-        data['lucro'] = round(valor_com_desconto - valor_total, 2)
+@timed('formatacao')
+def format_output_fields(data):
+    """Formata os campos numéricos no padrão brasileiro esperado pelo Node."""
+    for field in PRICE_FIELDS:
+        if field in data and data[field] is not None:
+            data[field] = format_to_br(sanitize_to_float(data[field]), decimals=6)
 
-    except Exception as e:
-        data['calculationError'] = str(e)
+    for field in MONETARY_FIELDS + QUANTITY_FIELDS:
+        if field in data and data[field] is not None:
+            data[field] = format_to_br(sanitize_to_float(data[field]), decimals=2)
 
     return data
 
 
-def main():
-    parser = argparse.ArgumentParser(description='Extrai dados de faturas de energia em PDF')
-    parser.add_argument('pdf_path', help='Caminho do arquivo PDF')
-    parser.add_argument('--price-kwh', type=float, default=0.85, help='Preço do kWh')
-    parser.add_argument('--discount', type=float, default=25.0, help='Desconto percentual')
-    args = parser.parse_args()
+_DECIMALS = {**{field: 2 for field in MONETARY_FIELDS + QUANTITY_FIELDS},
+             **{field: 6 for field in PRICE_FIELDS}}
+
 
-    text, error = extract_text_from_pdf(args.pdf_path)
+@dataclasses.dataclass(slots=True)
+class FaturaRecord:
+    """
+    Fatura extraída com os campos numéricos já como float: cada valor é
+    convertido uma vez (from_extracted) e só vira string no formato
+    brasileiro na saída (to_dict). Os atributos têm os nomes das chaves do
+    JSON e estão na ordem em que elas saem.
+    """
+    pdfPath: str | None = None
+    extractionErrors: list = dataclasses.field(default_factory=list)
+    layout: str | None = None
+    cpfCnpj: str | None = None
+    valorTotal: float | None = None
+    saldoKwh: float | None = None
+    nomeCliente: str | None = None
+    endereco: str | None = None
+    unidadeConsumidora: str | None = None
+    mesReferencia: str | None = None
+    dataVencimento: str | None = None
+    leituraAnterior: str | None = None
+    leituraAtual: str | None = None
+    quantidadeDias: str | None = None
+    contribuicaoIluminacao: float | None = None
+    consumoScee: float | None = None
+    precoEnergiaCompensada: float | None = None
+    consumoKwh: float | None = None
+    energiaInjetada: float | None = None
+    precoEnergiaInjetada: float | None = None
+    consumoNaoCompensado: float | None = None
+    precoKwhNaoCompensado: float | None = None
+    precoFioB: float | None = None
+    precoAdcBandeira: float | None = None
+    cicloGeracao: str | None = None
+    ucGeradora: str | None = None
+    geracaoUltimoCiclo: float | None = None
+    fioB: float | None = None
+    valorSemDesconto: float | None = None
+    valorComDesconto: float | None = None
+    economia: float | None = None
+    lucro: float | None = None
+    calculationError: str | None = None
+    # Chaves que o record não conhece (ex.: cache de outra versão): saem como vieram
+    extras: dict = dataclasses.field(default_factory=dict)
+
+    @classmethod
+    def from_extracted(cls, data):
+        """Monta o record a partir do dict de extract_data_from_text (strings brasileiras)."""
+        record = cls()
+        for key, value in data.items():
+            if key in _DECIMALS:
+                setattr(record, key, None if value is None else sanitize_to_float(value))
+            elif key in _RECORD_FIELDS:
+                setattr(record, key, value)
+            else:
+                record.extras[key] = value
+        return record
+
+    @timed('calculo')
+    def calculate(self, price_kwh, discount_percent):
+        """Mesmo cálculo de calculate_values, direto sobre os floats."""
+        try:
+            (self.fioB, self.valorSemDesconto, self.valorComDesconto, self.economia,
+             self.lucro) = derived_values(self.consumoScee or 0.0, self.precoFioB or 0.0,
+                                          self.valorTotal or 0.0, price_kwh, discount_percent)
+        except Exception as e:
+            self.calculationError = str(e)
+        return self
+
+    @timed('formatacao')
+    def to_dict(self, numeric=False):
+        """
+        Dict de saída. numeric=False formata como format_output_fields
+        ("1.234,56"); numeric=True mantém os números (JSON numérico).
+        Campos calculados e calculationError só saem quando existem.
+        """
+        out = {}
+        for key in _RECORD_FIELDS:
+            value = getattr(self, key)
+            if value is None and key in _OPTIONAL_FIELDS:
+                continue
+            if value is not None and not numeric and key in _DECIMALS:
+                value = format_to_br(value, decimals=_DECIMALS[key])
+            out[key] = value
+        out.update(self.extras)
+        return out
+
+
+_RECORD_FIELDS = [f.name for f in dataclasses.fields(FaturaRecord) if f.name != 'extras']
+_OPTIONAL_FIELDS = {'fioB', 'valorSemDesconto', 'valorComDesconto', 'economia', 'lucro',
+                    'calculationError'}
+
+
+def extract_fields(pdf_path, regions=False, lazy_ocr=False, ocr_cache=None, backend=None):
+    """
+    extract_text_from_pdf + extract_data_from_text, sem cache.
+    Com regions=True tenta antes só as regiões da página 1 e volta para a
+    leitura completa se faltar algum campo. Com lazy_ocr=True o OCR (quando
+    necessário) é feito só nas regiões dos campos faltantes. ocr_cache
+    liga/desliga o cache do texto do OCR (None segue EXTRACT_CACHE); backend
+    escolhe a camada de texto (ver TEXT_BACKENDS, None = DEFAULT_TEXT_BACKEND).
+    Retorna (data, text, error).
+    """
+    if lazy_ocr:
+        result = extract_fields_lazy_ocr(pdf_path, ocr_cache, backend)
+        if result is not None:
+            return result
+
+    if regions:
+        text, error = extract_text_regions(pdf_path, backend)
+        if not error and text:
+            data = extract_data_from_text(text, pdf_path)
+            if not _missing_region_fields(data, text):
+                return data, text, None
+
+    text, error = extract_text_from_pdf(pdf_path, ocr_cache, backend)
     if error:
-        print(json.dumps({'success': False, 'error': f'Erro ao ler PDF: {error}'}))
-        sys.exit(1)
+        return None, None, f'Erro ao ler PDF: {error}'
     if not text:
-        print(json.dumps({'success': False, 'error': 'Não foi possível extrair texto do PDF'}))
-        sys.exit(1)
+        return None, None, 'Não foi possível extrair texto do PDF'
+    return extract_data_from_text(text, pdf_path), text, None
 
-    data = extract_data_from_text(text, args.pdf_path)
-    data = calculate_values(data, args.price_kwh, args.discount)
 
-    price_fields = ['precoFioB', 'precoAdcBandeira', 'precoKwhNaoCompensado',
-                    'precoEnergiaInjetada', 'precoEnergiaCompensada']
-    monetary_fields = ['valorTotal', 'contribuicaoIluminacao', 'fioB',
-                       'valorSemDesconto', 'valorComDesconto', 'economia', 'lucro']
-    quantity_fields = ['consumoKwh', 'saldoKwh', 'energiaInjetada', 'consumoScee',
-                       'consumoNaoCompensado', 'geracaoUltimoCiclo']
+def extraction_key(pdf_path, regions=False, lazy_ocr=False, backend=None):
+    """
+    Chave do cache de extração: hash do PDF + opções que mudam o resultado
+    (como o ocr_engine.image_key). regions/lazy_ocr/backend podem devolver
+    campos diferentes para o mesmo PDF; numeric não entra porque o cache
+    guarda o dict antes do _finish.
+    """
+    settings = (f'regions={bool(regions)}|lazy_ocr={bool(lazy_ocr)}|'
+                f'backend={backend or DEFAULT_TEXT_BACKEND}')
+    digest = hashlib.sha256(f'{sha256_file(pdf_path)}|{settings}'.encode())
+    return cache_key(digest.hexdigest(), EXTRACTOR_VERSION)
 
-    for field in price_fields:
-        if field in data and data[field] is not None:
-            data[field] = format_to_br(sanitize_to_float(data[field]), decimals=6)
 
-    for field in monetary_fields + quantity_fields:
-        if field in data and data[field] is not None:
-            data[field] = format_to_br(sanitize_to_float(data[field]), decimals=2)
+def extract_cached(pdf_path, regions=False, lazy_ocr=False, backend=None):
+    """
+    extract_fields com cache em disco, uma entrada por PDF e modo de
+    extração (ver extraction_key).
+    Retorna (data, error); o data vem sem os valores calculados, que dependem
+    do preço/desconto de cada chamada.
+    """
+    key = None
+    entry = None
+    cache = get_extraction_cache()
+    with stage('cache'):
+        try:
+            key = extraction_key(pdf_path, regions, lazy_ocr, backend)
+        except OSError:
+            pass  # deixa o pdfplumber reportar o erro de leitura
+        if key:
+            entry = cache.get(key)
+
+    if entry is not None:
+        note('cache', 'acerto')
+        data = entry['data']
+        data['pdfPath'] = pdf_path
+        return data, None
+
+    note('cache', 'falha')
+    data, text, error = extract_fields(pdf_path, regions, lazy_ocr, ocr_cache=True, backend=backend)
+    if error:
+        return None, error
+    if key:
+        with stage('cache'):
+            cache.put(key, {'version': EXTRACTOR_VERSION, 'text': text, 'data': data})
+    return data, None
+
+
+def process_pdf(pdf_path, price_kwh=0.85, discount=25.0, use_cache=None, regions=False,
+                lazy_ocr=False, backend=None, timings=False, numeric=False):
+    """
+    Extrai, calcula e formata os dados de uma fatura.
+    Retorna exatamente o dict que o main() imprime (inclusive nos erros).
+    use_cache=None segue a variável EXTRACT_CACHE (ligado por padrão);
+    regions=True lê só as regiões conhecidas da página 1 (ver PAGE_REGIONS);
+    lazy_ocr=True faz OCR só das regiões com campo faltando;
+    backend escolhe a camada de texto ('pdfium' ou 'pdfminer');
+    timings=True acrescenta o objeto "timings" (tempo por etapa, páginas,
+    OCR, pico de memória — ver timings.py), inclusive nos erros;
+    numeric=True emite os campos numéricos como números JSON em vez de
+    strings no formato brasileiro (ver FaturaRecord.to_dict).
+    """
+    if timings:
+        with recording() as recorder:
+            data = process_pdf(pdf_path, price_kwh, discount, use_cache, regions, lazy_ocr,
+                               backend, numeric=numeric)
+        data['timings'] = recorder.to_dict()
+        return data
+
+    if use_cache is None:
+        use_cache = cache_enabled()
+
+    if use_cache:
+        data, error = extract_cached(pdf_path, regions, lazy_ocr, backend)
+    else:
+        data, _text, error = extract_fields(pdf_path, regions, lazy_ocr, ocr_cache=False,
+                                              backend=backend)
+    if error:
+        return {'success': False, 'error': error}
+    return _finish(data, price_kwh, discount, numeric)
+
+
+def _finish(data, price_kwh, discount, numeric=False):
+    """Cálculos + formatação: a parte comum a process_pdf e process_stored."""
+    data = FaturaRecord.from_extracted(data).calculate(price_kwh, discount).to_dict(numeric)
 
     data['success'] = True
-    data['precoKwhUsado'] = format_to_br(args.price_kwh, decimals=6)
-    data['descontoUsado'] = args.discount
+    data['precoKwhUsado'] = price_kwh if numeric else format_to_br(price_kwh, decimals=6)
+    data['descontoUsado'] = discount
+    return data
+
+
+# ==================== TEXTO ARMAZENADO ====================
+
+def stored_document(pdf_path, backend=None, ocr_cache=None):
+    """
+    Lê todas as páginas do PDF e monta o documento de texto armazenado
+    (ver stored_text), com os campos extraídos agora para o --diff futuro.
+    Retorna (documento, erro).
+    """
+    pages, error = extract_pages(pdf_path, ocr_cache, backend, all_pages=True)
+    if error:
+        return None, f'Erro ao ler PDF: {error}'
+    text = join_pages(pages)
+    fields = extract_data_from_text(text, pdf_path) if text else None
+    layout = fields['layout'] if fields else LAYOUT_DESCONHECIDO
+    doc = make_document(pdf_path, pages, layout, backend or DEFAULT_TEXT_BACKEND,
+                        sha256_file(pdf_path), EXTRACTOR_VERSION, fields)
+    return doc, None
+
+
+def dump_text(inputs, output, backend=None, ocr_cache=None):
+    """Grava o texto armazenado de cada PDF em `output` (NDJSON; .gz; "-" = stdout)."""
+    total = failed = 0
+    with ArchiveWriter(output) as writer:
+        for pdf_path in expand_pdf_paths(inputs):
+            total += 1
+            try:
+                doc, error = stored_document(pdf_path, backend, ocr_cache)
+            except Exception as e:
+                doc, error = None, f'Erro ao processar PDF: {e}'
+            if error:
+                failed += 1
+                print(f'{pdf_path}: {error}', file=sys.stderr)
+                continue
+            writer.write(doc)
+    print(f'{total} PDFs lidos, {failed} com erro', file=sys.stderr)
+    return total, failed
+
+
+def parse_stored(doc):
+    """extract_data_from_text sobre o texto armazenado. Retorna (data, erro)."""
+    text = join_pages(doc['paginas'])
+    if not text:
+        return None, 'Não foi possível extrair texto do PDF'
+    return extract_data_from_text(text, doc.get('pdfPath')), None
+
+
+def process_stored(doc, price_kwh=0.85, discount=25.0, numeric=False):
+    """process_pdf a partir do texto armazenado, sem abrir o PDF."""
+    data, error = parse_stored(doc)
+    if error:
+        return {'success': False, 'error': error, 'pdfPath': doc.get('pdfPath')}
+    return _finish(data, price_kwh, discount, numeric)
+
+
+def run_from_text(sources, price_kwh, discount, stdout=sys.stdout, diff=False, numeric=False,
+                  output_format='ndjson'):
+    """
+    Reprocessa documentos de texto armazenado (arquivos, arquivos em lote ou
+    "-"), emitindo um registro por fatura, como o --batch.
+    Com diff=True emite só as faturas cujos campos (antes dos cálculos)
+    mudaram em relação aos gravados no documento: {"pdfPath", "alterados":
+    {campo: [antes, depois]}}.
+    """
+    writer = RecordWriter(stdout, output_format)
+    total = failed = changed = 0
+    fields_changed = {}
+    for source in sources:
+        for doc, error in iter_documents(source):
+            total += 1
+            if error:
+                failed += 1
+                record = {'success': False, 'error': error}
+            elif diff:
+                data, error = parse_stored(doc)
+                changes = diff_fields(doc.get('campos'), data if not error else {'error': error})
+                if not changes:
+                    continue
+                changed += 1
+                for field in changes:
+                    fields_changed[field] = fields_changed.get(field, 0) + 1
+                record = {'pdfPath': doc.get('pdfPath'),
+                          'versaoExtrator': [doc.get('versaoExtrator'), EXTRACTOR_VERSION],
+                          'alterados': changes}
+            else:
+                record = process_stored(doc, price_kwh, discount, numeric)
+                if not record['success']:
+                    failed += 1
+            writer.write(record)
+
+    print(f'{total} textos reprocessados, {failed} com erro', file=sys.stderr)
+    if diff:
+        print(f'  {changed} com campos alterados', file=sys.stderr)
+        for field, n in sorted(fields_changed.items(), key=lambda item: -item[1]):
+            print(f'  {field}: {n}', file=sys.stderr)
+    return total, failed
+
+
+def expand_pdf_paths(inputs):
+    """
+    Expande a lista de entradas do modo batch: arquivos, diretórios (varridos
+    recursivamente atrás de *.pdf) e globs. Mantém a ordem de entrada e
+    descarta duplicatas. Caminhos inexistentes são mantidos para que o erro
+    apareça no registro daquele arquivo.
+    """
+    seen = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            found = []
+            for root, _dirs, files in os.walk(item):
+                found.extend(os.path.join(root, f) for f in files if f.lower().endswith('.pdf'))
+            candidates = sorted(found)
+        elif glob.has_magic(item):
+            candidates = sorted(glob.glob(item, recursive=True))
+        else:
+            candidates = [item]
+
+        for path in candidates:
+            if path not in seen:
+                seen.add(path)
+                yield path
+
+
+def _process_one(pdf_path, price_kwh, discount, **options):
+    """process_pdf que nunca levanta exceção; usado pelo batch e pelo pool."""
+    try:
+        result = process_pdf(pdf_path, price_kwh, discount, **options)
+    except Exception as e:
+        result = {'success': False, 'error': f'Erro ao processar PDF: {e}'}
+    result.setdefault('pdfPath', pdf_path)
+    return result
+
+
+def _future_result(future, pdf_path):
+    """Resultado de um job do pool; falhas do próprio worker viram registro de erro."""
+    try:
+        return future.result()
+    except Exception as e:
+        return {'success': False, 'error': f'Erro no worker de extração: {e}', 'pdfPath': pdf_path}
+
+
+def iter_batch(pdf_paths, price_kwh=0.85, discount=25.0, **options):
+    """Processa os PDFs um a um, gerando um resultado assim que cada um termina."""
+    for pdf_path in pdf_paths:
+        yield _process_one(pdf_path, price_kwh, discount, **options)
+
+
+def iter_parallel(pdf_paths, price_kwh=0.85, discount=25.0, jobs=None,
+                  ordered=True, max_in_flight=None, max_tasks_per_child=None, **options):
+    """
+    Distribui os PDFs num pool de processos (pdfminer e OCR são CPU-bound).
 
+    - jobs: tamanho do pool (padrão: número de CPUs)
+    - ordered: True mantém a ordem de entrada; False entrega por conclusão
+    - max_in_flight: limite de jobs enviados e ainda não consumidos, para não
+      enfileirar milhares de caminhos/resultados na memória (padrão: 2 × jobs)
+    - max_tasks_per_child: recicla cada worker após N PDFs (vazamentos do pdfminer)
+    """
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+    jobs = jobs or os.cpu_count() or 1
+    max_in_flight = max(max_in_flight or jobs * 2, jobs)
+
+    with ProcessPoolExecutor(max_workers=jobs, max_tasks_per_child=max_tasks_per_child) as pool:
+        if ordered:
+            queue = deque()
+            for pdf_path in pdf_paths:
+                queue.append((pool.submit(_process_one, pdf_path, price_kwh, discount, **options), pdf_path))
+                if len(queue) >= max_in_flight:
+                    yield _future_result(*queue.popleft())
+            while queue:
+                yield _future_result(*queue.popleft())
+        else:
+            in_flight = {}
+            for pdf_path in pdf_paths:
+                in_flight[pool.submit(_process_one, pdf_path, price_kwh, discount, **options)] = pdf_path
+                if len(in_flight) >= max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield _future_result(future, in_flight.pop(future))
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield _future_result(future, in_flight.pop(future))
+
+
+def run_batch(inputs, price_kwh, discount, stdout=sys.stdout, jobs=1,
+              ordered=True, max_in_flight=None, max_tasks_per_child=None,
+              output_format='ndjson', **options):
+    """
+    Emite um registro por PDF (NDJSON ou msgpack enquadrado), sem parar nas
+    falhas individuais. Cada registro é gravado assim que fica pronto.
+    """
+    writer = RecordWriter(stdout, output_format)
+    pdf_paths = expand_pdf_paths(inputs)
+    if jobs == 1:
+        results = iter_batch(pdf_paths, price_kwh, discount, **options)
+    else:
+        results = iter_parallel(pdf_paths, price_kwh, discount, jobs=jobs, ordered=ordered,
+                                max_in_flight=max_in_flight,
+                                max_tasks_per_child=max_tasks_per_child, **options)
+
+    total = failed = 0
+    layouts = {}
+    for result in results:
+        total += 1
+        if not result['success']:
+            failed += 1
+        else:
+            stats = layouts.setdefault(result.get('layout', LAYOUT_DESCONHECIDO),
+                                       {'faturas': 0, 'comErros': 0})
+            stats['faturas'] += 1
+            if result.get('extractionErrors'):
+                stats['comErros'] += 1
+        writer.write(result)
+    print(f'{total} PDFs processados, {failed} com erro', file=sys.stderr)
+    for layout, stats in sorted(layouts.items()):
+        print(f'  {layout}: {stats["faturas"]} faturas, {stats["comErros"]} com campos faltando',
+              file=sys.stderr)
+    return total, failed
+
+
+# Faturas de exemplo do repositório: corpus padrão do --compare-backends
+SAMPLE_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                             'Faturas Exemplo')
+
+
+def compare_backends(inputs, backends=TEXT_BACKENDS, regions=False, lazy_ocr=False):
+    """
+    Extrai cada PDF com cada backend de texto (sem cache) e compara os campos.
+    Retorna o resumo com o tempo total por backend e a lista de divergências;
+    'identicos' só é True se todos os campos de todas as faturas baterem.
+    """
+    seconds = {backend: 0.0 for backend in backends}
+    mismatches = []
+    total = 0
+    for pdf_path in expand_pdf_paths(inputs):
+        total += 1
+        results = {}
+        for backend in backends:
+            start = time.perf_counter()
+            data, _text, error = extract_fields(pdf_path, regions, lazy_ocr, ocr_cache=False,
+                                                backend=backend)
+            seconds[backend] += time.perf_counter() - start
+            results[backend] = data if data is not None else {'error': error}
+
+        fields = sorted(set().union(*(r.keys() for r in results.values())))
+        for field in fields:
+            values = {backend: results[backend].get(field) for backend in backends}
+            if len({json.dumps(v, sort_keys=True) for v in values.values()}) > 1:
+                mismatches.append({'pdfPath': pdf_path, 'campo': field, 'valores': values})
+
+    summary = {
+        'faturas': total,
+        'segundos': {backend: round(value, 4) for backend, value in seconds.items()},
+        'divergencias': mismatches,
+        'identicos': not mismatches,
+    }
+    reference = seconds.get('pdfminer')
+    if reference:
+        summary['aceleracao'] = {backend: round(reference / value, 2)
+                                 for backend, value in seconds.items() if value}
+    return summary
+
+
+def handle_job(request, protocol='ndjson'):
+    """
+    Processa uma requisição do modo worker (linha JSON ou payload msgpack):
+    {"id": ..., "pdfPath": "...", "priceKwh": 0.85, "discount": 25,
+     "cache": true, "regions": false, "lazyOcr": false, "backend": "pdfium",
+     "timings": false, "numeric": false}
+    A resposta é o mesmo JSON do main(), acrescido do "id" da requisição.
+    """
+    job_id = None
+    try:
+        job = unpack(request) if protocol == 'msgpack' else loads(request)
+        job_id = job.get('id')
+        pdf_path = job['pdfPath']
+        price_kwh = float(job.get('priceKwh', 0.85))
+        discount = float(job.get('discount', 25.0))
+        use_cache = job.get('cache')
+        regions = bool(job.get('regions', False))
+        lazy_ocr = bool(job.get('lazyOcr', False))
+        backend = job.get('backend')
+        timings = bool(job.get('timings', False))
+        numeric = bool(job.get('numeric', False))
+        if backend is not None and backend not in TEXT_BACKENDS:
+            raise ValueError(f'backend de texto desconhecido: {backend}')
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return {'id': job_id, 'success': False,
+                'error': f'Requisição inválida: {str(e) or type(e).__name__}'}
+
+    try:
+        result = process_pdf(pdf_path, price_kwh, discount, use_cache=use_cache, regions=regions,
+                             lazy_ocr=lazy_ocr, backend=backend, timings=timings,
+                             numeric=numeric)
+    except Exception as e:
+        result = {'success': False, 'error': f'Erro ao processar PDF: {e}'}
+    result['id'] = job_id
+    return result
+
+
+def run_worker(stdin=sys.stdin, stdout=sys.stdout, protocol='ndjson'):
+    """
+    Modo residente: lê uma requisição por vez do stdin e responde uma por
+    requisição no stdout. As bibliotecas de PDF/OCR já foram importadas,
+    então cada job paga só a extração em si.
+
+    protocol='ndjson': uma linha JSON por mensagem (padrão).
+    protocol='msgpack': mensagens msgpack com prefixo de tamanho (ver serialization).
+    """
+    stdin = binary_stream(stdin)
+    writer = RecordWriter(stdout, protocol)
+    while True:
+        if protocol == 'msgpack':
+            try:
+                request = read_frame(stdin)
+            except ValueError as e:
+                # Enquadramento quebrado: não há como achar a próxima mensagem
+                writer.write({'id': None, 'success': False, 'error': f'Requisição inválida: {e}'})
+                break
+            if request is None:
+                break
+        else:
+            request = stdin.readline()
+            if not request:
+                break
+            if not request.strip():
+                continue
+        writer.write(handle_job(request, protocol))
+
+
+def serve_socket(socket_path):
+    """Mesmo protocolo do run_worker, servido num unix socket local."""
+    import signal
+    import socketserver
+
+    class JobHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                self.wfile.write(dumps(handle_job(line)) + b"\n")
+                self.wfile.flush()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    # SIGTERM vira SystemExit para o finally remover o socket
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    with socketserver.ThreadingUnixStreamServer(socket_path, JobHandler) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extrai dados de faturas de energia em PDF')
+    parser.add_argument('pdf_paths', nargs='*', metavar='pdf_path',
+                        help='Caminho do PDF (no modo --batch: arquivos, diretórios ou globs)')
+    parser.add_argument('--price-kwh', type=float, default=0.85, help='Preço do kWh')
+    parser.add_argument('--discount', type=float, default=25.0, help='Desconto percentual')
+    parser.add_argument('--worker', action='store_true',
+                        help='Modo residente: requisições JSON por linha no stdin')
+    parser.add_argument('--socket', metavar='PATH',
+                        help='Modo residente servindo o mesmo protocolo num unix socket')
+    parser.add_argument('--batch', action='store_true',
+                        help='Processa vários PDFs e emite um registro NDJSON por arquivo')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Processos em paralelo no modo --batch (0 = todas as CPUs)')
+    parser.add_argument('--unordered', action='store_true',
+                        help='Emite os registros por ordem de conclusão, não de entrada')
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help='Máximo de PDFs enviados ao pool e ainda não emitidos')
+    parser.add_argument('--max-tasks-per-child', type=int, default=None,
+                        help='Recicla cada processo do pool após N PDFs')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Ignora o cache de extração (sempre relê o PDF)')
+    parser.add_argument('--regions', action='store_true',
+                        help='Lê só as regiões conhecidas da página 1 (cai na página inteira se faltar campo)')
+    parser.add_argument('--lazy-ocr', action='store_true',
+                        help='Em PDFs sem texto, faz OCR só das regiões dos campos faltantes')
+    parser.add_argument('--backend', choices=TEXT_BACKENDS, default=None,
+                        help=f'Camada de texto/rasterização (padrão: {DEFAULT_TEXT_BACKEND})')
+    parser.add_argument('--timings', action='store_true',
+                        help='Inclui no JSON o objeto "timings" (tempo por etapa, páginas, OCR, memória)')
+    parser.add_argument('--compare-backends', action='store_true',
+                        help='Compara os campos extraídos por cada backend (padrão: Faturas Exemplo)')
+    parser.add_argument('--numeric', action='store_true',
+                        help='Campos numéricos como números JSON (sem o formato brasileiro "1.234,56")')
+    parser.add_argument('--dump-text', metavar='ARQUIVO',
+                        help='Grava o texto por página dos PDFs num arquivo NDJSON (.gz comprime, - = stdout)')
+    parser.add_argument('--from-text', action='store_true',
+                        help='Reprocessa textos armazenados: os argumentos passam a ser '
+                             'documentos/arquivos em lote (- = stdin)')
+    parser.add_argument('--diff', action='store_true',
+                        help='Com --from-text: emite só os campos que mudaram em relação aos armazenados')
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='ndjson',
+                        help='Registros do --batch/--from-text/--worker: NDJSON ou msgpack com '
+                             'prefixo de tamanho (requer o pacote msgpack)')
+    args = parser.parse_args()
+    try:
+        require_format(args.output_format)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.worker:
+        run_worker(protocol=args.output_format)
+        return
+    if args.socket:
+        serve_socket(args.socket)
+        return
+    if args.compare_backends:
+        summary = compare_backends(args.pdf_paths or [SAMPLE_CORPUS], regions=args.regions,
+                                   lazy_ocr=args.lazy_ocr)
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        if not summary['identicos']:
+            sys.exit(1)
+        return
+    if args.dump_text:
+        if not args.pdf_paths:
+            parser.error('informe ao menos um arquivo, diretório ou glob')
+        _total, failed = dump_text(args.pdf_paths, args.dump_text, backend=args.backend,
+                                   ocr_cache=False if args.no_cache else None)
+        if failed:
+            sys.exit(1)
+        return
+    if args.from_text:
+        run_from_text(args.pdf_paths or ['-'], args.price_kwh, args.discount, diff=args.diff,
+                      numeric=args.numeric, output_format=args.output_format)
+        return
+    if args.diff:
+        parser.error('--diff só vale com --from-text')
+    if args.batch:
+        if not args.pdf_paths:
+            parser.error('informe ao menos um arquivo, diretório ou glob')
+        run_batch(args.pdf_paths, args.price_kwh, args.discount, jobs=args.jobs,
+                  ordered=not args.unordered, max_in_flight=args.max_in_flight,
+                  max_tasks_per_child=args.max_tasks_per_child,
+                  use_cache=False if args.no_cache else None, regions=args.regions,
+                  lazy_ocr=args.lazy_ocr, backend=args.backend, timings=args.timings,
+                  numeric=args.numeric, output_format=args.output_format)
+        return
+    if len(args.pdf_paths) != 1:
+        parser.error('informe exatamente um pdf_path (ou use --batch)')
+
+    data = process_pdf(args.pdf_paths[0], args.price_kwh, args.discount,
+                       use_cache=False if args.no_cache else None, regions=args.regions,
+                       lazy_ocr=args.lazy_ocr, backend=args.backend, timings=args.timings,
+                       numeric=args.numeric)
     print(json.dumps(data, ensure_ascii=False))
+    if not data['success']:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
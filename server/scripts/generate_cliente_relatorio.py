@@ -1,25 +1,15 @@
 #!/usr/bin/env python3
 import sys
 import json
-import os
-import base64
 import locale
 
-from jinja2 import Environment, FileSystemLoader
-from weasyprint import HTML, CSS
+from render_resources import logo_base64, render_pdf
 
 try:
     locale.setlocale(locale.LC_ALL, 'pt_BR.UTF-8')
 except:
     locale.setlocale(locale.LC_ALL, '')
 
-template_dir = os.path.join(os.path.dirname(__file__), '..', 'templates')
-env = Environment(loader=FileSystemLoader(template_dir))
-
-def logo_to_base64(file_path):
-    with open(file_path, "rb") as image_file:
-        return f"data:image/png;base64,{base64.b64encode(image_file.read()).decode()}"
-
 def format_currency(value):
     try:
         num = float(value) if value else 0.0
@@ -35,12 +25,6 @@ def format_number(value):
         return "0,00"
 
 def generate_cliente_relatorio(data, output_path):
-    template = env.get_template('relatorio_cliente.html')
-    css_path = os.path.join(template_dir, 'styles.css')
-    logo_path = os.path.join(template_dir, 'logo.png')
-
-    logo_base64 = logo_to_base64(logo_path)
-
     economia_total = float(data.get('economiaTotal', 0) or 0)
     valor_sem_desconto_total = float(data.get('valorSemDescontoTotal', 0) or 0)
     valor_com_desconto_total = float(data.get('valorComDescontoTotal', 0) or 0)
@@ -58,7 +42,7 @@ def generate_cliente_relatorio(data, output_path):
         })
 
     template_data = {
-        'logo_base64': logo_base64,
+        'logo_base64': logo_base64(),
         'nome_cliente': data.get('nomeCliente', ''),
         'endereco_completo': data.get('enderecoCompleto', ''),
         'unidade_consumidora': data.get('unidadeConsumidora', ''),
@@ -71,14 +55,7 @@ def generate_cliente_relatorio(data, output_path):
         'num_meses': len(faturas_list),
     }
 
-    html_content = template.render(template_data)
-
-    HTML(string=html_content).write_pdf(
-        output_path,
-        stylesheets=[CSS(css_path)]
-    )
-
-    return output_path
+    return render_pdf('relatorio_cliente.html', template_data, output_path, stylesheets=('styles.css',))
 
 if __name__ == "__main__":
     if len(sys.argv) < 3:
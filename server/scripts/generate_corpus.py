@@ -0,0 +1,759 @@
+#!/usr/bin/env python3
+"""
+Gera um corpus sintético de faturas da Equatorial Goiás para testes de carga
+e de acurácia da extração, sem usar dados reais de clientes.
+
+Cada fatura é montada como uma lista de linhas posicionadas (topo, esquerda,
+tamanho, texto) copiando a geometria dos dois layouts reais, renderizada
+com o template templates/fatura_sintetica.html pelo WeasyPrint e gravada
+junto com um JSON de gabarito ("esperado": os campos como a extração os
+devolve, antes de calculate_values).
+
+Variações sorteadas por fatura (determinísticas pela --seed):
+    layout          Modelo-Antigo / Modelo-Novo
+    formato da UC   pontuada, com hífen, crua (12 dígitos), legada (11), curta (9)
+    GERAÇÃO CICLO   1 a 3 UCs geradoras, pontuadas ou cruas, com/sem
+                    EXCEDENTE RECEBIDO, quebrada em 1 a 3 linhas
+    páginas         1 a 3 (as extras com boleto/mensagens)
+    digitalizada    só imagem (rasterizada, levemente girada e com ruído)
+    não compensado  com/sem a linha CONSUMO NÃO COMPENSADO
+
+Uso:
+    python3 generate_corpus.py generate --out /tmp/corpus --count 5000 --jobs 4
+    python3 generate_corpus.py check --count 2000          # não precisa do WeasyPrint
+    python3 generate_corpus.py accuracy /tmp/corpus [--backend pdfminer]
+
+O "check" monta o texto de cada fatura pelo mesmo agrupamento em linhas do
+pdfplumber (chars_to_text) e confere se a extração devolve o gabarito:
+garante que o gerador e as regex concordam antes de renderizar milhares de
+PDFs. O "accuracy" roda a extração nos PDFs gerados e compara campo a campo.
+"""
+
+import os
+import sys
+import json
+import random
+import argparse
+import contextlib
+from statistics import NormalDist
+from concurrent.futures import ProcessPoolExecutor
+
+from jinja2 import Environment, FileSystemLoader
+from pdfplumber.utils import extract_text as chars_to_text
+
+from extract_fatura import (
+    LAYOUT_ANTIGO, LAYOUT_NOVO, TEXT_BACKENDS, extract_data_from_text, extract_fields,
+)
+
+# O WeasyPrint escreve um aviso no stdout quando falta o Pango
+with contextlib.redirect_stdout(sys.stderr):
+    try:
+        from weasyprint import HTML
+        HAS_WEASYPRINT = True
+    except (ImportError, OSError):
+        HAS_WEASYPRINT = False
+
+try:
+    import pypdfium2 as pdfium
+    from PIL import Image, ImageChops
+    HAS_RASTER = True
+except ImportError:
+    HAS_RASTER = False
+
+template_dir = os.path.join(os.path.dirname(__file__), '..', 'templates')
+env = Environment(loader=FileSystemLoader(template_dir), autoescape=True)
+
+# Tamanho das páginas (pt) de cada layout, medido nas faturas de exemplo
+PAGE_SIZES = {
+    LAYOUT_ANTIGO: (909, 1211),
+    LAYOUT_NOVO: (909, 1290),
+}
+
+UC_FORMATS = ('pontuada', 'hifen', 'crua', 'legada', 'curta')
+
+# Campos do gabarito (valores como a extração devolve, antes dos cálculos).
+# O endereço fica de fora: a extração inclui o que estiver entre a rua e o CEP.
+TRUTH_FIELDS = [
+    'layout', 'unidadeConsumidora', 'mesReferencia', 'dataVencimento', 'nomeCliente',
+    'cpfCnpj', 'valorTotal', 'saldoKwh', 'leituraAnterior', 'leituraAtual',
+    'quantidadeDias', 'contribuicaoIluminacao', 'consumoScee', 'consumoKwh',
+    'energiaInjetada', 'consumoNaoCompensado', 'precoFioB', 'cicloGeracao',
+    'ucGeradora', 'geracaoUltimoCiclo',
+]
+
+# Largura média estimada de um caractere (em "em") e folga mínima entre
+# blocos da mesma linha: se dois blocos se sobrepõem, os caracteres se
+# intercalam na extração.
+CHAR_EM = 0.65
+MIN_GAP = 4
+
+MESES = ['JAN', 'FEV', 'MAR', 'ABR', 'MAI', 'JUN', 'JUL', 'AGO', 'SET', 'OUT', 'NOV', 'DEZ']
+
+NOMES = ['ANA', 'BRUNO', 'CARLOS', 'DANIELA', 'EDUARDO', 'FERNANDA', 'GABRIEL', 'HELENA',
+         'IGOR', 'JULIANA', 'LUCAS', 'MARIA', 'NATALIA', 'OTAVIO', 'PAULA', 'RAFAEL',
+         'SILVIA', 'TIAGO', 'VANESSA', 'WILLIAN', 'JOSÉ', 'JOÃO', 'LUÍS', 'MÁRCIA']
+SOBRENOMES = ['ALVES', 'BARBOSA', 'CARDOSO', 'DIAS', 'FERREIRA', 'GOMES', 'LIMA', 'LOPES',
+              'MARTINS', 'MOREIRA', 'OLIVEIRA', 'PEREIRA', 'RIBEIRO', 'ROCHA', 'SANTOS',
+              'SILVA', 'SOUZA', 'TEIXEIRA', 'CONCEIÇÃO', 'ARAÚJO']
+EMPRESAS = ['SOL TECH ENERGIA SOLAR LTDA', 'MERCADO BOM PRECO LTDA', 'PADARIA PAO DOURADO ME',
+            'AUTO PECAS GOIAS LTDA', 'CLINICA VIDA E SAUDE LTDA', 'IGREJA BATISTA CENTRAL']
+RUAS = ['RUA G', 'RUA MORRINHOS', 'RUA PATOS DE MINAS', 'AV GOIAS', 'AVENIDA BRASIL',
+        'RUA 7', 'RUA DAS FLORES', 'AV PERIMETRAL']
+BAIRROS = ['VILA CANAA II', 'SETOR BELA VISTA', 'SETOR RODOVIARIO', 'CENTRO', 'JARDIM AMERICA',
+           'SETOR AEROPORTO', 'VILA NOVA']
+CIDADES = ['SAO LUIS DE MONTES BELOS', 'GOIANIA', 'ANAPOLIS', 'RIO VERDE', 'IPORA']
+CLASSES = [('B B1 RESIDENCIAL - RESIDENCIAL NORMAL CONVENCIONAL', 'MONOFÁSICO'),
+           ('B B1 RESIDENCIAL - RESIDENCIAL NORMAL CONVENCIONAL', 'BIFÁSICO'),
+           ('B B3 COMERCIAL OU SERVIÇOS E OUTRAS ATIVIDADES', 'TRIFÁSICO')]
+
+MENSAGENS = [
+    'PERÍODO DE REFERÊNCIA DA APURAÇÃO DOS INDICADORES DE CONTINUIDADE = {ciclo}. VRC = R$ {vrc}',
+    'CONFORME REN 1095/24 ANEEL, A PARTIR DE 01/04/26 O NÚMERO DA UC SERÁ PADRONIZADO EM TODO PAÍS.',
+    'CONFORME LEI FEDERAL 14.300/21, NO PERÍODO DE TRANSIÇÃO HAVERÁ COBRANÇA PARCIAL DA ENERGIA '
+    'ELETRICA COMPENSADA.',
+    'O FATURAMENTO DAS INSTALAÇÕES QUE RECEBEM CRÉDITOS DE GERAÇÃO DISTRIBUIDA FOI ADEQUADO A '
+    'PARTIR DE DEZ/24.',
+]
+
+
+# ==================== DADOS DA FATURA ====================
+
+def _br(value, decimals=2, thousands=True):
+    """1234.5 -> '1.234,50' (ou '1234,50' com thousands=False)."""
+    text = f'{value:,.{decimals}f}' if thousands else f'{value:.{decimals}f}'
+    return text.replace(',', 'X').replace('.', ',').replace('X', '.')
+
+
+def _uc(rng, fmt):
+    """Sorteia uma UC no formato pedido; devolve (impressa, normalizada)."""
+    if fmt == 'legada':
+        digits = '100' + ''.join(rng.choice('0123456789') for _ in range(8))
+    elif fmt == 'curta':
+        digits = str(rng.randint(100000000, 999999999))
+    else:
+        digits = str(rng.randint(10 ** 11, 10 ** 12 - 1))
+
+    if fmt == 'pontuada':
+        printed = f'{digits[0]}.{digits[1:4]}.{digits[4:7]}.{digits[7:10]}-{digits[10:]}'
+    elif fmt == 'hifen':
+        printed = f'{digits[:10]}-{digits[10:]}'
+    else:
+        printed = digits
+    return printed, digits.lstrip('0')
+
+
+def _cpf_cnpj(rng, empresa):
+    d = [str(rng.randint(0, 9)) for _ in range(14)]
+    if empresa:
+        return f'{"".join(d[:2])}.{"".join(d[2:5])}.{"".join(d[5:8])}/{"".join(d[8:12])}-{"".join(d[12:])}'
+    return f'{"".join(d[:3])}.{"".join(d[3:6])}.{"".join(d[6:9])}-{"".join(d[9:11])}'
+
+
+def _date(day, month, year):
+    return f'{day:02d}/{month:02d}/{year}'
+
+
+def random_bill(seed, index, scanned_ratio=0.1, multipage_ratio=0.3):
+    """Sorteia uma fatura completa (determinística por seed/índice)."""
+    rng = random.Random(f'{seed}-{index}')
+    layout = rng.choice([LAYOUT_ANTIGO, LAYOUT_NOVO])
+    uc_format = rng.choice(UC_FORMATS)
+    uc_printed, uc = _uc(rng, uc_format)
+
+    empresa = rng.random() < 0.2
+    if empresa:
+        nome = rng.choice(EMPRESAS)
+    else:
+        nome = ' '.join([rng.choice(NOMES)] + rng.sample(SOBRENOMES, rng.randint(1, 3)))
+
+    year = rng.choice([2025, 2026])
+    month = rng.randint(1, 12)
+    prev_month, prev_year = (month - 1, year) if month > 1 else (12, year - 1)
+    next_month, next_year = (month + 1, year) if month < 12 else (1, year + 1)
+    leitura_dia = rng.randint(1, 28)
+    dias = rng.randint(28, 33)
+
+    consumo = round(rng.uniform(80, 9000), 0)
+    geradoras = []
+    for _ in range(rng.choice([1, 1, 1, 2, 3])):
+        fmt = rng.choice(['crua', 'crua', 'legada', 'pontuada'])
+        printed, normalized = _uc(rng, fmt)
+        geradoras.append({
+            'impressa': printed,
+            'normalizada': normalized,
+            'geracao': round(rng.uniform(500, 20000), 2),
+            'excedente': round(rng.uniform(0, 8000), 2),
+        })
+    # A injeção de cada geradora soma o consumo compensado
+    restante = consumo
+    for i, geradora in enumerate(geradoras):
+        parte = restante if i == len(geradoras) - 1 else round(restante * rng.uniform(0.3, 0.7), 2)
+        geradora['injecao'] = parte
+        restante = round(restante - parte, 2)
+
+    nao_compensado = round(rng.uniform(10, 300), 0) if rng.random() < 0.25 else None
+    preco_kwh = round(rng.uniform(0.7, 0.95), 6)
+    preco_fio_b = round(rng.uniform(0.12, 0.25), 6)
+    contribuicao = round(rng.uniform(5, 80), 2)
+    valor_total = round(consumo * preco_fio_b + contribuicao
+                        + (nao_compensado or 0) * preco_kwh + rng.uniform(0, 30), 2)
+    leitura_anterior = rng.randint(1000, 90000)
+    ciclo_mes = month
+    scee_linhas = rng.choice([1, 2, 2, 3])
+
+    bill = {
+        'seed': seed,
+        'indice': index,
+        'layout': layout,
+        'ucFormato': uc_format,
+        'uc': uc_printed,
+        'nome': nome,
+        'cpfCnpj': _cpf_cnpj(rng, empresa),
+        'rua': f'{rng.choice(RUAS)}, Q. {rng.randint(1, 60)}, L. {rng.randint(1, 40)}, S/N',
+        'bairro': rng.choice(BAIRROS),
+        'cep': f'CEP: {rng.randint(74000000, 76999999)} {rng.choice(CIDADES)} GO BRASIL',
+        'classe': rng.choice(CLASSES),
+        'tensao': rng.choice([('220', '200,2', '231,0'), ('380', '348,0', '396,0')]),
+        'leituraAnterior': _date(leitura_dia, prev_month, prev_year),
+        'leituraAtual': _date(leitura_dia, month, year),
+        'proximaLeitura': _date(leitura_dia, next_month, next_year),
+        'dias': str(dias),
+        'mes': f'{MESES[month - 1]}/{year}',
+        'vencimento': _date(rng.randint(5, 25), next_month, next_year),
+        'valorTotal': _br(valor_total),
+        'notaFiscal': str(rng.randint(100000000, 199999999)),
+        'ciclo': f'{ciclo_mes}/{year}',
+        'geradoras': geradoras,
+        'comExcedente': rng.random() < 0.7,
+        'sceeLinhas': scee_linhas,
+        'saldo': _br(rng.uniform(0, 40000)),
+        'consumo': consumo,
+        'naoCompensado': nao_compensado,
+        'precoKwh': preco_kwh,
+        'precoFioB': preco_fio_b,
+        'contribuicao': _br(contribuicao),
+        'leituraMedidorAnterior': leitura_anterior,
+        'medidor': f'{rng.randint(10000000, 19999999)}-{rng.randint(0, 9)}',
+        'historico': [round(rng.uniform(0, 9000), 0) for _ in range(13)],
+        'paginas': rng.randint(2, 3) if rng.random() < multipage_ratio else 1,
+        'digitalizada': rng.random() < scanned_ratio,
+        'dpi': rng.choice([150, 200]),
+        'rotacao': round(rng.uniform(-0.4, 0.4), 2),
+    }
+    bill['esperado'] = _truth(bill)
+    return bill
+
+
+def _truth(bill):
+    first = bill['geradoras'][0]
+    mes, ano = bill['mes'].split('/')
+    return {
+        'layout': bill['layout'],
+        'unidadeConsumidora': _uc_digits(bill['uc']),
+        'mesReferencia': f'{mes[0]}{mes[1:].lower()}/{ano}',
+        'dataVencimento': bill['vencimento'],
+        'nomeCliente': bill['nome'],
+        'cpfCnpj': bill['cpfCnpj'],
+        'valorTotal': bill['valorTotal'],
+        'saldoKwh': bill['saldo'],
+        'leituraAnterior': bill['leituraAnterior'],
+        'leituraAtual': bill['leituraAtual'],
+        'quantidadeDias': bill['dias'],
+        'contribuicaoIluminacao': bill['contribuicao'],
+        'consumoScee': _br(bill['consumo'], thousands=False),
+        'consumoKwh': str(int(bill['consumo'])),
+        'energiaInjetada': _br(first['injecao'], thousands=False),
+        'consumoNaoCompensado': (_br(bill['naoCompensado'], thousands=False)
+                                 if bill['naoCompensado'] is not None else '0'),
+        'precoFioB': _br(bill['precoFioB'], decimals=6),
+        'cicloGeracao': bill['ciclo'],
+        'ucGeradora': first['normalizada'],
+        'geracaoUltimoCiclo': _br(first['geracao']),
+    }
+
+
+def _uc_digits(printed):
+    return ''.join(ch for ch in printed if ch.isdigit()).lstrip('0')
+
+
+# ==================== GEOMETRIA DOS LAYOUTS ====================
+
+def _item(top, left, text, size=6.5):
+    return {'top': top, 'left': left, 'text': text, 'size': size}
+
+
+def _scee_text(bill, max_chars=280):
+    """
+    Linha de INFORMAÇÕES DO SCEE, quebrada em bill['sceeLinhas'] pedaços
+    (ou mais, se algum passar de max_chars).
+    """
+    geracao = ', '.join(f'UC {g["impressa"]} : {_br(g["geracao"])}' for g in bill['geradoras'])
+    parts = [f'INFORMAÇÕES DO SCEE: GERAÇÃO CICLO ({bill["ciclo"]}) KWH: {geracao}']
+    if bill['comExcedente']:
+        parts.append('EXCEDENTE RECEBIDO KWH: ' + ', '.join(
+            f'UC {g["impressa"]} : {_br(g["excedente"])}' for g in bill['geradoras']))
+    parts += [f'CRÉDITO RECEBIDO KWH {_br(bill["consumo"])}', f'SALDO KWH: {bill["saldo"]}',
+              'SALDO A EXPIRAR EM 30 DIAS KWH: 0,00', 'SALDO A EXPIRAR EM 60 DIAS KWH: 0,00',
+              f'CADASTRO RATEIO GERAÇÃO: UC {bill["uc"]} = 0%']
+    # As quebras caem sempre depois de uma vírgula, como nas faturas reais
+    lines = max(1, min(bill['sceeLinhas'], len(parts)))
+    while True:
+        per_line = -(-len(parts) // lines)
+        text = [', '.join(parts[i:i + per_line]) + (',' if i + per_line < len(parts) else '')
+                for i in range(0, len(parts), per_line)]
+        if per_line == 1 or max(len(line) for line in text) <= max_chars:
+            return text
+        lines += 1
+
+
+def _items_table(bill, top, cols, step, label_size, split_parc):
+    """Tabela de itens (FORNECIMENTO ... BENEFÍCIO LÍQUIDO) a partir de `top`."""
+    kwh, qty, price, value, price2 = cols
+    items = []
+    y = top
+
+    def row(label, quantity, unit_price, amount, size=label_size):
+        items.extend([
+            _item(y, 34, label, size), _item(y, kwh, 'kWh'), _item(y, qty, quantity),
+            _item(y, price, _br(unit_price, decimals=6)), _item(y, value, amount),
+            _item(y, price2, _br(unit_price, decimals=6)),
+        ])
+
+    items.append(_item(y, 34, 'FORNECIMENTO', label_size))
+    y += step
+    row('CONSUMO SCEE', _br(bill['consumo'], thousands=False), bill['precoKwh'],
+        _br(bill['consumo'] * bill['precoKwh']))
+    y += step
+    items += [_item(y, 34, 'BENEFÍCIO TARIFÁRIO BRUTO SCEE', label_size),
+              _item(y, value, _br(bill['consumo'] * 0.25))]
+    y += step
+    for i, g in enumerate(bill['geradoras']):
+        row(f'INJEÇÃO SCEE - UC {g["impressa"]} - GD II {i + 2}', _br(g['injecao'], thousands=False),
+            bill['precoKwh'], '-' + _br(g['injecao'] * bill['precoKwh']))
+        y += step
+    if bill['naoCompensado'] is not None:
+        row('CONSUMO NÃO COMPENSADO', _br(bill['naoCompensado'], thousands=False),
+            bill['precoKwh'], _br(bill['naoCompensado'] * bill['precoKwh']))
+        y += step
+
+    first = bill['geradoras'][0]
+    label = f'PARC INJET S/DESC - 28,57% - UC {first["impressa"]} -'
+    if split_parc:
+        # Layout novo: o rótulo quebra e os números ficam na segunda linha
+        items.append(_item(y, 34, label + ' GD', label_size))
+        y += step
+        label = 'II 2'
+    row(label, _br(first['injecao'], thousands=False), bill['precoFioB'],
+        _br(first['injecao'] * bill['precoFioB']))
+    y += step
+
+    items.append(_item(y, 34, 'ITENS FINANCEIROS', label_size))
+    y += step
+    items += [_item(y, 34, 'CONTRIB. ILUM. PÚBLICA - MUNICIPAL', label_size),
+              _item(y, value, bill['contribuicao'])]
+    y += step
+    items += [_item(y, 34, 'BENEFÍCIO TARIFÁRIO LÍQUIDO SCEE', label_size),
+              _item(y, value, '-' + _br(bill['consumo'] * 0.25))]
+    return items, y + step
+
+
+def _history(bill, top, step, x):
+    items = [_item(top - 25, x - 115, 'MÊS/ANO   CONSUMO FATURADO(kWh)   DIAS   TIPOS DE FATURAMENTO', 5)]
+    for i, value in enumerate(bill['historico']):
+        y = top + i * step
+        items += [_item(y, x, _br(value, thousands=False), 6), _item(y, x + 32, '30', 6)]
+        if value:
+            items.append(_item(y, x + 50, 'LIDA', 6))
+    return items
+
+
+def _items_antigo(bill):
+    classe, fornecimento = bill['classe']
+    nominal, minimo, maximo = bill['tensao']
+    scee = _scee_text(bill)
+    items = [
+        _item(37, 695, 'ENDEREÇO DE ENTREGA:', 6),
+        _item(46, 695, bill['rua'], 5), _item(53, 695, bill['bairro'], 5),
+        _item(60, 695, bill['cep'], 5),
+        _item(90, 33, f'Classificação: {classe}', 6),
+        _item(90, 400, f'Tipo de fornecimento: {fornecimento}', 6),
+        _item(108, 33, f'Tensão Nominal Disp: {nominal} V          Lim Min: {minimo} V'
+                       f'          Lim Max: {maximo} V', 6),
+        _item(126, 33, bill['nome'], 7),
+        _item(135, 33, f'CNPJ/CPF: {bill["cpfCnpj"]}', 6),
+        _item(140, 562, bill['leituraAnterior']), _item(140, 647, bill['leituraAtual']),
+        _item(140, 745, bill['dias']), _item(140, 806, bill['proximaLeitura']),
+        _item(146, 33, bill['rua'], 6), _item(155, 33, bill['bairro'], 6),
+        _item(164, 33, bill['cep'], 6),
+        _item(174, 33, 'PERDAS DE TRANSFORMAÇÃO / RAMAL: 0%', 6),
+        _item(174, 612, f'NOTA FISCAL Nº {bill["notaFiscal"]} - SÉRIE 0', 5),
+        _item(195, 612, 'Consulte pela Chave de Acesso em:', 6),
+        _item(201, 384, bill['uc'], 7),
+        _item(207, 612, 'https://dfe-portal.svrs.rs.gov.br/NF3e/consulta', 5),
+        _item(244, 612, 'CFOP 5258: Venda de energia elétrica para não contribuinte', 5),
+        _item(254, 70, bill['mes'], 8), _item(254, 194, bill['vencimento'], 8),
+        _item(254, 343, 'R$' + bill['valorTotal'].rjust(15, '*'), 8),
+    ]
+    y = 304
+    for line in scee:
+        items.append(_item(y, 33, line, 4.5))
+        y += 8
+    for message in MENSAGENS[:2]:
+        items.append(_item(y, 33, message.format(ciclo=bill['ciclo'], vrc='13,75020'), 4.5))
+        y += 8
+
+    items += [_item(396, 666, 'PIS/PASEP   0   0,5442%   0', 5),
+              _item(409, 666, 'ICMS   0   19%   0', 5)]
+    table, _end = _items_table(bill, 409, (228, 267, 317, 380, 617), 11, 5.5, split_parc=False)
+    items += table
+    items += _history(bill, 484, 12, 804)
+    items += [
+        _item(642, 35, 'TOTAL', 6), _item(642, 383, bill['valorTotal'], 6),
+        _item(689, 35, bill['medidor'], 6), _item(689, 110, 'ENERGIA ATIVA - KWH', 6),
+        _item(689, 244, 'ÚNICO', 6),
+        _item(689, 308, str(bill['leituraMedidorAnterior'])),
+        _item(689, 370, str(bill['leituraMedidorAnterior'] + int(bill['consumo']))),
+        _item(689, 418, '1,000000'), _item(689, 483, str(int(bill['consumo']))),
+        _item(770, 33, 'A EQUATORIAL ENERGIA AGRADECE PELA PONTUALIDADE NO PAGAMENTO DE SUA FATURA', 6),
+    ]
+    return items + _payment_slip(bill, 900)
+
+
+def _items_novo(bill):
+    classe, fornecimento = bill['classe']
+    nominal, minimo, maximo = bill['tensao']
+    scee = _scee_text(bill)
+    items = [
+        _item(37, 715, 'ENDEREÇO DE ENTREGA:', 6),
+        _item(45, 715, bill['rua'], 5), _item(52, 715, bill['bairro'], 5),
+        _item(97, 22, f'Classificação: {classe}', 6),
+        _item(105, 303, f'Tipo de fornecimento: {fornecimento}', 6),
+        _item(116, 22, f'Tensão Nominal Disp: {nominal} V        Lim Min: {minimo} V'
+                       f'        Lim Max: {maximo} V', 6),
+        _item(129, 543, bill['leituraAnterior']), _item(129, 631, bill['leituraAtual']),
+        _item(129, 727, bill['dias']), _item(129, 804, bill['proximaLeitura']),
+        _item(141, 18, bill['nome'], 7),
+        _item(150, 18, f'CNPJ/CPF: {bill["cpfCnpj"]}', 6),
+        _item(159, 18, bill['rua'], 6), _item(169, 18, bill['bairro'], 6),
+        _item(179, 18, bill['cep'], 6),
+        _item(179, 610, f'NOTA FISCAL Nº {bill["notaFiscal"]} - SÉRIE 0', 5),
+        _item(187, 18, 'PERDAS DE TRANSFORMAÇÃO / RAMAL: 0%', 6),
+        _item(187, 349, bill['uc'], 7),
+        _item(208, 610, 'Consulte pela Chave de Acesso em:', 6),
+        _item(220, 610, 'https://dfe-portal.svrs.rs.gov.br/NF3e/consulta', 5),
+        _item(263, 610, 'CFOP 5258: Venda de energia elétrica para não contribuinte', 5),
+        _item(272, 48, bill['mes'], 8),
+        _item(272, 177, 'R$' + bill['valorTotal'].rjust(15, '*'), 8),
+        _item(272, 348, bill['vencimento'], 8),
+    ]
+    y = 323
+    for line in scee:
+        items.append(_item(y, 19, line, 4.5))
+        y += 8
+    for message in MENSAGENS:
+        items.append(_item(y, 19, message.format(ciclo=bill['ciclo'], vrc='13,75020'), 4.5))
+        y += 8
+
+    items += [_item(435, 650, 'PIS/PASEP   0   0,5442%   0', 5),
+              _item(445, 650, 'ICMS   0   19%   0', 5)]
+    table, _end = _items_table(bill, 445, (210, 247, 300, 371, 596), 10, 5.5, split_parc=True)
+    items += table
+    items += _history(bill, 535, 12, 803)
+    items += [
+        _item(683, 19, 'TOTAL', 6), _item(683, 370, bill['valorTotal'], 6),
+        _item(734, 18, bill['medidor'], 6), _item(734, 111, 'ENERGIA ATIVA - KWH', 6),
+        _item(734, 236, 'ÚNICO', 6),
+        _item(734, 319, str(bill['leituraMedidorAnterior'])),
+        _item(734, 388, str(bill['leituraMedidorAnterior'] + int(bill['consumo']))),
+        _item(734, 446, '1,000000'), _item(734, 535, str(int(bill['consumo']))),
+    ]
+    return items + _payment_slip(bill, 960)
+
+
+def _payment_slip(bill, top):
+    """Boleto no rodapé da página 1 (repete nome, CNPJ/CPF e endereço)."""
+    return [
+        _item(top, 33, 'PAGÁVEL EM QUALQUER BANCO', 6), _item(top, 600, bill['vencimento'], 6),
+        _item(top + 20, 33, 'EQUATORIAL GOIAS DISTRIBUIDORA DE ENERGIA S/A', 6),
+        _item(top + 20, 500, bill['uc'], 6), _item(top + 20, 600, bill['mes'], 6),
+        _item(top + 40, 33, f'R$ {bill["valorTotal"]}', 6),
+        _item(top + 60, 33, f'{bill["nome"]}   CNPJ/CPF: {bill["cpfCnpj"]}', 6),
+        _item(top + 70, 33, f'{bill["rua"]}   {bill["bairro"]}   {bill["cep"]}', 6),
+    ]
+
+
+def _extra_page(bill, number):
+    items = [_item(40, 33, f'PÁGINA {number} - DEMONSTRATIVO COMPLEMENTAR', 7)]
+    y = 70
+    for message in MENSAGENS * 3:
+        items.append(_item(y, 33, message.format(ciclo=bill['ciclo'], vrc='13,75020'), 5))
+        y += 12
+    return items
+
+
+def bill_pages(bill):
+    """Páginas da fatura: cada uma é a lista de linhas posicionadas."""
+    first = _items_antigo(bill) if bill['layout'] == LAYOUT_ANTIGO else _items_novo(bill)
+    return [first] + [_extra_page(bill, n) for n in range(2, bill['paginas'] + 1)]
+
+
+def check_geometry(pages, width):
+    """Levanta ValueError se dois blocos da mesma linha se sobrepõem ou passam da página."""
+    for number, items in enumerate(pages, 1):
+        rows = {}
+        for item in items:
+            rows.setdefault(item['top'], []).append(item)
+        for top, row in rows.items():
+            row.sort(key=lambda i: i['left'])
+            for a, b in zip(row, row[1:]):
+                end = a['left'] + len(a['text']) * a['size'] * CHAR_EM
+                if end + MIN_GAP > b['left']:
+                    raise ValueError(f'página {number}, topo {top}: "{a["text"]}" invade "{b["text"]}"')
+            last = row[-1]
+            if last['left'] + len(last['text']) * last['size'] * CHAR_EM > width:
+                raise ValueError(f'página {number}, topo {top}: "{last["text"]}" passa da página')
+
+
+def simulate_text(pages):
+    """
+    Texto que o pdfplumber extrairia da página 1: cada bloco vira caracteres
+    com posição e tudo passa pelo mesmo chars_to_text (agrupamento em linhas
+    por tolerância vertical, ordem por x).
+    """
+    chars = []
+    for item in pages[0]:
+        width = item['size'] * 0.55
+        for i, ch in enumerate(item['text']):
+            x0 = item['left'] + i * width
+            chars.append({'text': ch, 'x0': x0, 'x1': x0 + width, 'top': item['top'],
+                          'bottom': item['top'] + item['size'], 'doctop': item['top'],
+                          'upright': True})
+    return chars_to_text(chars) + '\n'
+
+
+def compare_fields(expected, data):
+    """Campos do gabarito que a extração errou: {campo: (esperado, extraído)}."""
+    data = data or {}
+    return {field: (value, data.get(field)) for field, value in expected.items()
+            if data.get(field) != value}
+
+
+# ==================== RENDERIZAÇÃO ====================
+
+def render_pdf(bill, output_path):
+    width, height = PAGE_SIZES[bill['layout']]
+    html = env.get_template('fatura_sintetica.html').render(
+        paginas=bill_pages(bill), largura=width, altura=height, nome_cliente=bill['nome'])
+    HTML(string=html).write_pdf(output_path)
+
+
+def _noise_table(sigma=40):
+    """
+    Byte uniforme -> pixel do ruído: o quantil da normal (média 128, desvio
+    sigma, como o Image.effect_noise) já com o limiar do ruído aplicado.
+    """
+    normal = NormalDist(128, sigma)
+    table = []
+    for u in range(256):
+        v = min(max(round(normal.inv_cdf((u + 0.5) / 256)), 0), 255)
+        table.append(min(v + 64, 255) if v > 128 else 255)
+    return table
+
+
+NOISE_TABLE = _noise_table()
+
+
+def scan_noise(size, rng):
+    """Ruído de digitalização tirado do rng (o effect_noise do PIL não aceita semente)."""
+    width, height = size
+    return Image.frombytes('L', size, rng.randbytes(width * height)).point(NOISE_TABLE)
+
+
+def rasterize_pdf(source, output_path, dpi, rotation, seed):
+    """
+    Versão "digitalizada": só imagem, em tons de cinza, levemente girada e
+    com ruído. O ruído vem de random.Random(seed): a mesma fatura sai igual
+    a cada geração.
+    """
+    rng = random.Random(seed)
+    doc = pdfium.PdfDocument(source)
+    try:
+        images = []
+        for page in doc:
+            image = page.render(scale=dpi / 72).to_pil().convert('L')
+            image = image.rotate(rotation, resample=Image.BILINEAR, fillcolor=255)
+            images.append(ImageChops.darker(image, scan_noise(image.size, rng)))
+    finally:
+        doc.close()
+    images[0].save(output_path, 'PDF', resolution=dpi, save_all=True, append_images=images[1:])
+
+
+def _generate_one(task):
+    out_dir, seed, index, scanned_ratio, multipage_ratio = task
+    bill = random_bill(seed, index, scanned_ratio, multipage_ratio)
+    name = f'fatura-{index:06d}'
+    pdf_path = os.path.join(out_dir, name + '.pdf')
+    try:
+        if bill['digitalizada']:
+            tmp = pdf_path + '.tmp.pdf'
+            render_pdf(bill, tmp)
+            try:
+                rasterize_pdf(tmp, pdf_path, bill['dpi'], bill['rotacao'], f'{seed}-{index}')
+            finally:
+                os.unlink(tmp)
+        else:
+            render_pdf(bill, pdf_path)
+    except Exception as e:
+        return {'arquivo': name + '.pdf', 'erro': str(e)}
+
+    truth = {
+        'arquivo': name + '.pdf',
+        'variante': {
+            'layout': bill['layout'],
+            'ucFormato': bill['ucFormato'],
+            'geradoras': len(bill['geradoras']),
+            'sceeLinhas': len(_scee_text(bill)),
+            'naoCompensado': bill['naoCompensado'] is not None,
+            'paginas': bill['paginas'],
+            'digitalizada': bill['digitalizada'],
+        },
+        'esperado': bill['esperado'],
+    }
+    with open(os.path.join(out_dir, name + '.json'), 'w', encoding='utf-8') as f:
+        json.dump(truth, f, ensure_ascii=False, indent=2)
+    return {'arquivo': name + '.pdf', 'variante': truth['variante']}
+
+
+def generate_corpus(out_dir, count, seed=0, jobs=1, scanned_ratio=0.1, multipage_ratio=0.3):
+    """Gera `count` faturas em out_dir; devolve o resumo (contagens por variante e erros)."""
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = [(out_dir, seed, i, scanned_ratio, multipage_ratio) for i in range(count)]
+    if jobs == 1:
+        results = map(_generate_one, tasks)
+    else:
+        executor = ProcessPoolExecutor(max_workers=jobs or None)
+        results = executor.map(_generate_one, tasks, chunksize=16)
+
+    summary = {'faturas': 0, 'erros': [], 'layouts': {}, 'digitalizadas': 0, 'multipagina': 0}
+    for result in results:
+        if 'erro' in result:
+            summary['erros'].append(result)
+            continue
+        variant = result['variante']
+        summary['faturas'] += 1
+        summary['layouts'][variant['layout']] = summary['layouts'].get(variant['layout'], 0) + 1
+        summary['digitalizadas'] += variant['digitalizada']
+        summary['multipagina'] += variant['paginas'] > 1
+        if summary['faturas'] % 500 == 0:
+            print(f'{summary["faturas"]}/{count} faturas', file=sys.stderr)
+    if jobs != 1:
+        executor.shutdown()
+    return summary
+
+
+# ==================== CONFERÊNCIA ====================
+
+def check_generator(count, seed=0):
+    """Confere gerador x extração sem renderizar (geometria + texto simulado)."""
+    failures = []
+    for index in range(count):
+        bill = random_bill(seed, index)
+        pages = bill_pages(bill)
+        try:
+            check_geometry(pages, PAGE_SIZES[bill['layout']][0])
+        except ValueError as e:
+            failures.append({'indice': index, 'geometria': str(e)})
+            continue
+        data = extract_data_from_text(simulate_text(pages), f'sintetica-{index}')
+        wrong = compare_fields(bill['esperado'], data)
+        if wrong:
+            failures.append({'indice': index, 'campos': wrong})
+    return {'faturas': count, 'falhas': failures, 'ok': not failures}
+
+
+def check_accuracy(corpus_dir, backend=None, lazy_ocr=False):
+    """Roda a extração em cada PDF do corpus e compara com o gabarito, campo a campo."""
+    fields = {field: {'certos': 0, 'total': 0} for field in TRUTH_FIELDS}
+    variants = {}
+    mismatches = []
+    total = 0
+    for name in sorted(os.listdir(corpus_dir)):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(corpus_dir, name), 'r', encoding='utf-8') as f:
+            truth = json.load(f)
+        pdf_path = os.path.join(corpus_dir, truth['arquivo'])
+        data, _text, error = extract_fields(pdf_path, lazy_ocr=lazy_ocr, ocr_cache=False,
+                                            backend=backend)
+        wrong = compare_fields(truth['esperado'], data)
+        total += 1
+        for field in truth['esperado']:
+            fields[field]['total'] += 1
+            fields[field]['certos'] += field not in wrong
+
+        key = ('digitalizada' if truth['variante']['digitalizada'] else truth['variante']['layout'])
+        stats = variants.setdefault(key, {'faturas': 0, 'corretas': 0})
+        stats['faturas'] += 1
+        stats['corretas'] += not wrong
+        if wrong:
+            mismatches.append({'arquivo': truth['arquivo'], 'erro': error, 'campos': wrong})
+
+    return {
+        'faturas': total,
+        'corretas': total - len(mismatches),
+        'porCampo': {field: round(s['certos'] / s['total'], 4) for field, s in fields.items()
+                     if s['total']},
+        'porVariante': variants,
+        'divergencias': mismatches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera e confere um corpus sintético de faturas')
+    parser.add_argument('command', choices=['generate', 'check', 'accuracy'])
+    parser.add_argument('corpus_dir', nargs='?', help='accuracy: diretório do corpus gerado')
+    parser.add_argument('--out', help='generate: diretório de saída')
+    parser.add_argument('--count', type=int, default=1000, help='Quantidade de faturas')
+    parser.add_argument('--seed', type=int, default=0, help='Semente (o corpus é reprodutível)')
+    parser.add_argument('--jobs', type=int, default=1, help='generate: processos (0 = todas as CPUs)')
+    parser.add_argument('--scanned-ratio', type=float, default=0.1,
+                        help='generate: fração de faturas só imagem')
+    parser.add_argument('--multipage-ratio', type=float, default=0.3,
+                        help='generate: fração de faturas com 2-3 páginas')
+    parser.add_argument('--backend', choices=TEXT_BACKENDS, default=None,
+                        help='accuracy: backend de texto da extração')
+    parser.add_argument('--lazy-ocr', action='store_true', help='accuracy: usa o OCR por regiões')
+    args = parser.parse_args()
+
+    if args.command == 'check':
+        result = check_generator(args.count, args.seed)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        if not result['ok']:
+            sys.exit(1)
+        return
+
+    if args.command == 'accuracy':
+        if not args.corpus_dir:
+            parser.error('accuracy exige o diretório do corpus')
+        print(json.dumps(check_accuracy(args.corpus_dir, args.backend, args.lazy_ocr),
+                         ensure_ascii=False, indent=2))
+        return
+
+    if not args.out:
+        parser.error('generate exige --out')
+    if not HAS_WEASYPRINT:
+        print(json.dumps({'success': False, 'error': 'WeasyPrint indisponível (pango/cairo instalados?)'}))
+        sys.exit(1)
+    if args.scanned_ratio > 0 and not HAS_RASTER:
+        print(json.dumps({'success': False, 'error': 'pypdfium2/pillow necessários para as digitalizadas'}))
+        sys.exit(1)
+    summary = generate_corpus(args.out, args.count, args.seed, args.jobs,
+                              args.scanned_ratio, args.multipage_ratio)
+    summary['success'] = not summary['erros']
+    print(json.dumps(summary, ensure_ascii=False))
+    if summary['erros']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,53 @@
 #!/usr/bin/env python3
+"""
+Gera o PDF da fatura com desconto (templates/fatura.html).
+
+Uso:
+    generate_pdf.py <json_data> <output_path>
+    generate_pdf.py --batch [arquivo|-]
+    generate_pdf.py --zip [arquivo|-] [saida.zip|-]
+    generate_pdf.py --combined [arquivo|-] <saida.pdf|->
+
+No modo --batch o lote (array JSON ou NDJSON; padrão: stdin) é gerado num
+único processo: WeasyPrint, template, CSS, fontes e logo são carregados uma
+vez para todas as faturas (ver render_resources). Cada item é o mesmo JSON do modo simples mais
+"outputPath" (obrigatório) e "id" (opcional). Um registro NDJSON por item é
+emitido assim que o PDF fica pronto ("cache": o PDF já gerado foi reaproveitado):
+    {"id": ..., "success": true, "path": "...", "cache": false, "concluidos": 3, "total": 300}
+Uma fatura com erro não interrompe o lote.
+
+No modo --zip o lote vira um único ZIP (padrão: no stdout), sem passar pelo
+disco: cada PDF é renderizado em memória e escrito direto como entrada do
+ZIP, sem compressão (ZIP_STORED; o PDF já vem comprimido). O nome da
+entrada é "filename" ou o nome de "outputPath"; com "outputPath" o PDF já
+gerado ali é reaproveitado (ver o cache de saída em render_resources). O
+progresso vai para o stderr, um registro JSON por item. Sai com código 1,
+sem escrever nada, se nenhuma fatura pôde ser gerada.
+
+No modo --combined o lote vira um único PDF, uma fatura após a outra, na
+ordem dos itens (para imprimir a usina/mês de uma vez): cada fatura passa
+pelo layout com o CSS e as fontes compartilhados e as páginas são juntadas
+numa só gravação. Com saída em arquivo, o resultado é o JSON do modo
+simples mais "faturas" e "erros" (itens pulados); com "-" o PDF vai para o
+stdout e o JSON para o stderr. A saída em arquivo usa o cache de saída.
+"""
+import os
 import sys
 import json
-import os
-import base64
+import time
 import locale
+import zipfile
 
-from jinja2 import Environment, FileSystemLoader
-from weasyprint import HTML, CSS
+from render_resources import (
+    cache_stats, logo_base64, render_combined_pdf, render_pdf, render_pdf_bytes,
+)
+from serialization import RecordWriter
 
 try:
     locale.setlocale(locale.LC_ALL, 'pt_BR.UTF-8')
 except:
     locale.setlocale(locale.LC_ALL, '')
 
-template_dir = os.path.join(os.path.dirname(__file__), '..', 'templates')
-env = Environment(loader=FileSystemLoader(template_dir))
-
-def logo_to_base64(file_path):
-    with open(file_path, "rb") as image_file:
-        return f"data:image/png;base64,{base64.b64encode(image_file.read()).decode()}"
-
 def format_currency(value):
     try:
         num = float(value) if value else 0.0
@@ -34,13 +62,7 @@ def format_number(value):
     except:
         return "0,00"
 
-def generate_invoice_pdf(data, output_path):
-    template = env.get_template('fatura.html')
-    css_path = os.path.join(template_dir, 'styles.css')
-    logo_path = os.path.join(template_dir, 'logo.png')
-    
-    logo_base64 = logo_to_base64(logo_path)
-    
+def invoice_template_data(data, debug=True):
     consumo_scee = float(data.get('consumoScee', 0) or 0)
     consumo_nao_compensado = float(data.get('consumoNaoCompensado', 0) or 0)
     valor_total = float(data.get('valorTotal', 0) or 0)
@@ -62,34 +84,35 @@ def generate_invoice_pdf(data, output_path):
     valor_calculado = energia_ativa_valor + taxa_minima
 
     # Debug: Mostrar cálculo da taxa mínima
-    print("=" * 60, file=sys.stderr)
-    print("DEBUG - CÁLCULO DA TAXA MÍNIMA", file=sys.stderr)
-    print("=" * 60, file=sys.stderr)
-    print(f"Valores recebidos:", file=sys.stderr)
-    print(f"  Consumo SCEE: {consumo_scee} kWh", file=sys.stderr)
-    print(f"  Consumo Não Compensado: {consumo_nao_compensado} kWh", file=sys.stderr)
-    print(f"  Valor Total: R$ {valor_total:.2f}", file=sys.stderr)
-    print(f"  Preço kWh: R$ {preco_kwh:.6f}", file=sys.stderr)
-    print(f"  Preço Fio B: R$ {preco_fio_b:.6f}", file=sys.stderr)
-    print(f"  Contribuição Iluminação: R$ {contribuicao_iluminacao:.2f}", file=sys.stderr)
-    print("", file=sys.stderr)
-    print(f"Cálculos intermediários:", file=sys.stderr)
-    print(f"  FIOB = Consumo SCEE × Preço Fio B", file=sys.stderr)
-    print(f"  FIOB = {consumo_scee} × {preco_fio_b:.6f} = R$ {fio_b_valor:.2f}", file=sys.stderr)
-    print(f"  Consumo Não Compensado × Preço kWh = {consumo_nao_compensado} × {preco_kwh:.6f} = R$ {consumo_nao_compensado_valor:.2f}", file=sys.stderr)
-    print("", file=sys.stderr)
-    print(f"Fórmula da Taxa Mínima:", file=sys.stderr)
-    print(f"  Taxa Mínima = Valor Total - (Consumo Não Compensado × Preço kWh + FIOB)", file=sys.stderr)
-    print(f"  Taxa Mínima = {valor_total:.2f} - ({consumo_nao_compensado_valor:.2f} + {fio_b_valor:.2f})", file=sys.stderr)
-    print(f"  Taxa Mínima = {valor_total:.2f} - {consumo_nao_compensado_valor + fio_b_valor:.2f}", file=sys.stderr)
-    print(f"  Taxa Mínima = R$ {taxa_minima:.2f}", file=sys.stderr)
-    print("=" * 60, file=sys.stderr)
-    print("", file=sys.stderr)
+    if debug:
+        print("=" * 60, file=sys.stderr)
+        print("DEBUG - CÁLCULO DA TAXA MÍNIMA", file=sys.stderr)
+        print("=" * 60, file=sys.stderr)
+        print(f"Valores recebidos:", file=sys.stderr)
+        print(f"  Consumo SCEE: {consumo_scee} kWh", file=sys.stderr)
+        print(f"  Consumo Não Compensado: {consumo_nao_compensado} kWh", file=sys.stderr)
+        print(f"  Valor Total: R$ {valor_total:.2f}", file=sys.stderr)
+        print(f"  Preço kWh: R$ {preco_kwh:.6f}", file=sys.stderr)
+        print(f"  Preço Fio B: R$ {preco_fio_b:.6f}", file=sys.stderr)
+        print(f"  Contribuição Iluminação: R$ {contribuicao_iluminacao:.2f}", file=sys.stderr)
+        print("", file=sys.stderr)
+        print(f"Cálculos intermediários:", file=sys.stderr)
+        print(f"  FIOB = Consumo SCEE × Preço Fio B", file=sys.stderr)
+        print(f"  FIOB = {consumo_scee} × {preco_fio_b:.6f} = R$ {fio_b_valor:.2f}", file=sys.stderr)
+        print(f"  Consumo Não Compensado × Preço kWh = {consumo_nao_compensado} × {preco_kwh:.6f} = R$ {consumo_nao_compensado_valor:.2f}", file=sys.stderr)
+        print("", file=sys.stderr)
+        print(f"Fórmula da Taxa Mínima:", file=sys.stderr)
+        print(f"  Taxa Mínima = Valor Total - (Consumo Não Compensado × Preço kWh + FIOB)", file=sys.stderr)
+        print(f"  Taxa Mínima = {valor_total:.2f} - ({consumo_nao_compensado_valor:.2f} + {fio_b_valor:.2f})", file=sys.stderr)
+        print(f"  Taxa Mínima = {valor_total:.2f} - {consumo_nao_compensado_valor + fio_b_valor:.2f}", file=sys.stderr)
+        print(f"  Taxa Mínima = R$ {taxa_minima:.2f}", file=sys.stderr)
+        print("=" * 60, file=sys.stderr)
+        print("", file=sys.stderr)
     
     tem_desconto = economia > 0
     
     template_data = {
-        'logo_base64': logo_base64,
+        'logo_base64': logo_base64(),
         'nome_cliente': data.get('nomeCliente', ''),
         'endereco_cliente': data.get('enderecoCliente', ''),
         'unidade_consumidora': data.get('unidadeConsumidora', ''),
@@ -106,18 +129,171 @@ def generate_invoice_pdf(data, output_path):
         'taxa_minima': format_currency(taxa_minima),
     }
     
-    html_content = template.render(template_data)
-    
-    HTML(string=html_content).write_pdf(
-        output_path,
-        stylesheets=[CSS(css_path)]
-    )
-    
-    return output_path
+    return template_data
+
+def generate_invoice_pdf(data, output_path, debug=True):
+    return render_pdf('fatura.html', invoice_template_data(data, debug), output_path,
+                      stylesheets=('styles.css',))
+
+def invoice_pdf_bytes(data, output_path=None, debug=False):
+    """PDF da fatura em memória: (bytes, veio_do_cache)."""
+    return render_pdf_bytes('fatura.html', invoice_template_data(data, debug),
+                            stylesheets=('styles.css',), output_path=output_path)
+
+def read_batch(source):
+    """Itens do lote: array JSON ou NDJSON, de um arquivo ou do stdin ("-")."""
+    if source == '-':
+        text = sys.stdin.read()
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            text = f.read()
+    text = text.strip()
+    if text.startswith('['):
+        items = json.loads(text)
+    else:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if not all(isinstance(item, dict) for item in items):
+        raise ValueError("cada item do lote deve ser um objeto JSON")
+    return items
+
+def generate_batch(items, stdout=sys.stdout, debug=False):
+    """Gera as faturas do lote, emitindo um registro por item; devolve (total, falhas)."""
+    writer = RecordWriter(stdout)
+    total = len(items)
+    failed = 0
+    for done, item in enumerate(items, 1):
+        result = {"id": item.get("id")}
+        try:
+            output_path = item["outputPath"]
+            hits = cache_stats["hits"]
+            result["path"] = generate_invoice_pdf(item, output_path, debug)
+            result["success"] = True
+            result["cache"] = cache_stats["hits"] > hits
+        except KeyError as e:
+            failed += 1
+            result["success"] = False
+            result["error"] = f"campo obrigatório ausente: {e}"
+        except Exception as e:
+            failed += 1
+            result["success"] = False
+            result["error"] = str(e)
+        result["concluidos"] = done
+        result["total"] = total
+        writer.write(result)
+    print(f"{total} faturas processadas, {failed} com erro, {cache_stats['hits']} do cache", file=sys.stderr)
+    return total, failed
+
+def _entry_name(item, used):
+    """Nome da entrada no ZIP, sem repetir nomes (fatura_x.pdf, fatura_x_2.pdf...)."""
+    name = item.get("filename") or os.path.basename(item["outputPath"])
+    base, ext = os.path.splitext(name)
+    n = 1
+    while name in used:
+        n += 1
+        name = f"{base}_{n}{ext}"
+    used.add(name)
+    return name
+
+def generate_zip(items, target, progress=sys.stderr, debug=False):
+    """
+    Renderiza o lote direto num ZIP em `target` (caminho ou stream binário).
+    O ZIP só é aberto na primeira fatura gerada. Devolve (total, falhas).
+    """
+    writer = RecordWriter(progress)
+    archive = None
+    used = set()
+    total = len(items)
+    failed = 0
+    try:
+        for done, item in enumerate(items, 1):
+            result = {"id": item.get("id")}
+            try:
+                name = _entry_name(item, used)
+                pdf, from_cache = invoice_pdf_bytes(item, item.get("outputPath"), debug)
+                if archive is None:
+                    archive = zipfile.ZipFile(target, "w", compression=zipfile.ZIP_STORED)
+                info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+                info.compress_type = zipfile.ZIP_STORED
+                archive.writestr(info, pdf)
+                result.update(success=True, filename=name, bytes=len(pdf), cache=from_cache)
+            except KeyError as e:
+                failed += 1
+                result.update(success=False, error=f"campo obrigatório ausente: {e}")
+            except Exception as e:
+                failed += 1
+                result.update(success=False, error=str(e))
+            result["concluidos"] = done
+            result["total"] = total
+            writer.write(result)
+    finally:
+        if archive is not None:
+            archive.close()
+    return total, failed
+
+def generate_combined(items, output_path=None, debug=False):
+    """
+    Todas as faturas do lote num único PDF. Itens com dados inválidos são
+    pulados e listados em "erros". Devolve (bytes do PDF, resultado).
+    """
+    pages_data = []
+    errors = []
+    for item in items:
+        try:
+            pages_data.append(invoice_template_data(item, debug))
+        except Exception as e:
+            errors.append({"id": item.get("id"), "error": str(e)})
+    if not pages_data:
+        raise ValueError("nenhuma fatura válida no lote")
+    pdf, from_cache = render_combined_pdf('fatura.html', pages_data, stylesheets=('styles.css',),
+                                          output_path=output_path)
+    result = {"success": True, "faturas": len(pages_data), "cache": from_cache, "erros": errors}
+    if output_path is not None:
+        result["path"] = output_path
+    return pdf, result
 
 if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "--combined":
+        if len(sys.argv) < 4:
+            print(json.dumps({"error": "Usage: generate_pdf.py --combined <arquivo|-> <saida.pdf|->"}))
+            sys.exit(1)
+        to_stdout = sys.argv[3] == "-"
+        report = sys.stderr if to_stdout else sys.stdout
+        try:
+            items = read_batch(sys.argv[2])
+            pdf, result = generate_combined(items, None if to_stdout else sys.argv[3])
+        except Exception as e:
+            print(json.dumps({"error": str(e)}), file=report)
+            sys.exit(1)
+        if to_stdout:
+            sys.stdout.buffer.write(pdf)
+            sys.stdout.buffer.flush()
+        print(json.dumps(result, ensure_ascii=False), file=report)
+        sys.exit(0)
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "--zip":
+        try:
+            items = read_batch(sys.argv[2] if len(sys.argv) > 2 else "-")
+        except (OSError, ValueError) as e:
+            print(json.dumps({"error": f"Lote inválido: {e}"}), file=sys.stderr)
+            sys.exit(1)
+        output = sys.argv[3] if len(sys.argv) > 3 else "-"
+        total, failed = generate_zip(items, sys.stdout.buffer if output == "-" else output)
+        if output == "-":
+            sys.stdout.buffer.flush()
+        print(f"{total} faturas no lote, {failed} com erro, {cache_stats['hits']} do cache", file=sys.stderr)
+        sys.exit(1 if failed == total else 0)
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "--batch":
+        try:
+            items = read_batch(sys.argv[2] if len(sys.argv) > 2 else "-")
+        except (OSError, ValueError) as e:
+            print(json.dumps({"error": f"Lote inválido: {e}"}))
+            sys.exit(1)
+        generate_batch(items)
+        sys.exit(0)
+
     if len(sys.argv) < 3:
-        print(json.dumps({"error": "Usage: generate_pdf.py <json_data> <output_path>"}))
+        print(json.dumps({"error": "Usage: generate_pdf.py <json_data> <output_path> | --batch [arquivo|-]"}))
         sys.exit(1)
     
     try:
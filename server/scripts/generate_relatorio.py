@@ -1,19 +1,9 @@
 #!/usr/bin/env python3
 import sys
 import json
-import os
-import base64
 from datetime import datetime
 
-from jinja2 import Environment, FileSystemLoader
-from weasyprint import HTML, CSS
-
-template_dir = os.path.join(os.path.dirname(__file__), '..', 'templates')
-env = Environment(loader=FileSystemLoader(template_dir))
-
-def logo_to_base64(file_path):
-    with open(file_path, "rb") as image_file:
-        return f"data:image/png;base64,{base64.b64encode(image_file.read()).decode()}"
+from render_resources import logo_base64, render_pdf
 
 def format_currency(value):
     """Format number as Brazilian currency (1.234,56)"""
@@ -38,11 +28,6 @@ def format_number(value):
         return "0"
 
 def generate_relatorio_pdf(data, output_path):
-    template = env.get_template('relatorio_usina.html')
-    logo_path = os.path.join(template_dir, 'logo.png')
-    
-    logo_base64 = logo_to_base64(logo_path)
-    
     clientes_data = []
     total_consumo = 0
     total_valor_com_desconto = 0
@@ -114,7 +99,7 @@ def generate_relatorio_pdf(data, output_path):
         })
 
     template_data = {
-        'logo_base64': logo_base64,
+        'logo_base64': logo_base64(),
         'nome_usina': data.get('nomeUsina', ''),
         'potencia_kwp': format_number(potencia_kwp) if potencia_kwp > 0 else '-',
         'kwh_previsto_mensal': format_number(kwh_previsto_mensal) if kwh_previsto_mensal > 0 else '-',
@@ -136,11 +121,7 @@ def generate_relatorio_pdf(data, output_path):
         'data_emissao': datetime.now().strftime('%d/%m/%Y às %H:%M'),
     }
     
-    html_content = template.render(template_data)
-    
-    HTML(string=html_content).write_pdf(output_path)
-    
-    return output_path
+    return render_pdf('relatorio_usina.html', template_data, output_path)
 
 if __name__ == "__main__":
     if len(sys.argv) < 3:
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+OCR das faturas digitalizadas.
+
+Mantém um pequeno pool de instâncias do tesseract residentes (via tesserocr,
+que usa a API C e recebe a imagem em memória) e distribui as imagens num
+pool de threads: o reconhecimento roda fora do GIL, então as páginas de uma
+digitalização são processadas em paralelo e a latência fica próxima à da
+página mais lenta, não à soma de todas.
+
+Sem o tesserocr instalado (pip install tesserocr), cai no pytesseract, que
+sobe um processo tesseract por imagem; as threads continuam valendo, já que
+o trabalho acontece no subprocesso.
+
+O texto de cada imagem fica em cache (namespace "ocr" do DiskCache),
+endereçado pelo hash do raster + idioma, psm e parâmetros do chamador (DPI,
+pré-processamento): a mesma digitalização reenviada — mesmo regravada em
+outro PDF — não passa de novo pelo tesseract.
+"""
+
+import os
+import queue
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from extract_cache import DiskCache, cache_enabled, cache_key
+from timings import count, stage
+
+try:
+    from PIL import ImageOps
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+
+try:
+    from tesserocr import PyTessBaseAPI
+    HAS_TESSEROCR = HAS_PIL
+except ImportError:
+    HAS_TESSEROCR = False
+
+try:
+    import pytesseract
+    HAS_PYTESSERACT = HAS_PIL
+except ImportError:
+    HAS_PYTESSERACT = False
+
+HAS_OCR = HAS_TESSEROCR or HAS_PYTESSERACT
+BACKEND = 'tesserocr' if HAS_TESSEROCR else 'pytesseract'
+
+# Versão do OCR: entra na chave do cache; incrementar ao mudar algo que
+# altere o texto reconhecido e não esteja nos parâmetros da chave.
+OCR_VERSION = '1'
+
+OCR_LANG = 'por'
+# Modo de segmentação padrão do tesseract (segmentação automática)
+DEFAULT_PSM = 3
+OCR_THREADS = int(os.environ.get('OCR_THREADS', '0')) or min(4, os.cpu_count() or 1)
+
+
+def preprocess(image, threshold):
+    """Tons de cinza + autocontraste + binarização: menos ruído para o tesseract."""
+    gray = ImageOps.autocontrast(ImageOps.grayscale(image))
+    lut = [0] * threshold + [255] * (256 - threshold)
+    return gray.point(lut)
+
+
+_ocr_cache = None
+
+
+def get_ocr_cache():
+    global _ocr_cache
+    if _ocr_cache is None:
+        _ocr_cache = DiskCache('ocr')
+    return _ocr_cache
+
+
+def image_key(image, settings):
+    """Chave do cache: hash dos pixels + parâmetros que mudam o resultado do OCR."""
+    digest = hashlib.sha256(f'{image.mode}|{image.size}|{settings}|'.encode())
+    digest.update(image.tobytes())
+    return cache_key(digest.hexdigest(), OCR_VERSION)
+
+
+class TesseractEngine:
+    """Pool de instâncias tesseract reaproveitadas entre chamadas e threads."""
+
+    def __init__(self, lang=OCR_LANG, size=OCR_THREADS):
+        self.lang = lang
+        self.size = max(1, size)
+        self._apis = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _acquire(self):
+        try:
+            return self._apis.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return PyTessBaseAPI(lang=self.lang)
+        return self._apis.get()
+
+    def image_to_string(self, image, psm=None):
+        """OCR de uma imagem PIL. psm=None usa o modo padrão do tesseract."""
+        if HAS_TESSEROCR:
+            api = self._acquire()
+            try:
+                api.SetPageSegMode(DEFAULT_PSM if psm is None else psm)
+                api.SetImage(image)
+                return api.GetUTF8Text()
+            finally:
+                api.Clear()
+                self._apis.put(api)
+
+        config = '' if psm is None else f'--psm {psm}'
+        return pytesseract.image_to_string(image, lang=self.lang, config=config)
+
+    def map(self, images, psm=None, settings='', use_cache=None):
+        """
+        OCR de várias imagens em paralelo, na ordem de entrada.
+        Uma imagem que falhar vira None, sem derrubar as outras.
+        settings descreve como a imagem foi gerada (DPI, pré-processamento)
+        e entra na chave do cache; use_cache=None segue EXTRACT_CACHE.
+        """
+        if use_cache is None:
+            use_cache = cache_enabled()
+        settings = f'{BACKEND}|{self.lang}|psm={psm}|{settings}' if use_cache else None
+        images = list(images)
+        count('imagensOcr', len(images))
+        with stage('ocr'):
+            if len(images) <= 1 or self.size == 1:
+                return [self._safe(image, psm, settings) for image in images]
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.size,
+                                                    thread_name_prefix='ocr')
+            return list(self._executor.map(lambda image: self._safe(image, psm, settings), images))
+
+    def _safe(self, image, psm, settings=None):
+        # O hash roda aqui, na thread do pool: o sha256 de buffers grandes libera o GIL
+        key = image_key(image, settings) if settings is not None else None
+        if key:
+            entry = get_ocr_cache().get(key)
+            if entry is not None:
+                return entry['text']
+        try:
+            text = self.image_to_string(image, psm)
+        except Exception:
+            return None
+        if key:
+            get_ocr_cache().put(key, {'version': OCR_VERSION, 'text': text})
+        return text
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        while True:
+            try:
+                api = self._apis.get_nowait()
+            except queue.Empty:
+                break
+            api.End()
+        self._created = 0
+
+
+_engine = None
+
+
+def get_engine():
+    """Engine compartilhada pelo processo (o worker residente a mantém aquecida)."""
+    global _engine
+    if _engine is None:
+        _engine = TesseractEngine()
+    return _engine
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+Precificação em lote: os valores derivados de calculate_values (fioB,
+valorSemDesconto, valorComDesconto, economia, lucro) calculados por coluna
+com NumPy, para recalcular milhares de faturas de uma vez quando muda o
+preço do kWh do mês.
+
+O resultado é idêntico ao do caminho escalar:
+- as operações em float64 são as mesmas e na mesma ordem de calculate_values;
+- o arredondamento reproduz o round() do Python. np.round(x, 2) multiplica
+  por 100 e arredonda, o que pode cair do outro lado num valor "x,xx5";
+  esses casos (parte fracionária a um fio de 0,5) são refeitos com round().
+  Para os demais o inteiro escolhido é o mesmo, e inteiro / 100 é o mesmo
+  float que o round() devolve.
+
+Sem NumPy instalado, cai no calculate_values fatura a fatura.
+
+Uso (o lado Node chama uma vez por lote):
+    python3 pricing.py < lote.json
+    python3 pricing.py lote.json [--formatted] [--verify]
+    python3 pricing.py --sweep fatura.pdf [outras.pdf ...] --prices 0.70:0.95:20 --discounts 5:50:10
+    python3 pricing.py --sweep --pdf upload-sem-extensao --prices ...   # como o routes.ts chama
+
+Entrada: {"precoKwh": 0.85, "desconto": 25, "faturas": [{"id": 1,
+"consumoScee": "7470,00", "precoFioB": "0,175126", "valorTotal": "816,68",
+"precoKwh": 0.9, "desconto": 30}, ...]} — precoKwh/desconto por fatura
+sobrepõem os do lote. Também aceita colunas: {"consumoScee": [...],
+"precoFioB": [...], "valorTotal": [...], "precoKwh": 0.85 ou [...], ...}.
+A saída segue o formato da entrada, com os campos calculados.
+
+--sweep (Simulação) lê cada fatura uma vez — PDFs ou o mesmo JSON, uma
+fatura por mês — e avalia a grade mês × preço × desconto numa só passada
+(ver sweep_columns); "precos"/"descontos" no JSON ou --prices/--discounts.
+Os PDFs são reconhecidos pelo conteúdo (cabeçalho %PDF), não pela extensão:
+uploads do multer não têm extensão. --pdf força a leitura como PDF.
+"""
+
+import sys
+import json
+import argparse
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+from extract_cache import cache_enabled
+from serialization import dumps
+from extract_fatura import (
+    calculate_values, extract_cached, extract_fields, format_to_br, sanitize_to_float,
+)
+
+INPUT_FIELDS = ['consumoScee', 'precoFioB', 'valorTotal']
+# Limite de pontos por eixo da varredura (a grade cresce como o produto dos eixos)
+MAX_GRID_POINTS = 500
+OUTPUT_FIELDS = ['fioB', 'valorSemDesconto', 'valorComDesconto', 'economia', 'lucro']
+
+
+def parse_column(values):
+    """Coluna de números ou strings no formato brasileiro -> lista de float (como sanitize_to_float)."""
+    parsed = {}
+    out = []
+    for value in values:
+        if isinstance(value, str):
+            number = parsed.get(value)
+            if number is None:
+                number = parsed[value] = sanitize_to_float(value)
+            out.append(number)
+        else:
+            out.append(sanitize_to_float(value))
+    return out
+
+
+def round_half_even_like_python(values, decimals=2):
+    """np.round corrigido para devolver exatamente o round(x, decimals) do Python."""
+    values = np.asarray(values, dtype=np.float64)
+    flat = values.ravel()
+    scale = 10.0 ** decimals
+    scaled = flat * scale
+    result = np.round(scaled) / scale
+    # Perto de ,5 o x * 100 pode ter arredondado para o outro lado
+    frac = np.abs(scaled - np.trunc(scaled))
+    near_half = np.abs(frac - 0.5) <= 1e-9 * np.maximum(1.0, np.abs(scaled))
+    near_half |= ~np.isfinite(scaled)
+    for i in np.flatnonzero(near_half):
+        result[i] = round(float(flat[i]), decimals)
+    return result.reshape(values.shape)
+
+
+def price_columns(consumo_scee, preco_fio_b, valor_total, price_kwh, discount_percent):
+    """
+    Valores derivados para colunas de entrada (listas/arrays do mesmo tamanho;
+    price_kwh e discount_percent podem ser escalares ou colunas).
+    Retorna {campo: lista de float} com os campos de OUTPUT_FIELDS.
+    """
+    consumo_scee = parse_column(consumo_scee)
+    preco_fio_b = parse_column(preco_fio_b)
+    valor_total = parse_column(valor_total)
+    size = len(consumo_scee)
+    if not (len(preco_fio_b) == len(valor_total) == size):
+        raise ValueError('as colunas consumoScee, precoFioB e valorTotal devem ter o mesmo tamanho')
+
+    if not HAS_NUMPY:
+        return _price_scalar(consumo_scee, preco_fio_b, valor_total, price_kwh, discount_percent)
+
+    c = np.asarray(consumo_scee, dtype=np.float64)
+    p = np.asarray(preco_fio_b, dtype=np.float64)
+    vt = np.asarray(valor_total, dtype=np.float64)
+    price = np.broadcast_to(np.asarray(price_kwh, dtype=np.float64), (size,))
+    discount = np.broadcast_to(np.asarray(discount_percent, dtype=np.float64), (size,))
+
+    # Mesmas operações, na mesma ordem, de calculate_values
+    fio_b_valor = c * p
+    energia = c * price
+    valor_sem_desconto = energia + vt - fio_b_valor
+    discount_multiplier = 1 - (discount / 100)
+    valor_com_desconto = (energia * discount_multiplier) + vt - fio_b_valor
+
+    return {
+        'fioB': round_half_even_like_python(fio_b_valor).tolist(),
+        'valorSemDesconto': round_half_even_like_python(valor_sem_desconto).tolist(),
+        'valorComDesconto': round_half_even_like_python(valor_com_desconto).tolist(),
+        'economia': round_half_even_like_python(valor_sem_desconto - valor_com_desconto).tolist(),
+        'lucro': round_half_even_like_python(valor_com_desconto - vt).tolist(),
+    }
+
+
+def _as_column(value, size):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value] * size
+
+
+def _price_scalar(consumo_scee, preco_fio_b, valor_total, price_kwh, discount_percent):
+    size = len(consumo_scee)
+    prices = _as_column(price_kwh, size)
+    discounts = _as_column(discount_percent, size)
+    columns = {field: [] for field in OUTPUT_FIELDS}
+    for i in range(size):
+        data = calculate_values({'consumoScee': consumo_scee[i], 'precoFioB': preco_fio_b[i],
+                                 'valorTotal': valor_total[i]}, prices[i], discounts[i])
+        for field in OUTPUT_FIELDS:
+            columns[field].append(data[field])
+    return columns
+
+
+def _request_columns(request):
+    """Colunas de entrada da requisição: (colunas, preços, descontos, faturas ou None)."""
+    price_kwh = request.get('precoKwh', 0.85)
+    discount = request.get('desconto', 25.0)
+    rows = request.get('faturas')
+    if rows is not None:
+        columns = {field: [row.get(field) for row in rows] for field in INPUT_FIELDS}
+        prices = [float(row.get('precoKwh', price_kwh)) for row in rows]
+        discounts = [float(row.get('desconto', discount)) for row in rows]
+        return columns, prices, discounts, rows
+
+    columns = {field: request.get(field) or [] for field in INPUT_FIELDS}
+    size = len(columns['consumoScee'])
+    prices = [float(v) for v in _as_column(price_kwh, size)]
+    discounts = [float(v) for v in _as_column(discount, size)]
+    return columns, prices, discounts, None
+
+
+def price_request(request, formatted=False):
+    """
+    Processa a requisição JSON (faturas ou colunas, ver o topo do arquivo).
+    Retorna o dict de resposta, com "success".
+    """
+    columns, prices, discounts, rows = _request_columns(request)
+    result = price_columns(columns['consumoScee'], columns['precoFioB'], columns['valorTotal'],
+                           prices, discounts)
+    if formatted:
+        result = {field: [format_to_br(v, decimals=2) for v in values]
+                  for field, values in result.items()}
+
+    response = {'success': True, 'motor': 'numpy' if HAS_NUMPY else 'python'}
+    if rows is None:
+        response.update(result)
+        return response
+    out = []
+    for i, row in enumerate(rows):
+        item = {'id': row['id']} if 'id' in row else {}
+        item.update({field: result[field][i] for field in OUTPUT_FIELDS})
+        out.append(item)
+    response['faturas'] = out
+    return response
+
+
+def verify_request(request):
+    """Confere o caminho vetorizado contra calculate_values; devolve as divergências."""
+    columns, prices, discounts, _rows = _request_columns(request)
+    inputs = [parse_column(columns[field]) for field in INPUT_FIELDS]
+    fast = price_columns(*inputs, prices, discounts)
+    slow = _price_scalar(*inputs, prices, discounts)
+
+    mismatches = []
+    for i in range(len(inputs[0])):
+        diff = {field: [slow[field][i], fast[field][i]] for field in OUTPUT_FIELDS
+                if slow[field][i] != fast[field][i]}
+        if diff:
+            mismatches.append({'indice': i, 'campos': diff})
+    return mismatches
+
+
+# ==================== VARREDURA (SIMULAÇÃO) ====================
+
+def parse_grid(spec):
+    """
+    Eixo da varredura: lista de números, "0.75,0.80,0.85" ou "inicio:fim:n"
+    (n valores igualmente espaçados, extremos incluídos).
+    """
+    if isinstance(spec, (int, float)):
+        return [float(spec)]
+    if isinstance(spec, (list, tuple)):
+        return [float(v) for v in spec]
+    spec = str(spec).strip()
+    if ':' in spec:
+        start, stop, n = spec.split(':')
+        start, stop, n = float(start), float(stop), int(n)
+        if not 1 <= n <= MAX_GRID_POINTS:
+            raise ValueError(f'o eixo deve ter de 1 a {MAX_GRID_POINTS} pontos: {spec}')
+        if n == 1:
+            return [start]
+        step = (stop - start) / (n - 1)
+        return [round(start + i * step, 6) for i in range(n)]
+    values = [float(v) for v in spec.split(',') if v.strip()]
+    if len(values) > MAX_GRID_POINTS:
+        raise ValueError(f'o eixo deve ter no máximo {MAX_GRID_POINTS} pontos')
+    return values
+
+
+def sweep_columns(consumo_scee, preco_fio_b, valor_total, prices, discounts):
+    """
+    Avalia as fórmulas de calculate_values na grade mês × preço × desconto
+    (cada posição das colunas é um mês/fatura). Cada célula é idêntica ao
+    calculate_values daquela combinação. Retorna a matriz compacta:
+    fioB [mês], valorSemDesconto [mês][preço] e valorComDesconto, economia,
+    lucro [mês][preço][desconto], mais "total" (soma dos meses) [preço][desconto].
+    """
+    consumo_scee = parse_column(consumo_scee)
+    preco_fio_b = parse_column(preco_fio_b)
+    valor_total = parse_column(valor_total)
+    if not (len(preco_fio_b) == len(valor_total) == len(consumo_scee)):
+        raise ValueError('as colunas consumoScee, precoFioB e valorTotal devem ter o mesmo tamanho')
+    prices = [float(v) for v in prices]
+    discounts = [float(v) for v in discounts]
+    if not prices or not discounts:
+        raise ValueError('os eixos de preço e desconto precisam de ao menos um valor')
+
+    if not HAS_NUMPY:
+        return _sweep_scalar(consumo_scee, preco_fio_b, valor_total, prices, discounts)
+
+    c = np.asarray(consumo_scee, dtype=np.float64)[:, None]           # (M, 1)
+    p = np.asarray(preco_fio_b, dtype=np.float64)[:, None]
+    vt = np.asarray(valor_total, dtype=np.float64)[:, None, None]     # (M, 1, 1)
+    price = np.asarray(prices, dtype=np.float64)[None, :]              # (1, P)
+    discount = np.asarray(discounts, dtype=np.float64)[None, None, :]  # (1, 1, D)
+
+    # Mesmas operações, na mesma ordem, de calculate_values
+    fio_b_valor = c * p                                                # (M, 1)
+    energia = c * price                                                # (M, P)
+    valor_sem_desconto = energia + vt[:, :, 0] - fio_b_valor           # (M, P)
+    discount_multiplier = 1 - (discount / 100)
+    valor_com_desconto = (energia[:, :, None] * discount_multiplier) + vt - fio_b_valor[:, :, None]
+    economia = round_half_even_like_python(valor_sem_desconto[:, :, None] - valor_com_desconto)
+    lucro = round_half_even_like_python(valor_com_desconto - vt)
+    valor_com_desconto = round_half_even_like_python(valor_com_desconto)
+
+    return {
+        'fioB': round_half_even_like_python(fio_b_valor[:, 0]).tolist(),
+        'valorSemDesconto': round_half_even_like_python(valor_sem_desconto).tolist(),
+        'valorComDesconto': valor_com_desconto.tolist(),
+        'economia': economia.tolist(),
+        'lucro': lucro.tolist(),
+        'total': {
+            'valorComDesconto': round_half_even_like_python(valor_com_desconto.sum(axis=0)).tolist(),
+            'economia': round_half_even_like_python(economia.sum(axis=0)).tolist(),
+            'lucro': round_half_even_like_python(lucro.sum(axis=0)).tolist(),
+        },
+    }
+
+
+def _sweep_scalar(consumo_scee, preco_fio_b, valor_total, prices, discounts):
+    months = range(len(consumo_scee))
+    cells = [[[calculate_values({'consumoScee': consumo_scee[m], 'precoFioB': preco_fio_b[m],
+                                 'valorTotal': valor_total[m]}, price, discount)
+               for discount in discounts] for price in prices] for m in months]
+    grid = {field: [[[cell[field] for cell in row] for row in month] for month in cells]
+            for field in ('valorComDesconto', 'economia', 'lucro')}
+    total = {field: [[round(sum(grid[field][m][i][j] for m in months), 2)
+                      for j in range(len(discounts))] for i in range(len(prices))]
+             for field in grid}
+    return {
+        'fioB': [month[0][0]['fioB'] for month in cells],
+        'valorSemDesconto': [[row[0]['valorSemDesconto'] for row in month] for month in cells],
+        **grid,
+        'total': total,
+    }
+
+
+def sweep_request(request):
+    """
+    Varredura a partir da requisição JSON: as faturas/colunas de price_request
+    (uma por mês) + "precos" e "descontos" (lista ou "inicio:fim:n").
+    """
+    columns, _prices, _discounts, rows = _request_columns(request)
+    prices = parse_grid(request.get('precos', request.get('precoKwh', 0.85)))
+    discounts = parse_grid(request.get('descontos', request.get('desconto', 25.0)))
+    result = sweep_columns(columns['consumoScee'], columns['precoFioB'], columns['valorTotal'],
+                           prices, discounts)
+
+    size = len(columns['consumoScee'])
+    months = []
+    for i in range(size):
+        row = rows[i] if rows is not None else {}
+        month = {key: row[key] for key in ('id', 'pdfPath', 'mesReferencia') if key in row}
+        month.update({field: columns[field][i] for field in INPUT_FIELDS})
+        months.append(month)
+
+    response = {'success': True, 'motor': 'numpy' if HAS_NUMPY else 'python',
+                'precos': prices, 'descontos': discounts, 'meses': months}
+    response.update(result)
+    return response
+
+
+def rows_from_pdfs(pdf_paths, use_cache=None):
+    """Extrai cada PDF uma vez (com o cache de extração): uma linha por fatura/mês."""
+    if use_cache is None:
+        use_cache = cache_enabled()
+    rows, errors = [], []
+    for pdf_path in pdf_paths:
+        if use_cache:
+            data, error = extract_cached(pdf_path)
+        else:
+            data, _text, error = extract_fields(pdf_path, ocr_cache=False)
+        if error:
+            errors.append({'pdfPath': pdf_path, 'error': error})
+            continue
+        rows.append({'pdfPath': pdf_path, 'mesReferencia': data.get('mesReferencia'),
+                     **{field: data.get(field) for field in INPUT_FIELDS}})
+    return rows, errors
+
+
+def is_pdf(path):
+    """True se o arquivo começa (no primeiro KB, como o leitor de PDF tolera) com %PDF-."""
+    if path == '-':
+        return False
+    try:
+        with open(path, 'rb') as f:
+            return b'%PDF-' in f.read(1024)
+    except OSError:
+        return False
+
+
+def write_response(response):
+    """Grava a resposta (que pode ter milhares de células) direto no stdout binário."""
+    sys.stdout.buffer.write(dumps(response) + b'\n')
+    sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precificação em lote das faturas (NumPy)')
+    parser.add_argument('inputs', nargs='*', default=['-'],
+                        help='JSON do lote (padrão: stdin); com --sweep, também PDFs (um por mês)')
+    parser.add_argument('--formatted', action='store_true',
+                        help='Valores no formato brasileiro ("1.234,56"), como o extract_fatura')
+    parser.add_argument('--verify', action='store_true',
+                        help='Confere o resultado contra o calculate_values escalar')
+    parser.add_argument('--sweep', action='store_true',
+                        help='Varredura preço × desconto (× mês) para a Simulação')
+    parser.add_argument('--prices', default=None,
+                        help='Eixo de preços do kWh: "0.75,0.8" ou "inicio:fim:n"')
+    parser.add_argument('--discounts', default=None,
+                        help='Eixo de descontos (%%): "10,20,30" ou "inicio:fim:n"')
+    parser.add_argument('--pdf', action='store_true',
+                        help='Com --sweep: as entradas são PDFs, qualquer que seja o nome do arquivo')
+    parser.add_argument('--no-cache', action='store_true', help='Com PDFs: ignora o cache de extração')
+    args = parser.parse_args()
+
+    try:
+        errors = []
+        if args.pdf and not args.sweep:
+            parser.error('--pdf só vale com --sweep')
+        if args.sweep and (args.pdf or all(is_pdf(path) for path in args.inputs)):
+            rows, errors = rows_from_pdfs(args.inputs, use_cache=False if args.no_cache else None)
+            if not rows:
+                print(json.dumps({'success': False, 'error': 'Nenhuma fatura extraída',
+                                  'erros': errors}, ensure_ascii=False))
+                sys.exit(1)
+            request = {'faturas': rows}
+        elif len(args.inputs) != 1:
+            parser.error('informe um único JSON de lote (ou PDFs com --sweep)')
+        elif args.inputs[0] == '-':
+            request = json.load(sys.stdin)
+        else:
+            with open(args.inputs[0], 'r', encoding='utf-8') as f:
+                request = json.load(f)
+
+        if args.sweep:
+            if args.prices is not None:
+                request['precos'] = args.prices
+            if args.discounts is not None:
+                request['descontos'] = args.discounts
+            response = sweep_request(request)
+            if errors:
+                response['erros'] = errors
+            write_response(response)
+            return
+        if args.verify:
+            mismatches = verify_request(request)
+            print(json.dumps({'success': not mismatches, 'divergencias': mismatches},
+                             ensure_ascii=False))
+            if mismatches:
+                sys.exit(1)
+            return
+        response = price_request(request, formatted=args.formatted)
+    except (OSError, ValueError, TypeError, AttributeError, KeyError) as e:
+        print(json.dumps({'success': False, 'error': f'Lote inválido: {e}'}, ensure_ascii=False))
+        sys.exit(1)
+    write_response(response)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Recursos compartilhados pelos geradores de PDF (generate_pdf.py,
+generate_relatorio.py, generate_cliente_relatorio.py).
+
+Num mesmo processo (modo --batch, benchmark) cada PDF paga só o layout:
+- templates Jinja: um único Environment, com cache de bytecode em disco
+  (uploads/.cache/jinja), então nem um processo novo recompila o template;
+- folhas de estilo já parseadas (weasyprint.CSS);
+- uma FontConfiguration compartilhada, em vez de uma nova por documento;
+- o logo já lido e codificado em base64.
+
+Tudo é invalidado pelo mtime do arquivo de origem: editar o template, o
+CSS ou o logo vale para o próximo PDF, sem reiniciar nada.
+
+Cache de saída: render_pdf não regera um PDF que já está em output_path com
+exatamente o mesmo conteúdo. A chave é o hash canônico do template_data
+(que já traz o logo) + hash do template e das folhas de estilo + versão do
+WeasyPrint + RENDER_VERSION. O índice (namespace "render" do DiskCache,
+uma entrada por arquivo de saída) guarda a chave, o tamanho e o mtime do
+PDF gerado; se o arquivo sumiu (limpeza do cron.ts) ou foi sobrescrito por
+fora, o PDF é gerado de novo. Cada acerto faz "touch" no PDF e na entrada,
+então a limpeza por mtime do cron só apaga o que ficou sem uso.
+RENDER_CACHE=0 desliga o cache de saída.
+
+O WeasyPrint só é importado quando algo precisa mesmo ser renderizado: um
+lote em que todas as faturas vêm do cache nem carrega a biblioteca.
+"""
+
+import os
+import json
+import base64
+import hashlib
+from importlib import metadata
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+from extract_cache import CACHE_DIR, DiskCache
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'templates')
+BYTECODE_DIR = os.path.join(CACHE_DIR, 'jinja')
+
+# Versão dos geradores: entra na chave do cache de saída, então uma mudança
+# que altere o PDF sem mudar template_data/template/CSS DEVE incrementá-la.
+RENDER_VERSION = '1'
+
+_env = None
+_font_config = None
+_render_index = None
+# (tipo, nome do arquivo) -> (mtime_ns, valor carregado)
+_loaded = {}
+# Acertos/erros do cache de saída no processo (resumo do --batch)
+cache_stats = {'hits': 0, 'misses': 0}
+
+
+def _bytecode_cache():
+    try:
+        os.makedirs(BYTECODE_DIR, exist_ok=True)
+    except OSError:
+        return None  # diretório sem permissão: compila em memória mesmo
+    return FileSystemBytecodeCache(BYTECODE_DIR)
+
+
+def environment():
+    """Environment Jinja do processo (auto_reload recompila o template se o mtime mudar)."""
+    global _env
+    if _env is None:
+        _env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), auto_reload=True,
+                           bytecode_cache=_bytecode_cache())
+    return _env
+
+
+def get_template(name):
+    return environment().get_template(name)
+
+
+def load_weasyprint():
+    """
+    Importa o WeasyPrint agora, em vez de no primeiro PDF que precisar ser
+    gerado: levanta ImportError/OSError (falta o Pango) para quem quer saber
+    de antemão se dá para renderizar (benchmark.py).
+    """
+    import weasyprint
+    return weasyprint
+
+
+def font_config():
+    """FontConfiguration única: as fontes do sistema são resolvidas uma vez por processo."""
+    global _font_config
+    if _font_config is None:
+        from weasyprint.text.fonts import FontConfiguration
+        _font_config = FontConfiguration()
+    return _font_config
+
+
+def _cached(kind, name, load):
+    """Valor carregado de templates/<name>, recarregado quando o mtime muda."""
+    path = os.path.join(TEMPLATE_DIR, name)
+    mtime = os.stat(path).st_mtime_ns
+    entry = _loaded.get((kind, name))
+    if entry is not None and entry[0] == mtime:
+        return entry[1]
+    value = load(path)
+    _loaded[(kind, name)] = (mtime, value)
+    return value
+
+
+def _parse_css(path):
+    from weasyprint import CSS
+    return CSS(filename=path, font_config=font_config())
+
+
+def stylesheet(name='styles.css'):
+    """Folha de estilo já parseada (ligada à FontConfiguration compartilhada)."""
+    return _cached('css', name, _parse_css)
+
+
+def _encode_png(path):
+    with open(path, 'rb') as image_file:
+        return f"data:image/png;base64,{base64.b64encode(image_file.read()).decode()}"
+
+
+def logo_base64(name='logo.png'):
+    """Logo como data URI, pronto para o <img> dos templates."""
+    return _cached('logo', name, _encode_png)
+
+
+def _file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _weasyprint_version():
+    try:
+        return metadata.version('weasyprint')
+    except metadata.PackageNotFoundError:
+        return 'desconhecida'
+
+
+def render_key(template_name, template_data, stylesheets=()):
+    """Hash do PDF que seria gerado: dados + arquivos de origem + versões."""
+    digest = hashlib.sha256()
+    parts = [RENDER_VERSION, _weasyprint_version(), template_name,
+             _cached('sha256', template_name, _file_digest)]
+    for name in stylesheets:
+        parts += [name, _cached('sha256', name, _file_digest)]
+    for part in parts:
+        digest.update(part.encode('utf-8') + b'\0')
+    digest.update(json.dumps(template_data, sort_keys=True, ensure_ascii=False,
+                             separators=(',', ':'), default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def render_cache_enabled():
+    return os.environ.get('RENDER_CACHE', '1') != '0'
+
+
+def render_index():
+    global _render_index
+    if _render_index is None:
+        _render_index = DiskCache('render')
+    return _render_index
+
+
+def _index_key(output_path):
+    return hashlib.sha256(os.path.abspath(output_path).encode('utf-8')).hexdigest()
+
+
+def _remember(output_path, key):
+    st = os.stat(output_path)
+    render_index().put(_index_key(output_path), {
+        'renderKey': key,
+        'pdfPath': os.path.abspath(output_path),
+        'size': st.st_size,
+        'mtimeNs': st.st_mtime_ns,
+    })
+
+
+def _reuse(output_path, key):
+    """True se output_path já é o PDF desta chave (e renova o mtime dele)."""
+    entry = render_index().get(_index_key(output_path))
+    if not entry or entry.get('renderKey') != key:
+        return False
+    try:
+        st = os.stat(output_path)
+    except OSError:
+        return False  # apagado pela limpeza do cron
+    if st.st_size != entry.get('size') or st.st_mtime_ns != entry.get('mtimeNs'):
+        return False  # sobrescrito por fora do cache
+    try:
+        os.utime(output_path)
+        _remember(output_path, key)
+    except OSError:
+        return False
+    return True
+
+
+def _write_pdf(template_name, template_data, stylesheets):
+    """Renderiza o template e devolve os bytes do PDF (write_pdf sem destino)."""
+    from weasyprint import HTML
+    html_content = get_template(template_name).render(template_data)
+    return HTML(string=html_content).write_pdf(
+        stylesheets=[stylesheet(name) for name in stylesheets],
+        font_config=font_config(),
+    )
+
+
+def _write_combined_pdf(template_name, template_data_list, stylesheets):
+    """
+    Um único PDF com um documento por item: cada item passa pelo layout com a
+    mesma cascata de CSS e as mesmas fontes, e as páginas de todos são
+    juntadas numa só gravação (Document.copy).
+    """
+    from weasyprint import HTML
+    if not template_data_list:
+        raise ValueError('nenhum documento para juntar')
+    template = get_template(template_name)
+    sheets = [stylesheet(name) for name in stylesheets]
+    pages = []
+    first = None
+    for template_data in template_data_list:
+        document = HTML(string=template.render(template_data)).render(
+            stylesheets=sheets, font_config=font_config())
+        first = first or document
+        pages.extend(document.pages)
+    return first.copy(pages).write_pdf()
+
+
+def _store(output_path, pdf):
+    # Grava num temporário e troca: quem baixa nunca lê um PDF pela metade
+    tmp = f'{output_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(pdf)
+        os.replace(tmp, output_path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _render(template_name, template_data, stylesheets, output_path, use_cache, read_cached,
+            write=_write_pdf):
+    """Núcleo do render_pdf/render_pdf_bytes: devolve (bytes ou None, veio_do_cache)."""
+    if use_cache is None:
+        use_cache = render_cache_enabled()
+    key = None
+    if output_path is not None and use_cache:
+        key = render_key(template_name, template_data, stylesheets)
+        if _reuse(output_path, key):
+            pdf = None
+            try:
+                if read_cached:
+                    with open(output_path, 'rb') as f:
+                        pdf = f.read()
+            except OSError:
+                pass  # sumiu entre a conferência e a leitura: gera de novo
+            else:
+                cache_stats['hits'] += 1
+                return pdf, True
+    cache_stats['misses'] += 1
+
+    pdf = write(template_name, template_data, stylesheets)
+    if output_path is not None:
+        _store(output_path, pdf)
+        if key is not None:
+            try:
+                _remember(output_path, key)
+            except OSError:
+                pass
+    return pdf, False
+
+
+def render_pdf(template_name, template_data, output_path, stylesheets=(), use_cache=None):
+    """
+    Renderiza o template e grava o PDF usando os recursos compartilhados.
+    Se output_path já tem o PDF deste mesmo template_data, devolve sem renderizar.
+    """
+    _render(template_name, template_data, stylesheets, output_path, use_cache, read_cached=False)
+    return output_path
+
+
+def render_pdf_bytes(template_name, template_data, stylesheets=(), output_path=None,
+                     use_cache=None):
+    """
+    PDF em memória: devolve (bytes, veio_do_cache). Sem output_path nada vai
+    para o disco. Com output_path, reaproveita o PDF já gerado ali (cache de
+    saída) ou grava o novo, como o render_pdf.
+    """
+    return _render(template_name, template_data, stylesheets, output_path, use_cache,
+                   read_cached=True)
+
+
+def render_combined_pdf(template_name, template_data_list, stylesheets=(), output_path=None,
+                        use_cache=None):
+    """
+    Vários documentos (um template_data por item) num único PDF: devolve
+    (bytes, veio_do_cache). output_path funciona como no render_pdf_bytes;
+    a chave do cache é a lista inteira, na ordem dada.
+    """
+    return _render(template_name, list(template_data_list), stylesheets, output_path, use_cache,
+                   read_cached=True, write=_write_combined_pdf)
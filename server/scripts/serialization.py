@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Serialização dos registros emitidos pelos scripts (extract_fatura --batch,
+--worker, --from-text, bulk_extract, pricing).
+
+- JSON: orjson quando instalado (várias vezes mais rápido que o json da
+  stdlib nos lotes grandes), senão json.dumps(ensure_ascii=False). Os dois
+  geram o mesmo JSON semanticamente; só o espaçamento muda.
+- msgpack: enquadramento por tamanho para o protocolo do worker. Cada
+  mensagem é um cabeçalho de 4 bytes (big-endian, sem sinal) com o tamanho
+  seguido do payload msgpack. Opcional (pacote msgpack).
+
+Os registros são gravados um a um direto no stdout binário, à medida que
+ficam prontos: nada de montar uma string gigante com o lote inteiro.
+"""
+
+import sys
+import json
+import struct
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+OUTPUT_FORMATS = ('ndjson', 'msgpack')
+
+# Cabeçalho de cada mensagem msgpack: tamanho do payload (uint32 big-endian)
+FRAME_HEADER = struct.Struct('>I')
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+
+def dumps(obj):
+    """JSON do objeto em bytes UTF-8 (sem a quebra de linha final)."""
+    if HAS_ORJSON:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # Tipos que o orjson recusa (chaves não-str, inteiros > 64 bits): stdlib
+            pass
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+def loads(data):
+    """Decodifica JSON de bytes ou str."""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def require_format(fmt):
+    """Levanta ValueError se o formato não existir ou faltar a dependência dele."""
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f'formato de saída desconhecido: {fmt}')
+    if fmt == 'msgpack' and not HAS_MSGPACK:
+        raise ValueError('formato msgpack requer o pacote msgpack (pip install msgpack)')
+
+
+def encode_record(obj, fmt='ndjson'):
+    """Um registro pronto para gravar: linha JSON ou mensagem msgpack enquadrada."""
+    if fmt == 'msgpack':
+        payload = msgpack.packb(obj, use_bin_type=True)
+        return FRAME_HEADER.pack(len(payload)) + payload
+    return dumps(obj) + b'\n'
+
+
+def binary_stream(stream):
+    """Camada binária de um stream de texto (sys.stdout/stdin); streams binários passam direto."""
+    return getattr(stream, 'buffer', stream)
+
+
+class RecordWriter:
+    """
+    Grava registros num stream binário, um a um. Com flush=True cada registro
+    sai assim que é gravado, para quem lê o pipe processar o lote em streaming.
+    """
+
+    def __init__(self, stream=None, fmt='ndjson', flush=True):
+        require_format(fmt)
+        self.stream = binary_stream(stream if stream is not None else sys.stdout)
+        self.fmt = fmt
+        self.flush = flush
+        self.count = 0
+
+    def write(self, record):
+        self.stream.write(encode_record(record, self.fmt))
+        if self.flush:
+            self.stream.flush()
+        self.count += 1
+
+
+def unpack(payload):
+    """Decodifica o payload de uma mensagem msgpack."""
+    return msgpack.unpackb(payload, raw=False)
+
+
+def read_frame(stream):
+    """
+    Lê o payload (bytes) da próxima mensagem enquadrada de um stream binário.
+    Devolve None no fim do stream; levanta ValueError se o enquadramento
+    estiver quebrado (aí não dá para achar o início da próxima mensagem).
+    """
+    header = stream.read(FRAME_HEADER.size)
+    if not header:
+        return None
+    if len(header) < FRAME_HEADER.size:
+        raise ValueError('cabeçalho de mensagem incompleto')
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_BYTES:
+        raise ValueError(f'mensagem grande demais: {size} bytes')
+    payload = stream.read(size)
+    if len(payload) < size:
+        raise ValueError('mensagem msgpack incompleta')
+    return payload
+
+
+def iter_records(stream, fmt='ndjson'):
+    """Registros de um stream binário (NDJSON ou msgpack enquadrado); pula linhas vazias."""
+    require_format(fmt)
+    stream = binary_stream(stream)
+    if fmt == 'msgpack':
+        while True:
+            payload = read_frame(stream)
+            if payload is None:
+                return
+            yield unpack(payload)
+    else:
+        for line in stream:
+            if line.strip():
+                yield loads(line)
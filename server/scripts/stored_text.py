@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Formato de armazenamento do texto bruto das faturas.
+
+Separa a leitura do PDF (pdfium/pdfminer/OCR, a parte cara) do parsing
+(regex + cálculos): o texto de cada página fica guardado e, depois de uma
+correção nas regex, dá para reprocessar o histórico inteiro sem reabrir
+nenhum PDF (extract_fatura.py --from-text) e comparar os campos novos com
+os que foram extraídos na época (--diff).
+
+Um documento por fatura:
+    {
+      "formato": "fatura-texto", "versao": 1,
+      "pdfPath": "...", "sha256": "...", "backend": "pdfium",
+      "layout": "Modelo-Novo", "ocr": false,
+      "paginas": [{"numero": 1, "texto": "...", "ocr": false}, ...],
+      "versaoExtrator": "3", "campos": {...}
+    }
+
+"texto" é null nas páginas sem camada de texto cujo OCR não rodou/falhou;
+"campos" são os campos extraídos na gravação (antes dos cálculos).
+
+Arquivos aceitos pela leitura: um documento JSON (indentado ou não), um
+arquivo NDJSON com um documento por linha (o "arquivo em lote" gerado por
+--dump-text), ambos opcionalmente .gz, ou "-" para o stdin.
+"""
+
+import sys
+import gzip
+
+from serialization import dumps, loads
+
+TEXT_FORMAT = 'fatura-texto'
+TEXT_FORMAT_VERSION = 1
+
+
+def page_record(number, text, ocr):
+    return {'numero': number, 'texto': text, 'ocr': ocr}
+
+
+def make_document(pdf_path, pages, layout, backend, sha256=None, extractor_version=None,
+                  fields=None):
+    """Monta o documento armazenado de uma fatura (ver o formato acima)."""
+    doc = {
+        'formato': TEXT_FORMAT,
+        'versao': TEXT_FORMAT_VERSION,
+        'pdfPath': pdf_path,
+        'sha256': sha256,
+        'backend': backend,
+        'layout': layout,
+        'ocr': any(page['ocr'] for page in pages),
+        'paginas': pages,
+        'versaoExtrator': extractor_version,
+    }
+    if fields is not None:
+        doc['campos'] = {key: value for key, value in fields.items() if key != 'pdfPath'}
+    return doc
+
+
+def validate_document(doc):
+    """Levanta ValueError se o dict não for um documento de texto armazenado legível."""
+    if not isinstance(doc, dict) or doc.get('formato') != TEXT_FORMAT:
+        raise ValueError('não é um documento de texto de fatura')
+    if doc.get('versao') != TEXT_FORMAT_VERSION:
+        raise ValueError(f'versão do formato não suportada: {doc.get("versao")}')
+    pages = doc.get('paginas')
+    if not isinstance(pages, list) or not all(
+            isinstance(page, dict) and (page.get('texto') is None or isinstance(page['texto'], str))
+            for page in pages):
+        raise ValueError('lista de páginas inválida')
+    return doc
+
+
+def _open_text(path, mode):
+    if path == '-':
+        return sys.stdin if 'r' in mode else sys.stdout
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def iter_documents(source):
+    """
+    Lê os documentos de `source` (arquivo, arquivo em lote ou "-").
+    Gera (documento, erro): linhas ilegíveis viram (None, mensagem), para o
+    reprocessamento em lote seguir adiante.
+    """
+    stream = _open_text(source, 'r')
+    try:
+        first = stream.readline()
+        while first and not first.strip():
+            first = stream.readline()
+        if not first:
+            return
+        try:
+            doc = loads(first)
+        except ValueError:
+            # Documento único indentado; se nem assim decodificar, segue
+            # linha a linha para aproveitar o resto do arquivo em lote
+            rest = first + stream.read()
+            try:
+                doc = loads(rest)
+            except ValueError:
+                lines = enumerate(rest.splitlines(), 1)
+            else:
+                yield _checked(doc, source, 1)
+                return
+        else:
+            yield _checked(doc, source, 1)
+            lines = enumerate(stream, 2)
+
+        for number, line in lines:
+            if not line.strip():
+                continue
+            try:
+                doc = loads(line)
+            except ValueError as e:
+                yield None, f'{source}:{number}: JSON inválido ({e})'
+                continue
+            yield _checked(doc, source, number)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def _checked(doc, source, number):
+    try:
+        return validate_document(doc), None
+    except ValueError as e:
+        return None, f'{source}:{number}: {e}'
+
+
+class ArchiveWriter:
+    """Grava documentos como NDJSON (um por linha) em arquivo, .gz ou "-" (stdout)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.stream = _open_text(path, 'w')
+        self.count = 0
+
+    def write(self, doc):
+        self.stream.write(dumps(doc).decode('utf-8') + '\n')
+        self.count += 1
+
+    def close(self):
+        if self.stream is sys.stdout:
+            self.stream.flush()
+        else:
+            self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def diff_fields(old, new, ignore=('pdfPath',)):
+    """Campos que mudaram entre duas extrações: {campo: [antes, depois]}."""
+    old = old or {}
+    new = new or {}
+    changes = {}
+    for key in sorted(set(old) | set(new)):
+        if key in ignore:
+            continue
+        if old.get(key) != new.get(key):
+            changes[key] = [old.get(key), new.get(key)]
+    return changes
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Instrumentação opcional por etapa (tempo de parede e de CPU).
+
+O registro ativo fica num ContextVar: o código instrumentado só chama
+stage('nome') / count('chave') e, sem registro ativo (o caso normal),
+isso não custa nada além de uma consulta. Cada thread do modo --socket
+tem o seu próprio contexto, então requisições simultâneas não se misturam.
+
+O tempo de CPU é o do processo (time.process_time), que inclui as threads
+do OCR; o dos subprocessos tesseract (pytesseract) é somado à parte via
+RUSAGE_CHILDREN. Com requisições simultâneas no --socket a CPU de uma
+etapa inclui a das outras.
+"""
+
+import time
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:
+    HAS_RESOURCE = False
+
+_current = ContextVar('timings', default=None)
+
+
+def _children_cpu():
+    if not HAS_RESOURCE:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _peak_rss_kb():
+    # No Linux ru_maxrss já vem em KB; é o pico do processo inteiro (no
+    # worker residente, desde que ele subiu)
+    if not HAS_RESOURCE:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Timings:
+    """Acumula as etapas e contadores de uma extração."""
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time() + _children_cpu()
+
+    def add(self, name, wall, cpu):
+        stage = self.stages.setdefault(name, {'wallMs': 0.0, 'cpuMs': 0.0, 'chamadas': 0})
+        stage['wallMs'] += wall * 1000
+        stage['cpuMs'] += cpu * 1000
+        stage['chamadas'] += 1
+
+    def to_dict(self):
+        return {
+            'totalMs': round((time.perf_counter() - self._start_wall) * 1000, 2),
+            'cpuMs': round((time.process_time() + _children_cpu() - self._start_cpu) * 1000, 2),
+            'etapas': {
+                name: {'wallMs': round(s['wallMs'], 2), 'cpuMs': round(s['cpuMs'], 2),
+                       'chamadas': s['chamadas']}
+                for name, s in self.stages.items()
+            },
+            'paginasAbertas': self.counters.get('paginasAbertas', 0),
+            'ocrExecutado': self.counters.get('paginasOcr', 0) > 0,
+            'paginasOcr': self.counters.get('paginasOcr', 0),
+            'imagensOcr': self.counters.get('imagensOcr', 0),
+            'cache': self.counters.get('cache', 'desligado'),
+            'picoRssKb': _peak_rss_kb(),
+        }
+
+
+@contextmanager
+def recording():
+    """Ativa um registro novo no contexto atual e o entrega ao chamador."""
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Mede o bloco como a etapa `name` (acumula se repetida)."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    wall = time.perf_counter()
+    cpu = time.process_time() + _children_cpu()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - wall,
+                    time.process_time() + _children_cpu() - cpu)
+
+
+def count(key, n=1):
+    timings = _current.get()
+    if timings is not None:
+        timings.counters[key] = timings.counters.get(key, 0) + n
+
+
+def note(key, value):
+    timings = _current.get()
+    if timings is not None:
+        timings.counters[key] = value
+
+
+def timed(name):
+    """Decorador: mede cada chamada da função como a etapa `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return func(*args, **kwargs)
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,179 @@
+import { spawn, type ChildProcessWithoutNullStreams } from 'child_process';
+import os from 'os';
+import path from 'path';
+
+/**
+ * Pool de workers residentes de extração de faturas
+ *
+ * Mantém até EXTRACT_WORKERS processos `python3 extract_fatura.py --worker`
+ * vivos e envia cada extração como uma linha JSON no stdin de um deles.
+ * Assim o custo de subir o interpretador e importar pdfplumber/pdfminer/OCR
+ * é pago uma vez por worker, e não a cada upload.
+ *
+ * - Os processos são iniciados sob demanda e recriados se morrerem
+ * - Cada worker atende um job por vez; os jobs esperam numa fila no Node e
+ *   vão para o primeiro worker livre, então uma fatura digitalizada lenta
+ *   ocupa um worker só e as demais seguem nos outros
+ * - O timeout conta a partir da escrita no stdin (o tempo da extração, não
+ *   o da espera na fila); o job que excede é rejeitado e só o worker dele é
+ *   recriado
+ * - Cada requisição leva um id; as respostas são casadas pelo id
+ * - Quando o servidor termina, o stdin dos workers fecha e eles saem sozinhos
+ * - EXTRACT_WORKER=0 desativa o pool (volta a um processo por upload)
+ */
+
+// ============ CONFIGURAÇÃO ============
+
+const SCRIPT_PATH = path.join(process.cwd(), 'server/scripts/extract_fatura.py');
+const JOB_TIMEOUT_MS = parseInt(process.env.EXTRACT_WORKER_TIMEOUT_MS || '120000', 10);
+// Workers em paralelo (padrão: um por núcleo)
+const POOL_SIZE = Math.max(
+  1,
+  parseInt(process.env.EXTRACT_WORKERS || String(os.cpus().length), 10) || 1
+);
+export const EXTRACT_WORKER_ENABLED = process.env.EXTRACT_WORKER !== '0';
+// Pede ao Python o objeto "timings" (tempo por etapa) em cada extração
+export const EXTRACT_TIMINGS = process.env.EXTRACT_TIMINGS === '1';
+
+// ============ TIPOS ============
+
+interface QueuedJob {
+  id: number;
+  request: string;
+  resolve: (result: any) => void;
+  reject: (err: Error) => void;
+}
+
+interface WorkerSlot {
+  child: ChildProcessWithoutNullStreams | null;
+  // O job que está no stdin deste worker agora (no máximo um)
+  job: QueuedJob | null;
+  timer: NodeJS.Timeout | null;
+}
+
+// ============ ESTADO ============
+
+let nextJobId = 1;
+// Jobs ainda não enviados a nenhum worker, na ordem de chegada
+const queue: QueuedJob[] = [];
+const slots: WorkerSlot[] = Array.from({ length: POOL_SIZE }, () => ({
+  child: null,
+  job: null,
+  timer: null,
+}));
+
+function finishJob(slot: WorkerSlot): QueuedJob | null {
+  const job = slot.job;
+  if (!job) return null;
+  if (slot.timer) clearTimeout(slot.timer);
+  slot.job = null;
+  slot.timer = null;
+  return job;
+}
+
+function handleLine(slot: WorkerSlot, child: ChildProcessWithoutNullStreams, line: string) {
+  if (!line.trim()) return;
+
+  let result: any;
+  try {
+    result = JSON.parse(line);
+  } catch {
+    console.error('[Extraction Worker] Resposta inválida:', line);
+    return;
+  }
+
+  if (slot.child !== child || !slot.job || slot.job.id !== result.id) return;
+
+  const job = finishJob(slot)!;
+  delete result.id;
+  job.resolve(result);
+  pump();
+}
+
+function workerExited(slot: WorkerSlot, child: ChildProcessWithoutNullStreams, err: Error) {
+  // Um worker já substituído (ex.: morto pelo timeout) não mexe no job do atual
+  if (slot.child !== child) return;
+  slot.child = null;
+  // Só o job em andamento morreu com o processo; a fila segue nos workers
+  finishJob(slot)?.reject(err);
+  pump();
+}
+
+function spawnWorker(slot: WorkerSlot): ChildProcessWithoutNullStreams {
+  const child = spawn('python3', [SCRIPT_PATH, '--worker']);
+  let stderr = '';
+  // Pedaços do stdout ainda sem '\n' (a linha em andamento). Guardados como
+  // Buffer e decodificados só com a linha completa: um caractere UTF-8 pode
+  // vir partido entre dois 'data', e concatenar strings a cada pedaço é
+  // quadrático para respostas grandes.
+  let partialChunks: Buffer[] = [];
+
+  child.stdout.on('data', (data: Buffer) => {
+    let start = 0;
+    let newline = data.indexOf(0x0a);
+    while (newline !== -1) {
+      partialChunks.push(data.subarray(start, newline));
+      handleLine(slot, child, Buffer.concat(partialChunks).toString('utf8'));
+      partialChunks = [];
+      start = newline + 1;
+      newline = data.indexOf(0x0a, start);
+    }
+    if (start < data.length) partialChunks.push(data.subarray(start));
+  });
+
+  child.stderr.on('data', (data) => {
+    // Guarda só o final do stderr para a mensagem de erro
+    stderr = (stderr + data.toString()).slice(-4000);
+  });
+
+  // EPIPE ao escrever num worker que acabou de morrer: o 'close' trata
+  child.stdin.on('error', () => {});
+
+  child.on('close', (code) => {
+    workerExited(slot, child, new Error(`Python worker encerrou (código ${code}): ${stderr}`));
+  });
+
+  child.on('error', (err) => {
+    workerExited(slot, child, err);
+  });
+
+  slot.child = child;
+  return child;
+}
+
+function pump() {
+  for (const slot of slots) {
+    if (queue.length === 0) return;
+    if (slot.job) continue;
+
+    const job = queue.shift()!;
+    const child = slot.child ?? spawnWorker(slot);
+    slot.job = job;
+    slot.timer = setTimeout(() => {
+      if (slot.job !== job) return;
+      finishJob(slot);
+      job.reject(new Error(`Extração excedeu ${JOB_TIMEOUT_MS}ms`));
+      // O job travado ocupa o worker: descarta este processo; o slot sobe outro
+      if (slot.child === child) slot.child = null;
+      child.kill();
+      pump();
+    }, JOB_TIMEOUT_MS);
+    child.stdin.write(job.request);
+  }
+}
+
+// ============ API ============
+
+export function extractWithWorker(
+  pdfPath: string,
+  priceKwh: number,
+  discount: number
+): Promise<any> {
+  return new Promise((resolve, reject) => {
+    const id = nextJobId++;
+    const request =
+      JSON.stringify({ id, pdfPath, priceKwh, discount, timings: EXTRACT_TIMINGS }) + '\n';
+    queue.push({ id, request, resolve, reject });
+    pump();
+  });
+}